@@ -3,8 +3,36 @@ from types import TracebackType
 from typing import Any, Callable, Tuple
 from socket import socket, AF_INET, SOCK_DGRAM as SOCK_UDP, timeout
 from cfg import BUF_SIZE
+from capture import Capture, INBOUND, OUTBOUND
 from threading import Event, Thread
 from contextlib import AbstractContextManager
+from time import time
+
+
+class BufferPool:
+    """
+    A fixed set of preallocated receive buffers that are handed out round robin.
+    A view into one of the buffers stays valid until `size` more datagrams have been received into the pool.
+    """
+    buffers: list[bytearray]
+    index: int
+
+    def __init__(self, size: int, buffer_size: int = BUF_SIZE) -> None:
+        """
+        @param size  The number of buffers.
+        @param buffer_size  The size of each buffer, in bytes.
+        """
+        assert size > 0
+        self.buffers = [bytearray(buffer_size) for _ in range(size)]
+        self.index = 0
+
+    def next(self) -> bytearray:
+        """
+        @return  The least recently used buffer.
+        """
+        buf = self.buffers[self.index]
+        self.index = (self.index + 1) % len(self.buffers)
+        return buf
 
 
 @dataclass
@@ -12,9 +40,13 @@ class JoinedUDPHandle(AbstractContextManager):
     """A handle for sending and receiving UDP packets."""
     sock: socket
     dst: Tuple[str, int]
-    recv: Callable[[bytes], Any] | None = None
+    recv: Callable[[bytes | memoryview], Any] | None = None
     close_event: Event = field(default_factory=Event)
     listen_thread: Thread | None = field(default=None)
+    pool: BufferPool | None = field(default=None)
+    # Records every datagram sent and received, under the handle's own interface ID
+    capture: Capture | None = field(default=None)
+    capture_interface: int = field(default=0)
 
     def __enter__(self) -> "JoinedUDPHandle":
         self.listen_thread = Thread(target=lambda: self.listen())
@@ -43,18 +75,30 @@ class JoinedUDPHandle(AbstractContextManager):
                 # Socket is no longer valid
                 break
 
-    def listen_once(self) -> bytes:
+    def listen_once(self) -> bytes | memoryview:
         """
         Listens for a single incoming UDP packet and returns the data.
         This method blocks until a packet is received or a timeout occurs.
+        With a buffer pool, the packet is received into a pooled buffer and a view of it is returned,
+        which is only valid until the pool cycles back to that buffer.
         """
-        return self.sock.recv(BUF_SIZE)
+        if self.pool is None:
+            data = self.sock.recv(BUF_SIZE)
+        else:
+            buf = self.pool.next()
+            size = self.sock.recv_into(buf)
+            data = memoryview(buf)[:size]
+        if self.capture is not None:
+            self.capture.record(self.capture_interface, time(), data, INBOUND)
+        return data
 
-    def send(self, payload: bytes):
+    def send(self, payload: bytes | bytearray | memoryview):
         """
         Sends a UDP packet to the destination.
         @param payload  The data to send.
         """
+        if self.capture is not None:
+            self.capture.record(self.capture_interface, time(), payload, OUTBOUND)
         self.sock.sendto(payload, self.dst)
 
     def close(self):
@@ -72,17 +116,26 @@ class UDPDuplex:
     port: int
     dst: str
     dst_port: int
+    # Records the datagrams of every handle created from now on
+    capture: Capture | None = field(default=None)
 
-    def create_handle(self, recv: Callable[[bytes], Any] | None = None) -> JoinedUDPHandle:
+    def create_handle(self, recv: Callable[[bytes | memoryview], Any] | None = None, pool: BufferPool | None = None) -> JoinedUDPHandle:
         """
         Creates a JoinedUDPHandle for sending and receiving packets.
         @param recv  An optional callback function to handle received packets.
+        @param pool  Optional receive buffers to receive into instead of allocating a new buffer per packet.
+                     Only use this if received packets are consumed before the pool cycles.
         @return  A JoinedUDPHandle instance.
         """
         handle = JoinedUDPHandle(socket(
-            AF_INET, SOCK_UDP), (self.dst, self.dst_port), recv)
+            AF_INET, SOCK_UDP), (self.dst, self.dst_port), recv, pool=pool)
 
         handle.sock.settimeout(1.0)
         handle.sock.bind((self.host, self.port))
+        if self.capture is not None:
+            handle.capture = self.capture
+            handle.capture_interface = self.capture.interface(
+                # The bound port, which the OS picks if port is 0
+                f"udp {self.host}:{handle.sock.getsockname()[1]} to {self.dst}:{self.dst_port}")
 
         return handle
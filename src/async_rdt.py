@@ -0,0 +1,411 @@
+from typing import Any, BinaryIO, Callable, Iterable, Tuple
+import asyncio
+import time
+from rdt import GoBackNClient, GoBackNSender, GoBackNReceiver, SendTimes
+from codec import decode_options
+from segments import Buffer
+
+
+class RDTDatagramProtocol(asyncio.DatagramProtocol):
+    """Datagram protocol that hands every received datagram to a callback."""
+    on_datagram: Callable[[bytes], Any] | None
+    transport: asyncio.DatagramTransport | None
+
+    def __init__(self) -> None:
+        self.on_datagram = None
+        self.transport = None
+
+    def connection_made(self, transport: asyncio.BaseTransport):
+        self.transport = transport  # type: ignore
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]):
+        if self.on_datagram:
+            self.on_datagram(data)
+
+    def error_received(self, exc: Exception):
+        # ICMP errors (e.g. the peer isn't listening yet) are treated like loss
+        pass
+
+
+class DatagramGoBackNClient(GoBackNClient):
+    """
+    Go-Back-N client implementation over an asyncio datagram transport.
+    Sending never blocks, and received datagrams are pushed to the engine by the protocol instead of being polled.
+    """
+    transport: asyncio.DatagramTransport
+
+    def __init__(self, transport: asyncio.DatagramTransport) -> None:
+        """
+        @param transport  A datagram transport connected to the remote endpoint.
+        """
+        super().__init__(None)
+        self.transport = transport
+
+    def send(self, payload: Buffer):
+        # The transport copies anything it has to buffer, so reused packet buffers are safe to pass
+        self.transport.sendto(payload)
+
+    def recv(self, timeout: float | None = None) -> Buffer | None:
+        raise NotImplementedError("Datagrams are delivered through the protocol")
+
+    def close(self):
+        """
+        Closes the underlying transport.
+        """
+        self.transport.close()
+
+
+async def open_client(local: Tuple[str, int], remote: Tuple[str, int]) -> Tuple[DatagramGoBackNClient, RDTDatagramProtocol]:
+    """
+    Opens a datagram endpoint on the running event loop.
+    @param local  The address to bind to.
+    @param remote  The address of the remote endpoint.
+    @return  The client and the protocol whose on_datagram callback receives datagrams.
+    """
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(RDTDatagramProtocol, local_addr=local, remote_addr=remote)
+    return DatagramGoBackNClient(transport), protocol
+
+
+class AsyncGoBackNSender(GoBackNSender):
+    """
+    Go-Back-N sender driven by an asyncio event loop.
+    Uses a single retransmission timer for the window base and loop timers for pacing,
+    so many senders can share one thread. Like GoBackNSender.start, the work per ACK and per timeout is constant.
+    """
+    client: DatagramGoBackNClient
+    max_timeouts: int
+    # Resolved when everything has been acknowledged
+    done: asyncio.Future[None] | None
+    # Resolved with the receiver's options while a handshake is in progress
+    syn_reply: asyncio.Future[dict[str, Any]] | None
+    send_handle: asyncio.TimerHandle | None
+    rto_handle: asyncio.TimerHandle | None
+    # Send times for RTT samples, and which segments have been sent and resent
+    send_times: SendTimes
+    # Losses of segments up to this seq have already been reported to the congestion controller
+    recover_seq: int
+    # Duplicate ACKs of the window base so far
+    dup_acks: int
+
+    def __init__(self, client: DatagramGoBackNClient, protocol: RDTDatagramProtocol, n: int, max_timeouts: int = 10, **kwargs: Any) -> None:
+        """
+        @param client  The datagram client to send with.
+        @param protocol  The protocol that receives datagrams for the client.
+        @param n  The maximum window size.
+        @param max_timeouts  How many consecutive timeouts to tolerate before giving up.
+        @param kwargs  Any other GoBackNSender options.
+        """
+        super().__init__(client, n, **kwargs)
+        assert self.fec is None, "The event loop engine doesn't support forward error correction"
+        assert self.delta_id is None, "The event loop engine doesn't fetch signatures for delta transfers"
+        protocol.on_datagram = self.datagram_received
+        self.max_timeouts = max_timeouts
+        self.done = None
+        self.syn_reply = None
+        self.send_handle = None
+        self.rto_handle = None
+        self.send_times = SendTimes(self.n + 1, self.curr_seq)
+        self.recover_seq = self.curr_seq - 1
+        self.dup_acks = 0
+
+    async def send_stream(self, data: Buffer | BinaryIO | Iterable[Buffer] | None = None):
+        """
+        Sends data followed by an end-of-stream marker and waits until the receiver has acknowledged all of it.
+        @param data  Data to push before sending, if any. See GoBackNSender.push.
+        @throws TimeoutError  If the receiver stops responding.
+        """
+        if data is not None:
+            self.push(data)
+        self.push(bytes(0))
+
+        loop = asyncio.get_running_loop()
+        if self.negotiate:
+            await self.handshake_async()
+
+        self.done = loop.create_future()
+        self.seq_max = self.window_end()
+        self.next_seq = self.curr_seq
+        if self.seq_max >= self.curr_seq:
+            self.schedule_send(0)
+        try:
+            await self.done
+        finally:
+            for handle in (self.send_handle, self.rto_handle):
+                if handle is not None:
+                    handle.cancel()
+
+    async def handshake_async(self, attempts: int = 10) -> bool:
+        """
+        Negotiates connection options with the receiver. See GoBackNSender.handshake.
+        @param attempts  How many times to send the SYN before giving up.
+        @return  True if the receiver replied.
+        """
+        loop = asyncio.get_running_loop()
+        syn = self.create_syn_packet()
+        for attempt in range(attempts):
+            self.syn_reply = loop.create_future()
+            sent_at = time.time()
+            self.client.send(syn)
+            try:
+                options = await asyncio.wait_for(self.syn_reply, self.rtt.rto)
+            except asyncio.TimeoutError:
+                self.rtt.backoff()
+                continue
+            finally:
+                self.syn_reply = None
+            if attempt == 0:
+                self.rtt.sample(time.time() - sent_at)
+            self.apply_options(options)
+            return True
+        return False
+
+    def schedule_send(self, delay: float):
+        if self.send_handle is None and max(self.next_seq, self.curr_seq) <= self.seq_max:
+            self.send_handle = asyncio.get_running_loop().call_later(delay, self.send_next)
+
+    def arm_timer(self):
+        if self.rto_handle is not None:
+            self.rto_handle.cancel()
+            self.rto_handle = None
+        if self.curr_seq <= self.send_times.highest_sent:
+            self.rto_handle = asyncio.get_running_loop().call_later(self.rtt.rto, self.timeout)
+
+    def send_next(self):
+        self.send_handle = None
+        # ACKs may have overtaken the send cursor
+        seq_n = max(self.next_seq, self.curr_seq)
+        if seq_n > self.seq_max:
+            return
+        payload = self.buf[seq_n]
+        self.client.send(self.create_packet(payload, seq_n))
+        retransmit = self.send_times.sent(seq_n, time.time())
+        self.observer.segment_sent(seq_n, len(payload), retransmit)
+        if self.rto_handle is None:
+            self.arm_timer()
+
+        self.next_seq = seq_n + 1
+        self.schedule_send(self.pacing_delay(payload))
+
+    def report_loss(self, timeout: bool):
+        # Timeouts always count, other signals only once per window
+        if timeout or self.curr_seq > self.recover_seq:
+            self.recover_seq = self.next_seq - 1
+            self.cc.on_loss(timeout)
+            self.seq_max = self.window_end()
+
+    def go_back(self):
+        if self.send_handle is not None:
+            self.send_handle.cancel()
+            self.send_handle = None
+        # Restarted when the window base is resent
+        if self.rto_handle is not None:
+            self.rto_handle.cancel()
+            self.rto_handle = None
+        self.next_seq = self.curr_seq
+        self.schedule_send(0)
+
+    def timeout(self):
+        self.rto_handle = None
+        if self.done is None or self.done.done():
+            return
+        if self.rtt.backoffs >= self.max_timeouts:
+            self.done.set_exception(TimeoutError(
+                f"No ACK for seq={self.curr_seq} after {self.rtt.backoffs} timeouts"))
+            return
+        self.rtt.backoff()
+        self.observer.timeout(self.curr_seq)
+        self.report_loss(True)
+        self.go_back()
+
+    def datagram_received(self, pkt: Buffer):
+        if self.syn_reply is not None and not self.syn_reply.done():
+            self.syn_received(pkt)
+            return
+        if self.done is None or self.done.done():
+            return
+
+        res = self.decode_ack_packet(pkt)
+        if res is None:
+            self.observer.checksum_failure()
+            return
+        ack_seq = res[0]
+        if ack_seq < self.curr_seq or ack_seq > self.send_times.highest_sent:
+            self.observer.dup_ack(ack_seq)
+        if ack_seq > self.send_times.highest_sent:
+            return
+        if ack_seq < self.curr_seq:
+            # Only repeats of the last ACK signal a loss, older ACKs were merely overtaken
+            if ack_seq == self.curr_seq - 1:
+                self.dup_acks += 1
+                if self.curr_seq <= self.seq_max and self.fast_retransmit_due(self.dup_acks):
+                    self.report_loss(False)
+                    self.go_back()
+            return
+
+        sample = self.send_times.rtt(ack_seq, time.time())
+        if sample is not None:
+            self.rtt.sample(sample)
+            self.observer.rtt_sample(sample)
+        acked_bytes = self.buf.span(self.curr_seq, ack_seq)
+
+        delta_seq = ack_seq - self.curr_seq + 1
+        self.observer.ack_received(ack_seq, delta_seq, acked_bytes)
+        self.curr_seq += delta_seq
+        self.dup_acks = 0
+        self.cc.on_ack(delta_seq, sample)
+        self.buf.release(self.curr_seq)
+        self.seq_max = self.window_end()
+        self.arm_timer()
+
+        self.buf.fill(self.curr_seq)
+        if self.buf.done(self.curr_seq):
+            self.done.set_result(None)
+            return
+        self.schedule_send(0)
+
+    def update_peer_window(self, ack_seq: int, window: int | None) -> bool:
+        # Without zero window probes a closed window would stall the sender for good, so the receiver's window is ignored
+        return False
+
+    def syn_received(self, pkt: Buffer):
+        assert self.syn_reply is not None
+        syn_seq = self.curr_seq - 1
+        ack = self.decode_ack_packet(pkt)
+        if ack is not None and ack[0] == syn_seq:
+            # The receiver doesn't negotiate
+            self.syn_reply.set_result(dict())
+            return
+        res = self.decode_data_packet(pkt)
+        if res is None or res[0] != syn_seq:
+            return
+        options = decode_options(res[1])
+        if options is not None:
+            self.syn_reply.set_result(options)
+
+    def close(self):
+        """
+        Closes the sender's transport.
+        """
+        self.client.close()
+
+
+class AsyncGoBackNReceiver(GoBackNReceiver):
+    """
+    Go-Back-N receiver driven by an asyncio event loop.
+    Iterate over it with `async for` to get the received data in order, until the sender's end-of-stream marker.
+    After the end of the stream, the receiver keeps re-ACKing retransmissions until the link has been idle for `linger` seconds.
+    """
+    client: DatagramGoBackNClient
+    linger: float
+    # Delivered data in order, with None marking the end of the stream
+    chunks: asyncio.Queue[Buffer | None]
+    finished: bool
+    linger_handle: asyncio.TimerHandle | None
+    ack_handle: asyncio.TimerHandle | None
+
+    def __init__(self, client: DatagramGoBackNClient, protocol: RDTDatagramProtocol, linger: float = 3, **kwargs: Any) -> None:
+        """
+        @param client  The datagram client to ACK with.
+        @param protocol  The protocol that receives datagrams for the client.
+        @param linger  How long to keep answering retransmissions after the end of the stream, in seconds.
+        @param kwargs  Any other GoBackNReceiver options.
+        """
+        super().__init__(client, **kwargs)
+        assert self.delta is None, "The event loop engine doesn't rebuild files from deltas"
+        protocol.on_datagram = self.datagram_received
+        self.linger = linger
+        self.chunks = asyncio.Queue()
+        self.finished = False
+        self.linger_handle = None
+        self.ack_handle = None
+
+    def accept_options(self, options: dict[str, Any]) -> dict[str, Any]:
+        reply = super().accept_options(options)
+        # Data is delivered as it arrives, without parity repairs, decompression or a delivery buffer
+        for option in ("fec", "compress", "window"):
+            reply.pop(option, None)
+        return reply
+
+    def datagram_received(self, pkt: Buffer):
+        if self.finished:
+            self.restart_linger()
+        self.flush_ack()
+
+        res = self.decode_packet(pkt)
+        if res is None:
+            self.observer.checksum_failure()
+            return
+        seq, data = res
+        if self.handle_syn(seq, data):
+            return
+
+        self.observer.segment_received(seq, len(data), seq == self.curr_seq)
+        if seq == self.curr_seq and not self.finished:
+            self.delivered = True
+            self.observer.segment_delivered(seq, len(data))
+            self.curr_seq += 1
+            if len(data) == 0:
+                self.finished = True
+                self.send_ack()
+                self.chunks.put_nowait(None)
+                self.restart_linger()
+            else:
+                self.queue_ack()
+                self.chunks.put_nowait(data)
+        else:
+            self.send_ack()
+
+    def queue_ack(self):
+        super().queue_ack()
+        if self.ack_deadline is not None and self.ack_handle is None:
+            self.ack_handle = asyncio.get_running_loop().call_later(
+                self.ack_delay, self.send_ack)
+
+    def send_ack(self):
+        super().send_ack()
+        if self.ack_handle is not None:
+            self.ack_handle.cancel()
+            self.ack_handle = None
+
+    def restart_linger(self):
+        if self.linger_handle is not None:
+            self.linger_handle.cancel()
+        self.linger_handle = asyncio.get_running_loop().call_later(
+            self.linger, self.client.close)
+
+    def __aiter__(self) -> "AsyncGoBackNReceiver":
+        return self
+
+    async def __anext__(self) -> Buffer:
+        chunk = await self.chunks.get()
+        if chunk is None:
+            # Keep ending the iteration if iterated again
+            self.chunks.put_nowait(None)
+            raise StopAsyncIteration
+        return chunk
+
+
+async def open_sender(local: Tuple[str, int], remote: Tuple[str, int], n: int, **kwargs: Any) -> AsyncGoBackNSender:
+    """
+    Creates an asyncio Go-Back-N sender on the running event loop.
+    @param local  The address to bind to.
+    @param remote  The receiver's address.
+    @param n  The maximum window size.
+    @param kwargs  Any other AsyncGoBackNSender options.
+    @return  The sender.
+    """
+    client, protocol = await open_client(local, remote)
+    return AsyncGoBackNSender(client, protocol, n, **kwargs)
+
+
+async def open_receiver(local: Tuple[str, int], remote: Tuple[str, int], **kwargs: Any) -> AsyncGoBackNReceiver:
+    """
+    Creates an asyncio Go-Back-N receiver on the running event loop.
+    @param local  The address to bind to.
+    @param remote  The sender's address.
+    @param kwargs  Any other AsyncGoBackNReceiver options.
+    @return  The receiver.
+    """
+    client, protocol = await open_client(local, remote)
+    return AsyncGoBackNReceiver(client, protocol, **kwargs)
@@ -0,0 +1,234 @@
+from typing import Any, Iterable, Iterator, TextIO
+from dataclasses import dataclass, asdict, replace
+from rdt import GoBackNClient, GoBackNReceiver, GoBackNSender, SelectiveRepeatReceiver, SelectiveRepeatSender, UDPDuplexGoBackNClient, DEFAULT_MSS
+from congestion import CongestionControl, FixedRateControl, RenoControl, DelayControl
+from metrics import Metrics
+from router import Router
+from sim import SimulatedNetwork
+from tunnel import UnstableTunnel
+from UDPDuplex import UDPDuplex
+from random import Random
+from threading import Thread, Event
+import csv
+import itertools
+import json
+import time
+
+
+@dataclass
+class BenchConfig:
+    """One point of a benchmark sweep."""
+    protocol: str = "gbn"
+    window_size: int = 8
+    cc: str = "reno"
+    # Rate in bits per second for fixed rate pacing
+    rate: float = 10**7
+    mss: int = DEFAULT_MSS
+    # Bytes transferred
+    size: int = 1 << 20
+    drop: float = 0
+    corrupt: float = 0
+    # One way propagation delay, and how much more it can randomly be, in seconds
+    delay: float = 0
+    jitter: float = 0
+    # Link rate in bits per second in each direction, or None for no limit
+    bandwidth: float | None = None
+    # In-order segments covered by each of the Go-Back-N receiver's ACKs
+    ack_every: int = 1
+    # Duplicate ACKs that trigger a fast retransmit
+    dup_ack_threshold: int = 3
+    # Segments per parity segment for forward error correction, or 0 for none
+    fec: int = 0
+    seed: int = 0
+
+
+def sweep(base: BenchConfig, axes: dict[str, Iterable[Any]]) -> Iterator[BenchConfig]:
+    """
+    Generates every combination of the given values.
+    @param base  The configuration whose other fields are kept.
+    @param axes  The values to try for each field that is varied, by field name.
+    @return  The configurations, varying the last axis fastest.
+    """
+    names = list(axes)
+    for values in itertools.product(*(axes[name] for name in names)):
+        yield replace(base, **dict(zip(names, values)))
+
+
+def create_router(config: BenchConfig) -> Router:
+    """
+    @param config  The benchmark configuration.
+    @return  A router that impairs packets as configured.
+    """
+    router = Router(config.seed)
+    router.drop_chance = config.drop
+    router.corrupt_chance = config.corrupt
+    router.min_delay = config.delay
+    router.max_delay = config.delay + config.jitter
+    router.bandwidth = config.bandwidth
+    return router
+
+
+def create_cc(config: BenchConfig) -> CongestionControl:
+    if config.cc == "fixed":
+        return FixedRateControl(config.rate)
+    if config.cc == "delay":
+        return DelayControl()
+    return RenoControl()
+
+
+def create_endpoints(config: BenchConfig, sender_client: GoBackNClient, receiver_client: GoBackNClient, metrics: Metrics) -> tuple[GoBackNSender, GoBackNReceiver]:
+    """
+    @param config  The benchmark configuration.
+    @param sender_client  The client the sender sends from.
+    @param receiver_client  The client the receiver receives on.
+    @param metrics  Observes the sender.
+    @return  The sender and the receiver.
+    """
+    if config.protocol == "sr":
+        return (SelectiveRepeatSender(sender_client, config.window_size, cc=create_cc(config),
+                                      mss=config.mss, negotiate=True, observer=metrics,
+                                      fec=config.fec or None),
+                SelectiveRepeatReceiver(receiver_client, config.window_size))
+    return (GoBackNSender(sender_client, config.window_size, cc=create_cc(config),
+                          mss=config.mss, negotiate=True, observer=metrics,
+                          dup_ack_threshold=config.dup_ack_threshold, fec=config.fec or None),
+            GoBackNReceiver(receiver_client, ack_every=config.ack_every))
+
+
+class Collector:
+    """Collects the received data."""
+    received: bytearray
+
+    def __init__(self) -> None:
+        self.received = bytearray()
+
+    def deliver(self, block: bytes) -> bool:
+        if len(block) == 0:
+            # Indicating end-of-stream
+            return False
+        self.received.extend(block)
+        return True
+
+
+def result(config: BenchConfig, transport: str, data: bytes, collector: Collector, metrics: Metrics, elapsed: float, cpu: float) -> dict[str, Any]:
+    """
+    @return  A flat row with the configuration and the measured results.
+    """
+    counters = metrics.counters
+    return {
+        "transport": transport,
+        **asdict(config),
+        "intact": bytes(collector.received) == data,
+        "completion_time": elapsed,
+        "goodput_bps": len(data) * 8 / elapsed if elapsed > 0 else None,
+        "segments_sent": counters["segments_sent"],
+        "retransmits": counters["retransmits"],
+        "retransmit_ratio": counters["retransmits"] / counters["segments_sent"] if counters["segments_sent"] else 0,
+        "acks": counters["acks_received"],
+        "timeouts": counters["timeouts"],
+        "parity_sent": counters["parity_sent"],
+        "cpu_per_mb": cpu / (len(data) / 1e6) if data else None,
+    }
+
+
+def run_simulated(config: BenchConfig) -> dict[str, Any]:
+    """
+    Runs a transfer in memory on a simulated clock.
+    The completion time is simulated, so it doesn't depend on how busy the machine is, and the CPU time is real.
+    @param config  The benchmark configuration.
+    @return  The result row.
+    """
+    data = Random(config.seed).randbytes(config.size)
+    network = SimulatedNetwork(create_router(config))
+    sender_client, receiver_client = network.connect(1)
+    metrics = Metrics()
+    sender, receiver = create_endpoints(
+        config, sender_client, receiver_client, metrics)
+    collector = Collector()
+    receiver_client.serve(receiver, collector.deliver)
+
+    cpu_start = time.process_time()
+    sender.push(data)
+    sender.push(bytes(0))
+    sender.start()
+    cpu = time.process_time() - cpu_start
+    return result(config, "sim", data, collector, metrics, network.time(), cpu)
+
+
+def run_udp(config: BenchConfig, base_port: int = 4400) -> dict[str, Any]:
+    """
+    Runs a transfer over loopback UDP through an UnstableTunnel, in real time.
+    The CPU time is that of the whole process, so it includes the receiver and the tunnel.
+    @param config  The benchmark configuration.
+    @param base_port  The first of the four consecutive local ports to use.
+    @return  The result row.
+    """
+    data = Random(config.seed).randbytes(config.size)
+    tunnel = UnstableTunnel(create_router(config), idle_timeout=0.05)
+    tunnel_thread = Thread(target=tunnel.start, args=(
+        UDPDuplex("localhost", base_port, "localhost", base_port + 1),
+        UDPDuplex("localhost", base_port + 2, "localhost", base_port + 3)))
+    tunnel_thread.start()
+
+    sender_client = UDPDuplexGoBackNClient(
+        UDPDuplex("localhost", base_port + 1, "localhost", base_port), 0.1)
+    receiver_client = UDPDuplexGoBackNClient(
+        UDPDuplex("localhost", base_port + 3, "localhost", base_port + 2), 0.1)
+    metrics = Metrics()
+    sender, receiver = create_endpoints(
+        config, sender_client, receiver_client, metrics)
+    collector = Collector()
+    done = Event()
+
+    def receive():
+        # Keeps ACKing until the sender is done, so it learns that its final segments arrived
+        while not done.is_set():
+            pkt = receiver_client.recv(receiver.ack_wait())
+            if pkt is not None:
+                receiver.handle_packet(pkt, collector.deliver)
+            else:
+                receiver.flush_ack()
+
+    receiver_thread = Thread(target=receive)
+    receiver_thread.start()
+    try:
+        # Give the tunnel a moment to bind before the first SYN
+        time.sleep(0.1)
+        start = time.time()
+        cpu_start = time.process_time()
+        sender.push(data)
+        sender.push(bytes(0))
+        sender.start()
+        elapsed = time.time() - start
+        cpu = time.process_time() - cpu_start
+    finally:
+        done.set()
+        receiver_thread.join()
+        tunnel.stop()
+        tunnel_thread.join()
+        sender_client.handle.close()
+        receiver_client.handle.close()
+    return result(config, "udp", data, collector, metrics, elapsed, cpu)
+
+
+def write_json(rows: list[dict[str, Any]], file: TextIO):
+    """
+    Writes result rows as a JSON array.
+    @param rows  The result rows.
+    @param file  The file to write to.
+    """
+    json.dump(rows, file, indent=2)
+    file.write("\n")
+
+
+def write_csv(rows: list[dict[str, Any]], file: TextIO):
+    """
+    Writes result rows as CSV with a header row.
+    @param rows  The result rows, which all have the same keys.
+    @param file  The file to write to.
+    """
+    if not rows:
+        return
+    writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
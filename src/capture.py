@@ -0,0 +1,329 @@
+from types import TracebackType
+from typing import BinaryIO, Iterator
+from collections import deque
+from contextlib import AbstractContextManager
+from threading import Event, Lock, Thread
+from codec import ACK_PACKET, ACK_WINDOW_PACKET, DATA_HEADER, HEADER_SIZE, PARITY_FLAG, decode_ack_packet, decode_data_packet, decode_options, decode_parity_packet
+from segments import Buffer
+import struct
+
+# Directions of a recorded datagram, as in the pcapng epb_flags option
+INBOUND = 1
+OUTBOUND = 2
+
+# Captured datagrams are UDP payloads without IP or UDP headers, which pcap has a range of link types for private use.
+# Wireshark shows them as raw data unless DLT_USER 0 is mapped to a dissector, so decode_capture.py decodes them instead.
+LINKTYPE_USER0 = 147
+
+# pcapng block types
+SECTION_HEADER = 0x0A0D0D0A
+INTERFACE_DESCRIPTION = 1
+INTERFACE_STATISTICS = 5
+ENHANCED_PACKET = 6
+BYTE_ORDER_MAGIC = 0x1A2B3C4D
+
+# pcapng option codes
+OPT_END = 0
+OPT_COMMENT = 1
+OPT_IF_NAME = 2
+OPT_EPB_FLAGS = 2
+OPT_ISB_IFDROP = 5
+
+BLOCK_HEADER = struct.Struct("<II")
+BLOCK_TRAILER = struct.Struct("<I")
+OPTION_HEADER = struct.Struct("<HH")
+# <byte order magic><major version><minor version><section length, -1 if not known>
+SECTION_BODY = struct.Struct("<IHHq")
+# <link type><reserved><snap length, 0 for no limit>
+INTERFACE_BODY = struct.Struct("<HHI")
+# <interface ID><timestamp high><timestamp low><captured length><original length>
+PACKET_BODY = struct.Struct("<IIIII")
+# <interface ID><timestamp high><timestamp low>
+STATISTICS_BODY = struct.Struct("<III")
+
+
+def pad4(size: int) -> int:
+    """
+    @param size  A size in bytes.
+    @return  The size rounded up to a multiple of 4, which every pcapng field is padded to.
+    """
+    return (size + 3) & ~3
+
+
+def encode_option(code: int, value: bytes) -> bytes:
+    """
+    @param code  The option code.
+    @param value  The option's value.
+    @return  The encoded option, padded to a multiple of 4 bytes.
+    """
+    return OPTION_HEADER.pack(code, len(value)) + value + bytes(pad4(len(value)) - len(value))
+
+
+def encode_block(block_type: int, body: bytes, options: list[bytes] | None = None) -> bytes:
+    """
+    @param block_type  The block type.
+    @param body  The block's fixed fields, padded to a multiple of 4 bytes.
+    @param options  The block's encoded options, if any.
+    @return  The encoded block.
+    """
+    if options:
+        body += b"".join(options) + OPTION_HEADER.pack(OPT_END, 0)
+    size = BLOCK_HEADER.size + len(body) + BLOCK_TRAILER.size
+    return BLOCK_HEADER.pack(block_type, size) + body + BLOCK_TRAILER.pack(size)
+
+
+def split_timestamp(timestamp: float) -> tuple[int, int]:
+    """
+    @param timestamp  A time in seconds.
+    @return  The time in microseconds, the default pcapng resolution, as its high and low 32 bits.
+    """
+    micros = int(timestamp * 1e6)
+    return micros >> 32, micros & 0xFFFFFFFF
+
+
+class Capture(AbstractContextManager):
+    """
+    Records datagrams into a pcapng file for offline analysis of a transfer, such as RTTs, retransmission bursts and queueing.
+    Recording a datagram only copies it into an in-memory ring of bounded size, and a background thread writes the ring out,
+    so capturing barely slows down the code that sends and receives. Datagrams recorded while the ring is full are lost,
+    which the file reports as drops in each interface's statistics.
+    Each capture point, such as a socket or a router port, is an interface of its own in the file.
+    """
+    file: BinaryIO
+    # Most datagrams waiting to be written
+    capacity: int
+    # Seconds between writes
+    flush_interval: float
+    # Datagrams waiting to be written, as (timestamp, interface ID, direction, datagram, annotation)
+    records: deque[tuple[float, int, int, bytes, str | None]]
+    # Interface names and the datagrams each has lost to a full ring, by interface ID
+    interfaces: list[str]
+    lost: list[int]
+    # How many interfaces have been described in the file so far, since they're described just before their first datagram
+    described: int
+    lock: Lock
+    stop_event: Event
+    thread: Thread | None
+
+    def __init__(self, file: BinaryIO, capacity: int = 1 << 16, flush_interval: float = 0.1) -> None:
+        """
+        @param file  The file to write to, opened in binary mode.
+        @param capacity  The most datagrams to hold while waiting to be written.
+        @param flush_interval  The time between writes, in seconds.
+        """
+        assert capacity > 0 and flush_interval > 0
+        self.file = file
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.records = deque()
+        self.interfaces = list()
+        self.lost = list()
+        self.described = 0
+        self.lock = Lock()
+        self.stop_event = Event()
+        self.thread = None
+        self.file.write(encode_block(SECTION_HEADER, SECTION_BODY.pack(BYTE_ORDER_MAGIC, 1, 0, -1)))
+
+    def __enter__(self) -> "Capture":
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, exc_value: BaseException | None, traceback: TracebackType | None) -> bool | None:
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+        else:
+            self.write()
+        self.write_statistics()
+        self.file.flush()
+        return False
+
+    def interface(self, name: str) -> int:
+        """
+        Adds a capture point, or finds the one that was already added under the same name.
+        @param name  The name that identifies it in the file, such as the addresses of a socket.
+        @return  The interface ID to record its datagrams under.
+        """
+        with self.lock:
+            if name in self.interfaces:
+                return self.interfaces.index(name)
+            self.interfaces.append(name)
+            self.lost.append(0)
+            return len(self.interfaces) - 1
+
+    def record(self, interface: int, timestamp: float, datagram: Buffer, direction: int, note: str | None = None):
+        """
+        Records a datagram. Can be called from any thread.
+        @param interface  The interface ID from interface().
+        @param timestamp  When the datagram was seen, in seconds.
+        @param datagram  The datagram, which is copied, so it may be a view into a buffer that gets reused.
+        @param direction  INBOUND or OUTBOUND.
+        @param note  An annotation for the datagram, such as what a router did to it, which is stored as a comment.
+        """
+        if len(self.records) >= self.capacity:
+            self.lost[interface] += 1
+            return
+        self.records.append((timestamp, interface, direction, bytes(datagram), note))
+
+    def run(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.write()
+        self.write()
+
+    def write(self):
+        """
+        Writes out every datagram recorded so far.
+        """
+        self.describe_interfaces()
+        while self.records:
+            timestamp, interface, direction, datagram, note = self.records.popleft()
+            if interface >= self.described:
+                # Added while writing
+                self.describe_interfaces()
+            options = [encode_option(OPT_EPB_FLAGS, struct.pack("<I", direction))]
+            if note is not None:
+                options.append(encode_option(OPT_COMMENT, note.encode()))
+            body = PACKET_BODY.pack(interface, *split_timestamp(timestamp), len(datagram), len(datagram)) + \
+                datagram + bytes(pad4(len(datagram)) - len(datagram))
+            self.file.write(encode_block(ENHANCED_PACKET, body, options))
+        self.file.flush()
+
+    def describe_interfaces(self):
+        """
+        Describes the interfaces that were added since the last write, which must happen before their datagrams are written.
+        """
+        with self.lock:
+            names = self.interfaces[self.described:]
+            self.described = len(self.interfaces)
+        for name in names:
+            self.file.write(encode_block(INTERFACE_DESCRIPTION, INTERFACE_BODY.pack(LINKTYPE_USER0, 0, 0),
+                                         [encode_option(OPT_IF_NAME, name.encode())]))
+
+    def write_statistics(self):
+        """
+        Writes how many datagrams each interface lost to a full ring.
+        """
+        self.describe_interfaces()
+        for interface, lost in enumerate(self.lost):
+            self.file.write(encode_block(INTERFACE_STATISTICS, STATISTICS_BODY.pack(interface, 0, 0),
+                                         [encode_option(OPT_ISB_IFDROP, struct.pack("<Q", lost))]))
+
+
+class CapturedDatagram:
+    """A datagram read back from a capture file."""
+    timestamp: float
+    # The name of the interface it was recorded on
+    interface: str
+    # INBOUND, OUTBOUND, or 0 if the file doesn't say
+    direction: int
+    data: bytes
+    note: str | None
+
+    def __init__(self, timestamp: float, interface: str, direction: int, data: bytes, note: str | None) -> None:
+        """
+        @param timestamp  When the datagram was recorded, in seconds.
+        @param interface  The name of the interface it was recorded on.
+        @param direction  INBOUND, OUTBOUND, or 0 if the file doesn't say.
+        @param data  The datagram.
+        @param note  The datagram's annotation, if any.
+        """
+        self.timestamp = timestamp
+        self.interface = interface
+        self.direction = direction
+        self.data = data
+        self.note = note
+
+
+def parse_options(data: bytes, endian: str) -> Iterator[tuple[int, bytes]]:
+    """
+    @param data  The options of a block.
+    @param endian  The struct byte order of the section.
+    @return  An iterator over (code, value) of each option.
+    """
+    pos = 0
+    while pos + OPTION_HEADER.size <= len(data):
+        code, size = struct.unpack_from(endian + "HH", data, pos)
+        if code == OPT_END:
+            return
+        pos += OPTION_HEADER.size
+        yield code, data[pos:pos+size]
+        pos += pad4(size)
+
+
+def read_capture(file: BinaryIO) -> Iterator[CapturedDatagram | tuple[str, int]]:
+    """
+    Reads a pcapng file, such as one written by Capture.
+    @param file  The file to read, opened in binary mode.
+    @return  An iterator over the datagrams in the file, and (interface name, datagrams lost) of each interface statistics block.
+    """
+    endian = "<"
+    # Names of the current section's interfaces, by ID
+    names: list[str] = list()
+    while header := file.read(BLOCK_HEADER.size):
+        if len(header) < BLOCK_HEADER.size:
+            raise ValueError("Truncated block")
+        block_type = struct.unpack_from("<I", header)[0]
+        if block_type == SECTION_HEADER:
+            magic = file.read(4)
+            endian = "<" if struct.unpack("<I", magic)[0] == BYTE_ORDER_MAGIC else ">"
+            size = struct.unpack_from(endian + "I", header, 4)[0]
+            # Nothing else in the section header matters here
+            file.read(size - BLOCK_HEADER.size - len(magic))
+            names = list()
+            continue
+        size = struct.unpack_from(endian + "I", header, 4)[0]
+        body = file.read(size - BLOCK_HEADER.size)
+        if len(body) != size - BLOCK_HEADER.size:
+            raise ValueError("Truncated block")
+        body = body[:-BLOCK_TRAILER.size]
+
+        if block_type == INTERFACE_DESCRIPTION:
+            options = dict(parse_options(body[INTERFACE_BODY.size:], endian))
+            names.append(options.get(OPT_IF_NAME, f"interface {len(names)}".encode()).decode(errors="replace"))
+        elif block_type == ENHANCED_PACKET:
+            interface, high, low, captured, _ = struct.unpack_from(endian + "IIIII", body)
+            data = body[PACKET_BODY.size:PACKET_BODY.size+captured]
+            options = dict(parse_options(body[PACKET_BODY.size+pad4(captured):], endian))
+            direction = struct.unpack(endian + "I", options[OPT_EPB_FLAGS])[0] & 3 if OPT_EPB_FLAGS in options else 0
+            note = options[OPT_COMMENT].decode(errors="replace") if OPT_COMMENT in options else None
+            yield CapturedDatagram(((high << 32) | low) / 1e6, names[interface], direction, data, note)
+        elif block_type == INTERFACE_STATISTICS:
+            interface = struct.unpack_from(endian + "I", body)[0]
+            options = dict(parse_options(body[STATISTICS_BODY.size:], endian))
+            if OPT_ISB_IFDROP in options:
+                yield names[interface], struct.unpack(endian + "Q", options[OPT_ISB_IFDROP])[0]
+
+
+def describe_datagram(datagram: Buffer) -> tuple[str, int | None, int | None, str]:
+    """
+    Decodes a datagram of the RDT protocols.
+    Handshakes are data packets just before the first segment whose payload is the options, so they're told apart by whether it decodes as options.
+    @param datagram  The datagram.
+    @return  (kind, connection ID, sequence number as sent on the wire, details), where kind is
+             "DATA", "SYN", "PARITY", "ACK", or "BAD" if the datagram is corrupt or not a packet at all.
+             The connection ID and sequence number of a corrupt packet are read as they are, and None if it's too short to have them.
+    """
+    if len(datagram) in (ACK_PACKET.size, ACK_WINDOW_PACKET.size):
+        ack = decode_ack_packet(datagram)
+        if ack is not None:
+            conn_id, seq, window = ack
+            return "ACK", conn_id, seq, "" if window is None else f"window={window}"
+    elif len(datagram) >= HEADER_SIZE and DATA_HEADER.unpack_from(datagram)[3] & PARITY_FLAG:
+        parity = decode_parity_packet(datagram)
+        if parity is not None:
+            conn_id, seq, count, _, data = parity
+            return "PARITY", conn_id, seq, f"covers={count} len={len(data)}"
+    else:
+        packet = decode_data_packet(datagram)
+        if packet is not None:
+            conn_id, seq, data = packet
+            options = decode_options(data) if data[:1] == b"{" else None
+            if options is not None:
+                return "SYN", conn_id, seq, " ".join(f"{name}={value}" for name, value in options.items())
+            return "DATA", conn_id, seq, f"len={len(data)}"
+
+    if len(datagram) < ACK_PACKET.size:
+        return "BAD", None, None, f"len={len(datagram)}"
+    _, conn_id, seq = ACK_PACKET.unpack_from(datagram)
+    return "BAD", conn_id, seq, f"len={len(datagram)}"
@@ -0,0 +1,242 @@
+from typing import Any
+from segments import Buffer
+import json
+import struct
+import zlib
+
+# Packet format: <checksum(4 bytes)><conn_id(4 bytes)><seq_num(4 bytes)><data_size(4 bytes)><data(data_size bytes)>
+DATA_HEADER = struct.Struct(">IIII")
+# ACK Packet format: <checksum(4 bytes)><conn_id(4 bytes)><seq_num(4 bytes)>
+ACK_PACKET = struct.Struct(">III")
+# ACK Packet format with an advertised receive window: <checksum(4 bytes)><conn_id(4 bytes)><seq_num(4 bytes)><window(2 bytes)>
+# The window is how many segments after seq_num the receiver has room for. Its size tells it apart from both other formats.
+ACK_WINDOW_PACKET = struct.Struct(">IIIH")
+CHECKSUM = struct.Struct(">I")
+# The connection ID directly follows the checksum in both packet formats
+CONN_ID = struct.Struct(">I")
+# Parity packets use the data packet header with this bit set in the size field, so receivers that don't expect them reject them as invalid
+PARITY_FLAG = 1 << 31
+# Parity payload format: <segment_count(4 bytes)><size_xor(4 bytes)><parity>
+PARITY_HEADER = struct.Struct(">II")
+
+# Size of the data packet header, in bytes
+HEADER_SIZE = DATA_HEADER.size
+# Largest window an ACK can advertise
+MAX_WINDOW = 2**16 - 1
+# Largest datagram payload over IPv4
+MAX_DATAGRAM = 65507
+
+
+def pack_data_packet(buf: bytearray | memoryview, seq_num: int, data: Buffer, conn_id: int = 0) -> memoryview:
+    """
+    Encodes a data packet into the start of an existing buffer.
+    @param buf  The buffer to encode into. Must have room for the header and the data.
+    @param seq_num  The sequence number for the packet, as sent on the wire.
+    @param data  The data payload for the packet.
+    @param conn_id  The ID of the connection the packet belongs to.
+    @return  A view of the encoded packet within buf.
+    """
+    assert seq_num < 2**32 and conn_id < 2**32
+    size = len(data)
+    view = memoryview(buf)
+    view[HEADER_SIZE:HEADER_SIZE+size] = data
+    DATA_HEADER.pack_into(view, 0, 0, conn_id, seq_num, size)
+    CHECKSUM.pack_into(view, 0, zlib.crc32(view[4:HEADER_SIZE+size]))
+    return view[:HEADER_SIZE+size]
+
+
+def pack_ack_packet(buf: bytearray | memoryview, seq_num: int, conn_id: int = 0, window: int | None = None) -> memoryview:
+    """
+    Encodes an ACK packet into the start of an existing buffer.
+    @param buf  The buffer to encode into. Must have room for the packet.
+    @param seq_num  The sequence number to acknowledge, as sent on the wire.
+    @param conn_id  The ID of the connection the packet belongs to.
+    @param window  The receive window to advertise, clamped to MAX_WINDOW, or None for the format without one.
+    @return  A view of the encoded packet within buf.
+    """
+    view = memoryview(buf)
+    if window is None:
+        ACK_PACKET.pack_into(view, 0, 0, conn_id, seq_num)
+        size = ACK_PACKET.size
+    else:
+        ACK_WINDOW_PACKET.pack_into(view, 0, 0, conn_id, seq_num, max(min(window, MAX_WINDOW), 0))
+        size = ACK_WINDOW_PACKET.size
+    CHECKSUM.pack_into(view, 0, zlib.crc32(view[4:size]))
+    return view[:size]
+
+
+def encode_data_packet(seq_num: int, data: Buffer, conn_id: int = 0) -> bytes:
+    """
+    Encodes a data packet into a new buffer.
+    @param seq_num  The sequence number for the packet, as sent on the wire.
+    @param data  The data payload for the packet.
+    @param conn_id  The ID of the connection the packet belongs to.
+    @return  The encoded packet.
+    """
+    buf = bytearray(HEADER_SIZE + len(data))
+    pack_data_packet(buf, seq_num, data, conn_id)
+    return bytes(buf)
+
+
+def encode_ack_packet(seq_num: int, conn_id: int = 0, window: int | None = None) -> bytes:
+    """
+    Encodes an ACK packet into a new buffer.
+    @param seq_num  The sequence number to acknowledge, as sent on the wire.
+    @param conn_id  The ID of the connection the packet belongs to.
+    @param window  The receive window to advertise, or None for the format without one.
+    @return  The ACK packet bytes.
+    """
+    buf = bytearray(ACK_WINDOW_PACKET.size)
+    return bytes(pack_ack_packet(buf, seq_num, conn_id, window))
+
+
+def encode_parity_packet(seq_num: int, count: int, size_xor: int, parity: Buffer, conn_id: int = 0) -> bytes:
+    """
+    Encodes a forward error correction parity packet into a new buffer.
+    @param seq_num  The sequence number of the first segment the parity covers, as sent on the wire.
+    @param count  The number of segments the parity covers.
+    @param size_xor  The XOR of the sizes of the covered segments.
+    @param parity  The XOR of the covered segments.
+    @param conn_id  The ID of the connection the packet belongs to.
+    @return  The encoded packet.
+    """
+    assert seq_num < 2**32 and conn_id < 2**32
+    size = PARITY_HEADER.size + len(parity)
+    buf = bytearray(HEADER_SIZE + size)
+    DATA_HEADER.pack_into(buf, 0, 0, conn_id, seq_num, size | PARITY_FLAG)
+    PARITY_HEADER.pack_into(buf, HEADER_SIZE, count, size_xor)
+    buf[HEADER_SIZE + PARITY_HEADER.size:] = parity
+    CHECKSUM.pack_into(buf, 0, zlib.crc32(memoryview(buf)[4:]))
+    return bytes(buf)
+
+
+def decode_data_packet(packet: Buffer) -> tuple[int, int, memoryview] | None:
+    """
+    Decodes a data packet without copying it.
+    @param packet  The received data packet.
+    @return  A tuple of (connection ID, sequence number, view of the data within packet), or None if the packet is invalid.
+    """
+    view = memoryview(packet)
+    if len(view) < HEADER_SIZE:
+        return None
+
+    recv_checksum, conn_id, seq_num, data_size = DATA_HEADER.unpack_from(view)
+    if len(view) != HEADER_SIZE + data_size:
+        return None
+
+    if recv_checksum != zlib.crc32(view[4:]):
+        return None
+
+    return conn_id, seq_num, view[HEADER_SIZE:]
+
+
+def decode_parity_packet(packet: Buffer) -> tuple[int, int, int, int, memoryview] | None:
+    """
+    Decodes a parity packet without copying it.
+    @param packet  The received parity packet.
+    @return  A tuple of (connection ID, sequence number of the first covered segment, segment count, XOR of the sizes, view of the parity within packet),
+             or None if the packet is invalid.
+    """
+    view = memoryview(packet)
+    if len(view) < HEADER_SIZE + PARITY_HEADER.size:
+        return None
+
+    recv_checksum, conn_id, seq_num, size = DATA_HEADER.unpack_from(view)
+    if not size & PARITY_FLAG or len(view) != HEADER_SIZE + (size & ~PARITY_FLAG):
+        return None
+
+    if recv_checksum != zlib.crc32(view[4:]):
+        return None
+
+    count, size_xor = PARITY_HEADER.unpack_from(view, HEADER_SIZE)
+    return conn_id, seq_num, count, size_xor, view[HEADER_SIZE + PARITY_HEADER.size:]
+
+
+def decode_ack_packet(packet: Buffer) -> tuple[int, int, int | None] | None:
+    """
+    Decodes an ACK packet and returns the acknowledged sequence number.
+    @param packet  The received ACK packet.
+    @return  A tuple of (connection ID, acknowledged sequence number, advertised window or None if the packet has none),
+             or None if the packet is invalid.
+    """
+    view = memoryview(packet)
+    if len(view) == ACK_PACKET.size:
+        recv_checksum, conn_id, seq_num = ACK_PACKET.unpack_from(view)
+        window = None
+    elif len(view) == ACK_WINDOW_PACKET.size:
+        recv_checksum, conn_id, seq_num, window = ACK_WINDOW_PACKET.unpack_from(view)
+    else:
+        return None
+
+    if recv_checksum != zlib.crc32(view[4:]):
+        return None
+
+    return conn_id, seq_num, window
+
+
+def peek_conn_id(packet: Buffer) -> int | None:
+    """
+    Reads the connection ID of a data or ACK packet without validating the rest of it.
+    @param packet  The received packet.
+    @return  The connection ID, or None if the packet is too short to have one.
+    """
+    if len(packet) < ACK_PACKET.size:
+        return None
+    return CONN_ID.unpack_from(packet, CHECKSUM.size)[0]
+
+
+class PacketEncoder:
+    """
+    Encodes packets into a single preallocated buffer, so sending a packet allocates nothing.
+    Each returned view is only valid until the next packet is encoded, so it must be sent (or copied) right away.
+    The buffer only has room for payloads of up to max_payload, so larger packets are encoded with encode_data_packet() instead.
+    """
+    buf: bytearray
+    conn_id: int
+
+    def __init__(self, max_payload: int, conn_id: int = 0) -> None:
+        """
+        @param max_payload  The largest data payload that will be encoded.
+        @param conn_id  The connection ID stamped on every packet.
+        """
+        self.buf = bytearray(HEADER_SIZE + max_payload)
+        self.conn_id = conn_id
+
+    def data(self, seq_num: int, data: Buffer) -> memoryview:
+        """
+        @param seq_num  The sequence number for the packet, as sent on the wire.
+        @param data  The data payload for the packet, at most max_payload.
+        @return  A view of the encoded data packet.
+        """
+        assert HEADER_SIZE + len(data) <= len(self.buf), f"A {len(data)} byte payload doesn't fit the encoder's {len(self.buf) - HEADER_SIZE} bytes"
+        return pack_data_packet(self.buf, seq_num, data, self.conn_id)
+
+    def ack(self, seq_num: int, window: int | None = None) -> memoryview:
+        """
+        @param seq_num  The sequence number to acknowledge, as sent on the wire.
+        @param window  The receive window to advertise, or None for the format without one.
+        @return  A view of the encoded ACK packet.
+        """
+        return pack_ack_packet(self.buf, seq_num, self.conn_id, window)
+
+
+def encode_options(options: dict[str, Any]) -> bytes:
+    """
+    Encodes connection options for a handshake packet.
+    @param options  The options to encode.
+    @return  The encoded options.
+    """
+    return json.dumps(options, separators=(",", ":")).encode()
+
+
+def decode_options(data: Buffer) -> dict[str, Any] | None:
+    """
+    Decodes connection options from a handshake packet.
+    @param data  The encoded options.
+    @return  The options, or None if they could not be decoded.
+    """
+    try:
+        options = json.loads(bytes(data))
+    except ValueError:
+        return None
+    return options if isinstance(options, dict) else None
@@ -0,0 +1,147 @@
+from typing import Callable, Iterable, Iterator
+from segments import Buffer
+import zlib
+
+# Segment headers. Any other value is the ID of a codec, with NEW_STREAM set on the first segment of each stream.
+RAW = 0
+NEW_STREAM = 0x80
+
+# How much data is compressed at a time, which is also the granularity of falling back to raw
+COMPRESS_CHUNK = 1 << 15
+
+
+class Codec:
+    """
+    A streaming compression format.
+    The sender compresses a chunk at a time, and the output of each chunk must be decodable on its own
+    given the chunks before it, so the receiver can decompress each segment as it's delivered.
+    """
+    # Identifies the codec in segment headers, from 1 to 127
+    id: int
+    # Identifies the codec in the handshake
+    name: str
+
+    def compressor(self, level: int) -> Callable[[Buffer], bytes]:
+        """
+        @param level  The compression level, whose meaning depends on the codec.
+        @return  A function that compresses the next chunk of a stream and flushes it.
+        """
+        raise NotImplementedError()
+
+    def decompressor(self) -> "zlib._Decompress":
+        """
+        @return  A decompressor for one stream, with the interface of zlib.decompressobj.
+        """
+        raise NotImplementedError()
+
+
+class ZlibCodec(Codec):
+    """Deflate, flushed to a byte boundary after every chunk."""
+    id = 1
+    name = "zlib"
+
+    def compressor(self, level: int) -> Callable[[Buffer], bytes]:
+        compressor = zlib.compressobj(level)
+        return lambda chunk: compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def decompressor(self) -> "zlib._Decompress":
+        return zlib.decompressobj()
+
+
+# Every supported codec, by name
+CODECS: dict[str, Codec] = {codec.name: codec for codec in [ZlibCodec()]}
+
+
+def frame(header: int, data: Buffer, mss: Callable[[], int]) -> Iterator[bytes]:
+    """
+    Splits data into segments that each start with a header byte.
+    @param header  The header of the first segment. Later segments continue the same stream, so NEW_STREAM is cleared.
+    @param data  The data to split.
+    @param mss  Returns the maximum segment size, including the header, at the time each segment is cut.
+    @return  An iterator over the segments.
+    """
+    view = memoryview(data).cast("B")
+    pos = 0
+    while pos < len(view):
+        size = mss() - 1
+        assert size > 0, "Segments must have room for data after the header"
+        yield bytes([header]) + view[pos:pos+size]
+        header &= ~NEW_STREAM
+        pos += size
+
+
+def compress_segments(chunks: Iterable[Buffer], mss: Callable[[], int], codec: Codec, level: int) -> Iterator[Buffer]:
+    """
+    Lazily compresses data into segments, holding only one chunk in memory.
+    Chunks that don't get smaller are sent raw instead, after which compression starts a new stream,
+    since the receiver's decompressor never saw the raw chunk.
+    Empty chunks are passed through as empty segments, so an empty segment can still mark the end of the data.
+    @param chunks  The data to compress, a chunk at a time. See COMPRESS_CHUNK.
+    @param mss  Returns the maximum segment size at the time each segment is cut.
+    @param codec  The codec to compress with.
+    @param level  The compression level.
+    @return  An iterator over the segments, which Decompressor turns back into the data.
+    """
+    compress = None
+    for chunk in chunks:
+        if len(chunk) == 0:
+            yield chunk
+            continue
+        header = codec.id
+        if compress is None:
+            compress = codec.compressor(level)
+            header |= NEW_STREAM
+        compressed = compress(chunk)
+        if len(compressed) < len(chunk):
+            yield from frame(header, compressed, mss)
+        else:
+            compress = None
+            yield from frame(RAW, chunk, mss)
+
+
+class Decompressor:
+    """
+    Decodes the segments from compress_segments as they're delivered in order, and passes the data on to another deliverer.
+    Data is passed on in pieces of at most max_output bytes, however well it was compressed.
+    """
+    inner: Callable[[Buffer], bool]
+    max_output: int
+    decompressor: "zlib._Decompress | None"
+
+    def __init__(self, inner: Callable[[Buffer], bool], max_output: int = COMPRESS_CHUNK) -> None:
+        """
+        @param inner  The deliverer that receives the decompressed data, and the empty segment that ends it.
+        @param max_output  The largest piece of data to pass on at once.
+        """
+        self.inner = inner
+        self.max_output = max_output
+        self.decompressor = None
+
+    def deliver(self, segment: Buffer) -> bool:
+        """
+        @param segment  The next segment.
+        @return  Whether to continue receiving, as decided by the inner deliverer.
+        """
+        if len(segment) == 0:
+            return self.inner(segment)
+        view = memoryview(segment).cast("B")
+        header = view[0]
+        if header == RAW:
+            return self.inner(view[1:])
+
+        if header & NEW_STREAM:
+            codec = next((codec for codec in CODECS.values()
+                         if codec.id == header & ~NEW_STREAM), None)
+            if codec is None:
+                raise ValueError(f"Unknown codec {header & ~NEW_STREAM}")
+            self.decompressor = codec.decompressor()
+        if self.decompressor is None:
+            raise ValueError("Compressed segment without the start of its stream")
+
+        data: Buffer = view[1:]
+        while len(data) > 0:
+            out = self.decompressor.decompress(data, self.max_output)
+            if len(out) > 0 and not self.inner(out):
+                return False
+            data = self.decompressor.unconsumed_tail
+        return True
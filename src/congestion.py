@@ -0,0 +1,147 @@
+from math import inf
+
+
+class CongestionControl:
+    """
+    Abstract congestion controller for a sender.
+    Windows are counted in segments, and sizes passed in are on-the-wire bytes.
+    """
+
+    def window(self) -> float:
+        """
+        @return  The congestion window, in segments. The sender uses the minimum of this and its own window size.
+        """
+        return inf
+
+    def pacing_delay(self, size: int, srtt: float | None) -> float:
+        """
+        Computes how long to wait after sending a packet before sending the next one.
+        @param size  The size of the packet that was sent, in bytes.
+        @param srtt  The sender's smoothed RTT estimate in seconds, or None if no RTT has been sampled yet.
+        @return  The delay in seconds.
+        """
+        return 0
+
+    def on_ack(self, acked: int, rtt: float | None):
+        """
+        Called when new segments are acknowledged.
+        @param acked  The number of newly acknowledged segments.
+        @param rtt  An RTT sample taken from this ACK in seconds, or None if the ACK could not be sampled.
+        """
+        pass
+
+    def on_loss(self, timeout: bool):
+        """
+        Called at most once per window of data when the sender detects a loss.
+        @param timeout  True if the loss was detected by a retransmission timeout, False if by ACKs.
+        """
+        pass
+
+
+class FixedRateControl(CongestionControl):
+    """Paces packets at a constant bit rate and ignores ACK and loss signals."""
+    rate: float
+
+    def __init__(self, rate: float = 500) -> None:
+        """
+        @param rate  The link rate to pace at, in bits per second.
+        """
+        assert rate > 0
+        self.rate = rate
+
+    def pacing_delay(self, size: int, srtt: float | None) -> float:
+        return size * 8 / self.rate
+
+
+class RenoControl(CongestionControl):
+    """
+    AIMD congestion control with TCP Reno style slow start and congestion avoidance.
+    Sends are paced so that a window is spread over one smoothed RTT.
+    """
+    cwnd: float
+    ssthresh: float
+    min_cwnd: float
+    # Pacing rate relative to cwnd/srtt in slow start and congestion avoidance
+    ss_pacing_gain: float = 2
+    ca_pacing_gain: float = 1.2
+
+    def __init__(self, initial_cwnd: float = 2, min_cwnd: float = 1) -> None:
+        """
+        @param initial_cwnd  The initial congestion window, in segments.
+        @param min_cwnd  The congestion window after a retransmission timeout, in segments.
+        """
+        assert 0 < min_cwnd <= initial_cwnd
+        self.cwnd = initial_cwnd
+        self.ssthresh = inf
+        self.min_cwnd = min_cwnd
+
+    def window(self) -> float:
+        return self.cwnd
+
+    def pacing_delay(self, size: int, srtt: float | None) -> float:
+        if srtt is None:
+            return 0
+        gain = self.ss_pacing_gain if self.cwnd < self.ssthresh else self.ca_pacing_gain
+        return srtt / (self.cwnd * gain)
+
+    def on_ack(self, acked: int, rtt: float | None):
+        if self.cwnd < self.ssthresh:
+            # Slow start: grow by one segment per acknowledged segment
+            self.cwnd += acked
+        else:
+            # Congestion avoidance: grow by roughly one segment per RTT
+            self.cwnd += acked / self.cwnd
+
+    def on_loss(self, timeout: bool):
+        self.ssthresh = max(self.cwnd / 2, 2)
+        self.cwnd = self.min_cwnd if timeout else self.ssthresh
+
+
+class DelayControl(RenoControl):
+    """
+    Delay-based congestion control in the style of TCP Vegas.
+    The window is adjusted by how many segments are estimated to be queued in the network,
+    which keeps queues short instead of filling them until packets are lost.
+    """
+    alpha: float
+    beta: float
+    base_rtt: float | None
+    last_rtt: float | None
+
+    def __init__(self, initial_cwnd: float = 2, min_cwnd: float = 1, alpha: float = 2, beta: float = 4) -> None:
+        """
+        @param initial_cwnd  The initial congestion window, in segments.
+        @param min_cwnd  The congestion window after a retransmission timeout, in segments.
+        @param alpha  Grow the window while fewer than this many segments are queued.
+        @param beta  Shrink the window while more than this many segments are queued.
+        """
+        super().__init__(initial_cwnd, min_cwnd)
+        assert 0 <= alpha <= beta
+        self.alpha = alpha
+        self.beta = beta
+        self.base_rtt = None
+        self.last_rtt = None
+
+    def on_ack(self, acked: int, rtt: float | None):
+        if rtt is None:
+            # ACKs that can't be sampled are judged by the most recent sample
+            rtt = self.last_rtt
+            if rtt is None:
+                super().on_ack(acked, rtt)
+                return
+        self.last_rtt = rtt
+        if self.base_rtt is None or rtt < self.base_rtt:
+            self.base_rtt = rtt
+
+        # Segments queued = (expected rate - actual rate) * base RTT
+        queued = self.cwnd * (1 - self.base_rtt / rtt) if rtt > 0 else 0
+        if self.cwnd < self.ssthresh:
+            if queued > self.alpha:
+                # Leave slow start as soon as queues start building
+                self.ssthresh = self.cwnd
+            else:
+                self.cwnd += acked
+        elif queued < self.alpha:
+            self.cwnd += acked / self.cwnd
+        elif queued > self.beta:
+            self.cwnd = max(self.cwnd - acked / self.cwnd, self.min_cwnd)
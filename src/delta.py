@@ -0,0 +1,480 @@
+from typing import BinaryIO, Callable, Iterable, Iterator
+from pathlib import Path
+from resume import FILE_ID, checkpoint_path, file_id
+from segments import Buffer
+from sink import WritePolicy
+import hashlib
+import io
+import math
+import mmap
+import os
+import struct
+import zlib
+
+# Signature of one block of the receiver's file: <rolling checksum(4 bytes)><strong hash(8 bytes)>
+SIGNATURE = struct.Struct(">I8s")
+# Header of a chunk of signatures, which is sent in reply to a request for them: <index of the first block(4 bytes)>
+SIGNATURE_CHUNK = struct.Struct(">I")
+# Delta instructions: copy <count(4 bytes)> blocks of the receiver's file starting at block <block(4 bytes)>,
+# or insert the <length(4 bytes)> bytes of literal data that follow
+COPY = struct.Struct(">cII")
+LITERAL = struct.Struct(">cI")
+COPY_OP = b"C"
+LITERAL_OP = b"L"
+# Largest literal instruction, so a long run of new data doesn't need to be held back until it ends
+MAX_LITERAL = 1 << 16
+# Most blocks that unmatched data is stepped over by at a time, without rolling through them (see DeltaEncoder.encode)
+MAX_SKIP = 16
+# Range of block sizes, which grow with the square root of the file's size like rsync's
+MIN_BLOCK = 1 << 10
+MAX_BLOCK = 1 << 17
+
+# The rolling checksum is Adler-32, so whole blocks are checksummed by zlib and only sliding the window is done here
+ADLER_MOD = 65521
+
+
+def block_size_for(size: int) -> int:
+    """
+    @param size  The size of a file, in bytes.
+    @return  The block size to split it into for signatures, balancing the size of the signatures against how finely changes are found.
+    """
+    return min(max(1 << math.isqrt(size).bit_length(), MIN_BLOCK), MAX_BLOCK)
+
+
+def strong_hash(block: Buffer) -> bytes:
+    """
+    @param block  A block of data.
+    @return  The hash that confirms a match of the rolling checksum.
+    """
+    return hashlib.blake2b(block, digest_size=SIGNATURE.size - 4).digest()
+
+
+def roll(checksum: int, out_byte: int, in_byte: int, size: int) -> int:
+    """
+    Slides the window of a rolling checksum forward by one byte.
+    @param checksum  The Adler-32 of the window.
+    @param out_byte  The first byte of the window, which leaves it.
+    @param in_byte  The byte after the window, which enters it.
+    @param size  The size of the window.
+    @return  The Adler-32 of the window one byte further on.
+    """
+    a = ((checksum & 0xFFFF) - out_byte + in_byte) % ADLER_MOD
+    b = ((checksum >> 16) - size * out_byte + a - 1) % ADLER_MOD
+    return (b << 16) | a
+
+
+class Signatures:
+    """The rolling checksums and strong hashes of the whole blocks of a file. A short block at the end of the file has none."""
+    block_size: int
+    weak: list[int]
+    strong: list[bytes]
+    # Block indices by rolling checksum, in ascending order
+    index: dict[int, list[int]]
+
+    def __init__(self, block_size: int, weak: list[int], strong: list[bytes]) -> None:
+        """
+        @param block_size  The size of each block, in bytes.
+        @param weak  The rolling checksum of each block.
+        @param strong  The strong hash of each block.
+        """
+        assert block_size > 0 and len(weak) == len(strong)
+        self.block_size = block_size
+        self.weak = weak
+        self.strong = strong
+        self.index = dict()
+        for block, checksum in enumerate(weak):
+            self.index.setdefault(checksum, []).append(block)
+
+    def __len__(self) -> int:
+        return len(self.weak)
+
+    def chunk(self, first: int, count: int) -> bytes:
+        """
+        @param first  The index of the first block.
+        @param count  The most signatures to include.
+        @return  The encoded signatures of the blocks from first on, after a SIGNATURE_CHUNK header.
+        """
+        blocks = range(first, min(first + count, len(self)))
+        return SIGNATURE_CHUNK.pack(first) + b"".join(SIGNATURE.pack(self.weak[block], self.strong[block]) for block in blocks)
+
+
+def compute_signatures(file: BinaryIO, block_size: int) -> Signatures:
+    """
+    @param file  The file, which is read from the start.
+    @param block_size  The size of each block.
+    @return  The signatures of the file's whole blocks.
+    """
+    file.seek(0)
+    weak: list[int] = list()
+    strong: list[bytes] = list()
+    while len(block := file.read(block_size)) == block_size:
+        weak.append(zlib.adler32(block))
+        strong.append(strong_hash(block))
+    return Signatures(block_size, weak, strong)
+
+
+def decode_signature_chunk(data: Buffer, blocks: int) -> tuple[int, list[tuple[int, bytes]]] | None:
+    """
+    @param data  A chunk of signatures from Signatures.chunk().
+    @param blocks  How many blocks the file has, to reject chunks that are out of range.
+    @return  (index of the first block, (rolling checksum, strong hash) of each block), or None if the chunk is invalid.
+    """
+    if len(data) < SIGNATURE_CHUNK.size or (len(data) - SIGNATURE_CHUNK.size) % SIGNATURE.size != 0:
+        return None
+    first = SIGNATURE_CHUNK.unpack_from(data)[0]
+    count = (len(data) - SIGNATURE_CHUNK.size) // SIGNATURE.size
+    if count == 0 or first + count > blocks:
+        return None
+    return first, list(SIGNATURE.iter_unpack(memoryview(data)[SIGNATURE_CHUNK.size:]))
+
+
+def as_buffer(data: Buffer | BinaryIO | Iterable[Buffer]) -> Buffer:
+    """
+    @param data  A buffer, a binary file object (read from its current position), or an iterable of buffers.
+    @return  The data as a single buffer. Regular files are memory-mapped rather than read.
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return data
+    if hasattr(data, "read"):
+        file: BinaryIO = data  # type: ignore
+        try:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            return memoryview(mapped)[file.tell():]
+        except (OSError, ValueError, io.UnsupportedOperation):
+            # Not mappable or empty
+            return file.read()
+    return b"".join(data)  # type: ignore
+
+
+class DeltaEncoder:
+    """
+    Turns data into instructions that rebuild it from the receiver's older version of it, given the signatures of that version's blocks.
+    Blocks of the data that the receiver already has are sent as copy instructions, wherever they are in its file, and everything else
+    as literal data.
+    """
+    signatures: Signatures
+    # A run of blocks to copy that may still grow, as (first block, count)
+    pending_copy: tuple[int, int] | None
+    # Bytes of data sent as literals and copied from the receiver's file so far
+    literal_bytes: int
+    copied_bytes: int
+
+    def __init__(self, signatures: Signatures) -> None:
+        """
+        @param signatures  The signatures of the receiver's file. Without any, all data is sent as literals.
+        """
+        self.signatures = signatures
+        self.pending_copy = None
+        self.literal_bytes = 0
+        self.copied_bytes = 0
+
+    def find(self, window: Buffer, checksum: int) -> int | None:
+        """
+        @param window  A block of the data.
+        @param checksum  Its rolling checksum.
+        @return  A block of the receiver's file with the same content, or None if there is none.
+                 The block after the pending run of copies is preferred, so the run can grow.
+        """
+        blocks = self.signatures.index.get(checksum)
+        if blocks is None:
+            return None
+        strong = strong_hash(window)
+        if self.pending_copy is not None:
+            following = self.pending_copy[0] + self.pending_copy[1]
+            if following < len(self.signatures) and self.signatures.weak[following] == checksum \
+                    and self.signatures.strong[following] == strong:
+                return following
+        for block in blocks:
+            if self.signatures.strong[block] == strong:
+                return block
+        return None
+
+    def copy(self, block: int) -> Iterator[bytes]:
+        """
+        Adds a block to the run of blocks to copy, sending the run so far if the block doesn't continue it.
+        @param block  The block to copy.
+        @return  An iterator over the instructions that are ready.
+        """
+        if self.pending_copy is not None and self.pending_copy[0] + self.pending_copy[1] == block:
+            self.pending_copy = (self.pending_copy[0], self.pending_copy[1] + 1)
+        else:
+            yield from self.flush_copy()
+            self.pending_copy = (block, 1)
+        self.copied_bytes += self.signatures.block_size
+
+    def flush_copy(self) -> Iterator[bytes]:
+        """
+        @return  An iterator over the copy instruction of the pending run of blocks, if any.
+        """
+        if self.pending_copy is not None:
+            yield COPY.pack(COPY_OP, *self.pending_copy)
+            self.pending_copy = None
+
+    def literal(self, data: Buffer) -> Iterator[Buffer]:
+        """
+        @param data  Data the receiver doesn't have.
+        @return  An iterator over the literal instructions and their data.
+        """
+        view = memoryview(data).cast("B")
+        if len(view) == 0:
+            return
+        yield from self.flush_copy()
+        for start in range(0, len(view), MAX_LITERAL):
+            piece = view[start:start+MAX_LITERAL]
+            yield LITERAL.pack(LITERAL_OP, len(piece))
+            yield piece
+        self.literal_bytes += len(view)
+
+    def encode(self, data: Buffer) -> Iterator[Buffer]:
+        """
+        Lazily encodes the next part of the data. Matches are only found within each part, so the data should be encoded in one go.
+        @param data  The data.
+        @return  An iterator over the encoded instructions, which are pieces of the delta stream of any size.
+        """
+        view = memoryview(data).cast("B")
+        size = self.signatures.block_size
+        # Start of the data that hasn't been matched, and the start of the window that is looked up
+        literal_start = pos = 0
+        checksum = None
+        # Rolling is done a byte at a time, so in a long run of unmatched data it's only done for one block at a time, and the
+        # blocks after it are stepped over whole, only looking up where each starts. The blocks stepped over double up to MAX_SKIP,
+        # so data the receiver has that follows an insertion of any length is matched again within that many blocks.
+        rolled = 0
+        skip = 0
+        skips_left = 0
+        while pos + size <= len(view) and len(self.signatures) > 0:
+            if checksum is None:
+                checksum = zlib.adler32(view[pos:pos+size])
+            if checksum in self.signatures.index:
+                block = self.find(view[pos:pos+size], checksum)
+                if block is not None:
+                    yield from self.literal(view[literal_start:pos])
+                    yield from self.copy(block)
+                    pos += size
+                    literal_start = pos
+                    checksum = None
+                    rolled = skip = skips_left = 0
+                    continue
+            elif pos - literal_start >= MAX_LITERAL:
+                yield from self.literal(view[literal_start:pos])
+                literal_start = pos
+            if skips_left > 0:
+                skips_left -= 1
+                pos += size
+                checksum = None
+                continue
+            rolled += 1
+            if rolled == size:
+                rolled = 0
+                skip = min(max(2 * skip, 1), MAX_SKIP)
+                skips_left = skip
+            if pos + size < len(view):
+                checksum = roll(checksum, view[pos], view[pos + size], size)
+            pos += 1
+        yield from self.literal(view[literal_start:])
+        yield from self.flush_copy()
+
+
+def pack_segments(pieces: Iterable[Buffer], size: Callable[[], int]) -> Iterator[Buffer]:
+    """
+    Packs pieces of a stream into full segments, so small instructions don't each take up a segment.
+    @param pieces  The pieces.
+    @param size  Returns the size of the next segment.
+    @return  An iterator over the segments. The last one may be short, and there are none if the pieces are all empty.
+    """
+    segment = bytearray()
+    for piece in pieces:
+        view = memoryview(piece).cast("B")
+        while len(view) > 0:
+            take = min(size() - len(segment), len(view))
+            segment += view[:take]
+            view = view[take:]
+            if len(segment) >= size():
+                yield bytes(segment)
+                segment = bytearray()
+    if segment:
+        yield bytes(segment)
+
+
+def rebuild_path(path: Path) -> Path:
+    """
+    @param path  A file that is being rebuilt from a delta.
+    @return  Where the new version is written until it's complete.
+    """
+    return path.with_name(path.name + ".delta")
+
+
+class DeltaFile:
+    """
+    Rebuilds a new version of a file from a delta stream and the older version that the signatures were computed from.
+    The new version is written next to the old one and replaces it once it's complete and matches its hash, so copies can come from
+    anywhere in the old version, and an interrupted transfer leaves the old version as it was for the next one to start from.
+    """
+    # Chooses the file given the new version's identifier
+    path_for: Callable[[str], Path]
+    policy: WritePolicy
+    path: Path | None
+    # The old version, and the new version being written
+    basis: int | None
+    fd: int | None
+    # The identifier of the new version, and the signatures that were sent for the old one
+    file_id: str | None
+    signatures: Signatures | None
+    # Where the next instruction writes
+    position: int
+    # An instruction header that has only partly arrived, and the bytes of the current literal that are yet to arrive
+    header: bytearray
+    literal_left: int
+    literal_bytes: int
+    copied_bytes: int
+
+    def __init__(self, path_for: Callable[[str], Path], policy: WritePolicy | None = None) -> None:
+        """
+        @param path_for  Chooses the file to rebuild given the new version's identifier.
+        @param policy  How to sync the rebuilt file. Defaults to syncing it once it's complete.
+        """
+        self.path_for = path_for
+        self.policy = policy if policy is not None else WritePolicy()
+        self.path = None
+        self.basis = None
+        self.fd = None
+        self.file_id = None
+        self.signatures = None
+        self.position = 0
+        self.header = bytearray()
+        self.literal_left = 0
+        self.literal_bytes = 0
+        self.copied_bytes = 0
+
+    def signatures_for(self, file_id: str) -> Signatures | None:
+        """
+        Opens the older version of a file and computes its signatures.
+        Meant to be a receiver's delta callback, so it may be called again if the handshake is repeated.
+        @param file_id  The sender's identifier for the new version. See resume.file_id().
+        @return  The signatures, or None if there is no older version to rebuild the file from.
+        """
+        if not FILE_ID.fullmatch(file_id):
+            # Not something this receiver sent out, and not safe to use in a path
+            return None
+        if file_id == self.file_id:
+            return self.signatures
+        self.close()
+        path = self.path_for(file_id)
+        try:
+            basis = os.open(path, os.O_RDONLY)
+        except OSError:
+            return None
+        size = os.fstat(basis).st_size
+        if size == 0:
+            os.close(basis)
+            return None
+        self.path = path
+        self.basis = basis
+        self.fd = os.open(rebuild_path(path), os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        self.file_id = file_id
+        with open(basis, "rb", closefd=False) as file:
+            self.signatures = compute_signatures(file, block_size_for(size))
+        print(f"Sending signatures of {len(self.signatures)} blocks of '{path}'.")
+        return self.signatures
+
+    def deliver(self, segment: Buffer) -> bool:
+        """
+        Applies the instructions in the next segment of the delta stream.
+        @param segment  The segment. An empty segment ends the stream.
+        @return  Whether to continue receiving.
+        """
+        if len(segment) == 0:
+            return False
+        view = memoryview(segment).cast("B")
+        while len(view) > 0:
+            if self.literal_left > 0:
+                piece = view[:self.literal_left]
+                self.write(piece)
+                self.literal_left -= len(piece)
+                self.literal_bytes += len(piece)
+                view = view[len(piece):]
+                continue
+            op = bytes(self.header[:1] or view[:1])
+            if op == COPY_OP:
+                instruction = COPY
+            elif op == LITERAL_OP:
+                instruction = LITERAL
+            else:
+                raise ValueError(f"Unknown delta instruction {op!r}")
+            # Instructions may be split across segments
+            take = min(instruction.size - len(self.header), len(view))
+            self.header += view[:take]
+            view = view[take:]
+            if len(self.header) < instruction.size:
+                break
+            if op == COPY_OP:
+                _, block, count = COPY.unpack(self.header)
+                self.copy(block, count)
+            else:
+                self.literal_left = LITERAL.unpack(self.header)[1]
+            self.header = bytearray()
+        return True
+
+    def write(self, data: Buffer):
+        """
+        Writes data at the current position and moves past it.
+        @param data  The data.
+        """
+        assert self.fd is not None
+        view = memoryview(data).cast("B")
+        while len(view) > 0:
+            written = os.pwrite(self.fd, view, self.position)
+            self.position += written
+            view = view[written:]
+
+    def copy(self, block: int, count: int):
+        """
+        Copies a run of blocks of the old version to the current position.
+        @param block  The first block of the run.
+        @param count  The number of blocks.
+        """
+        assert self.basis is not None and self.signatures is not None
+        if count == 0 or block + count > len(self.signatures):
+            raise ValueError(f"Copy of blocks {block}+{count} past the {len(self.signatures)} blocks of the file")
+        source = block * self.signatures.block_size
+        end = source + count * self.signatures.block_size
+        while source < end:
+            chunk = os.pread(self.basis, min(MAX_BLOCK, end - source), source)
+            if not chunk:
+                raise ValueError(f"'{self.path}' changed while it was being rebuilt")
+            source += len(chunk)
+            self.write(chunk)
+        self.copied_bytes += count * self.signatures.block_size
+
+    def finish(self) -> bool:
+        """
+        Syncs the rebuilt file and, if it matches the new version's identifier, puts it in place of the old version.
+        A checkpoint of an earlier transfer of the file is removed, since the file is now complete.
+        @return  Whether the file matches the identifier.
+        """
+        assert self.fd is not None and self.path is not None
+        self.policy.sync(self.fd)
+        with open(self.fd, "rb", closefd=False) as file:
+            matches = file_id(file) == self.file_id
+        if not matches:
+            print(f"[FAIL] '{self.path}' doesn't match the hash it was sent with, so it was left as it was.")
+            self.close()
+            return False
+        os.replace(rebuild_path(self.path), self.path)
+        self.close()
+        checkpoint_path(self.path).unlink(missing_ok=True)
+        print(f"Rebuilt '{self.path}' from {self.copied_bytes} bytes it already had and {self.literal_bytes} bytes that were sent.")
+        return True
+
+    def close(self):
+        """
+        Closes the files, discarding a new version that wasn't completed.
+        """
+        if self.basis is not None:
+            os.close(self.basis)
+            self.basis = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+            assert self.path is not None
+            rebuild_path(self.path).unlink(missing_ok=True)
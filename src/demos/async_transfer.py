@@ -0,0 +1,57 @@
+from async_rdt import open_sender, open_receiver
+from congestion import RenoControl
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from os import urandom
+from time import time
+import asyncio
+
+
+def argp():
+    p = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    p.add_argument("--transfers", type=int, default=100,
+                   help="Number of concurrent transfers")
+    p.add_argument("--size", type=int, default=256 * 1024,
+                   help="Bytes sent by each transfer")
+    p.add_argument("--window-size", type=int, default=64,
+                   help="Maximum Go-Back-N window size")
+    p.add_argument("--base-port", type=int, default=5000,
+                   help="First local port to use (two ports are used per transfer)")
+    return p
+
+
+async def transfer(sender_port: int, receiver_port: int, size: int, window_size: int) -> bool:
+    sender_addr = ("localhost", sender_port)
+    receiver_addr = ("localhost", receiver_port)
+    data = urandom(size)
+
+    receiver = await open_receiver(receiver_addr, sender_addr, linger=0.5)
+    sender = await open_sender(sender_addr, receiver_addr, window_size,
+                               cc=RenoControl(), negotiate=True)
+
+    async def receive() -> bytes:
+        return b"".join([chunk async for chunk in receiver])
+
+    try:
+        received, _ = await asyncio.gather(receive(), sender.send_stream(data))
+    finally:
+        sender.close()
+    return received == data
+
+
+async def run(args):
+    start = time()
+    results = await asyncio.gather(*(
+        transfer(args.base_port + 2 * i, args.base_port + 2 * i + 1, args.size, args.window_size) for i in range(args.transfers)))
+    elapsed = time() - start
+
+    total = args.transfers * args.size
+    print(f"{sum(results)}/{len(results)} transfers intact, "
+          f"{total} bytes in {elapsed:.2f}s ({total * 8 / elapsed / 1e6:.1f} Mbit/s).")
+
+
+def main():
+    asyncio.run(run(argp().parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+from bench import BenchConfig, sweep, run_simulated, run_udp, write_json, write_csv
+from rdt import DEFAULT_MSS
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from pathlib import Path
+from typing import Any
+
+
+def argp():
+    p = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter,
+                       description="Runs a transfer for every combination of the listed values and reports how each one went.")
+    p.add_argument("--transport", choices=["sim", "udp"], nargs="+", default=["sim"],
+                   help="Run in memory on a simulated clock, and/or over loopback UDP through an unstable tunnel")
+    p.add_argument("--protocol", choices=["gbn", "sr"], nargs="+", default=["gbn"],
+                   help="Reliable transfer protocols (Go-Back-N or Selective Repeat)")
+    p.add_argument("--window-size", type=int, nargs="+", default=[4, 16, 64],
+                   help="Window sizes")
+    p.add_argument("--drop", type=float, nargs="+", default=[0, 0.01, 0.05],
+                   help="Chances of dropping each packet")
+    p.add_argument("--corrupt", type=float, nargs="+", default=[0],
+                   help="Chances of flipping a(nother) random bit of each packet")
+    p.add_argument("--delay", type=float, nargs="+", default=[0.01],
+                   help="One way propagation delays in seconds")
+    p.add_argument("--mss", type=int, nargs="+", default=[DEFAULT_MSS],
+                   help="Maximum segment sizes in bytes")
+    p.add_argument("--size", type=int, nargs="+", default=[1 << 20],
+                   help="Transfer sizes in bytes")
+    p.add_argument("--ack-every", type=int, nargs="+", default=[1],
+                   help="In-order segments covered by each of the Go-Back-N receiver's ACKs")
+    p.add_argument("--dup-acks", type=int, nargs="+", default=[3],
+                   help="Duplicate ACKs that make the Go-Back-N sender resend its window")
+    p.add_argument("--fec", type=int, nargs="+", default=[0],
+                   help="Segments per XOR parity segment for forward error correction, or 0 for none")
+    p.add_argument("--seed", type=int, nargs="+", default=[0],
+                   help="Seeds for the data and the router's random decisions")
+    p.add_argument("--jitter", type=float, default=0,
+                   help="How much longer than the delay each packet can randomly take, in seconds")
+    p.add_argument("--bandwidth", type=float, default=None,
+                   help="Link rate in bits per second in each direction (unlimited by default)")
+    p.add_argument("--cc", choices=["fixed", "reno", "delay"], default="reno",
+                   help="Congestion control algorithm")
+    p.add_argument("--rate", type=float, default=10**7,
+                   help="Link rate in bits per second for fixed rate pacing")
+    p.add_argument("--base-port", type=int, default=4400,
+                   help="First of the four local ports used by UDP runs")
+    p.add_argument("--json", type=Path, default=None,
+                   help="Write the results to this file as JSON")
+    p.add_argument("--csv", type=Path, default=None,
+                   help="Write the results to this file as CSV")
+    return p
+
+
+def format_row(row: dict[str, Any]) -> str:
+    goodput = row["goodput_bps"] or 0
+    return (f"{row['transport']:>3} {row['protocol']:>3} n={row['window_size']:<4} drop={row['drop']:<5} "
+            f"corrupt={row['corrupt']:<5} delay={row['delay']:<6} mss={row['mss']:<5} size={row['size']:<9} "
+            f"k={row['ack_every']:<2} dup={row['dup_ack_threshold']:<2} fec={row['fec']:<2} | "
+            f"{goodput / 1e6:8.3f} Mbit/s {row['completion_time']:8.3f}s retx={row['retransmit_ratio']:6.1%} "
+            f"acks={row['acks']:<6} cpu={row['cpu_per_mb']:.3f}s/MB" + ("" if row["intact"] else " [CORRUPTED]"))
+
+
+def main():
+    args = argp().parse_args()
+    base = BenchConfig(cc=args.cc, rate=args.rate,
+                       jitter=args.jitter, bandwidth=args.bandwidth)
+    axes = {
+        "protocol": args.protocol,
+        "window_size": args.window_size,
+        "drop": args.drop,
+        "corrupt": args.corrupt,
+        "delay": args.delay,
+        "mss": args.mss,
+        "size": args.size,
+        "ack_every": args.ack_every,
+        "dup_ack_threshold": args.dup_acks,
+        "fec": args.fec,
+        "seed": args.seed,
+    }
+
+    rows = list()
+    for config in sweep(base, axes):
+        for transport in args.transport:
+            if transport == "udp":
+                row = run_udp(config, args.base_port)
+            else:
+                row = run_simulated(config)
+            rows.append(row)
+            print(format_row(row), flush=True)
+
+    if args.json is not None:
+        with open(args.json, "w") as file:
+            write_json(rows, file)
+    if args.csv is not None:
+        with open(args.csv, "w", newline="") as file:
+            write_csv(rows, file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+from capture import INBOUND, OUTBOUND, CapturedDatagram, describe_datagram, read_capture
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from pathlib import Path
+
+
+def argp():
+    p = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    p.add_argument("--summary", action="store_true",
+                   help="Only print the summary of each interface, not every datagram")
+    p.add_argument("--conn-id", type=lambda value: int(value, 0), default=None,
+                   help="Only show the packets of this connection")
+    p.add_argument("capture", type=Path,
+                   help="pcapng file written by --capture")
+    return p
+
+
+class InterfaceSummary:
+    """What happened on one interface of a capture."""
+    # Packets by direction and kind
+    counts: dict[tuple[int, str], int]
+    # Datagrams by annotation
+    notes: dict[str, int]
+    # Data packets whose (conn ID, seq) was already sent on the interface
+    retransmits: int
+    # Send times of data packets that have only been sent once, by (conn ID, seq)
+    sent_at: dict[tuple[int, int], float]
+    resent: set[tuple[int, int]]
+    # Time from sending a data packet to the first ACK for it, or from a router port receiving a datagram to delivering it
+    delays: list[float]
+    # Arrival times of datagrams at a router port that are yet to be delivered, by content
+    arrivals: dict[bytes, list[float]]
+    lost: int
+
+    def __init__(self) -> None:
+        self.counts = dict()
+        self.notes = dict()
+        self.retransmits = 0
+        self.sent_at = dict()
+        self.resent = set()
+        self.delays = list()
+        self.arrivals = dict()
+        self.lost = 0
+
+    def add(self, datagram: CapturedDatagram, kind: str, conn_id: int | None, seq: int | None) -> bool:
+        """
+        @param datagram  The next datagram recorded on the interface.
+        @param kind  The kind of packet from describe_datagram().
+        @param conn_id  The packet's connection ID, or None.
+        @param seq  The packet's sequence number, or None.
+        @return  Whether the datagram is a retransmission.
+        """
+        self.counts[(datagram.direction, kind)] = self.counts.get((datagram.direction, kind), 0) + 1
+        if datagram.note is not None:
+            for note in datagram.note.split(", "):
+                self.notes[note] = self.notes.get(note, 0) + 1
+        if datagram.interface.startswith("router"):
+            # Queueing and propagation delay of each packet the router delivered.
+            # Corrupted packets can't be matched up with their delivery, since it has different content.
+            notes = [] if datagram.note is None else datagram.note.split(", ")
+            if datagram.direction == INBOUND and not any(note.startswith(("dropped", "corrupted")) for note in notes):
+                copies = 2 if "duplicated" in notes else 1
+                self.arrivals.setdefault(datagram.data, []).extend([datagram.timestamp] * copies)
+            elif datagram.direction == OUTBOUND and datagram.data in self.arrivals:
+                self.delays.append(datagram.timestamp - self.arrivals[datagram.data].pop(0))
+                if not self.arrivals[datagram.data]:
+                    del self.arrivals[datagram.data]
+            return False
+
+        key = (conn_id, seq)
+        if kind == "DATA" and datagram.direction == OUTBOUND:
+            if key in self.sent_at or key in self.resent:
+                self.sent_at.pop(key, None)
+                self.resent.add(key)
+                self.retransmits += 1
+                return True
+            self.sent_at[key] = datagram.timestamp  # type: ignore
+        elif kind == "ACK" and datagram.direction == INBOUND and key in self.sent_at:
+            # Only segments sent once give an unambiguous RTT (Karn's rule)
+            self.delays.append(datagram.timestamp - self.sent_at.pop(key))  # type: ignore
+        return False
+
+    def format(self, name: str) -> str:
+        """
+        @param name  The interface's name.
+        @return  The summary as lines of text.
+        """
+        directions = {INBOUND: "in", OUTBOUND: "out", 0: "?"}
+        counts = " ".join(f"{directions[direction]}:{kind}={count}"
+                          for (direction, kind), count in sorted(self.counts.items()))
+        lines = [f"{name}: {counts}"]
+        if self.retransmits:
+            lines.append(f"  retransmitted={self.retransmits}")
+        if self.notes:
+            lines.append("  " + " ".join(f"{note}={count}" for note, count in sorted(self.notes.items())))
+        if self.delays:
+            label = "transit" if name.startswith("router") else "rtt"
+            lines.append(f"  {label} min={min(self.delays) * 1000:.2f}ms avg={sum(self.delays) / len(self.delays) * 1000:.2f}ms "
+                         f"max={max(self.delays) * 1000:.2f}ms over {len(self.delays)} packets")
+        if self.lost:
+            lines.append(f"  [WARN] {self.lost} datagrams weren't captured because the capture fell behind")
+        return "\n".join(lines)
+
+
+def main():
+    args = argp().parse_args()
+    summaries: dict[str, InterfaceSummary] = dict()
+    start = None
+    with open(args.capture, "rb") as file:
+        for entry in read_capture(file):
+            if isinstance(entry, tuple):
+                name, lost = entry
+                summaries.setdefault(name, InterfaceSummary()).lost += lost
+                continue
+            kind, conn_id, seq, details = describe_datagram(entry.data)
+            if args.conn_id is not None and conn_id != args.conn_id:
+                continue
+            retransmit = summaries.setdefault(entry.interface, InterfaceSummary()).add(entry, kind, conn_id, seq)
+            if args.summary:
+                continue
+            if start is None:
+                start = entry.timestamp
+            direction = {INBOUND: "in", OUTBOUND: "out"}.get(entry.direction, "?")
+            conn = "" if conn_id is None else f" conn={conn_id:08x}"
+            line = f"{entry.timestamp - start:12.6f} {entry.interface} {direction} {kind}{conn}"
+            if seq is not None:
+                line += f" seq={seq}"
+            if details:
+                line += f" {details}"
+            if retransmit:
+                line += " [retransmit]"
+            if entry.note is not None:
+                line += f" ({entry.note})"
+            print(line)
+
+    if not args.summary:
+        print()
+    for name, summary in summaries.items():
+        print(summary.format(name))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,15 @@
-from UDPDuplex import UDPDuplex
-from rdt import GoBackNReceiver, UDPDuplexGoBackNClient
+from compression import CODECS, Decompressor
+from delta import DeltaFile
+from mux import ConnectionClient, ConnectionListener
+from resume import ResumableFile, StripedFiles
+from sink import FSYNC_POLICIES, WRITE_BUFFER, WritePolicy
+from rdt import GoBackNReceiver, SelectiveRepeatReceiver, MAX_MSS
+from metrics import Metrics, PeriodicExporter, JSONLinesWriter, print_summary
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from contextlib import ExitStack
+from threading import Event, Lock
 from pathlib import Path
+from typing import Callable
 
 
 def argp():
@@ -10,33 +18,144 @@ def argp():
                    help="Interface to bind to")
     p.add_argument("--port", type=int, default=4382,
                    help="Port to bind to")
-    p.add_argument("--sender", type=str, default="localhost",
-                   help="Sender interface")
-    p.add_argument("--sender-port", type=int, default=4381,
-                   help="Sender port")
+    p.add_argument("--protocol", choices=["gbn", "sr"], default="gbn",
+                   help="Reliable transfer protocol (Go-Back-N or Selective Repeat)")
+    p.add_argument("--window-size", type=int, default=3,
+                   help="Selective Repeat receive window size")
+    p.add_argument("--max-mss", type=int, default=MAX_MSS,
+                   help="Largest segment size in bytes to accept from the sender")
+    p.add_argument("--ack-every", type=int, default=1,
+                   help="In-order segments covered by each Go-Back-N ACK")
+    p.add_argument("--ack-delay", type=float, default=0.05,
+                   help="Longest a Go-Back-N ACK is held back waiting for more segments, in seconds")
+    p.add_argument("--window", type=int, default=None,
+                   help="Write through a buffer of this many segments on a thread of its own, and advertise its free space to the sender "
+                        "so a slow disk slows the sender down (off by default)")
+    p.add_argument("--idle-timeout", type=float, default=60,
+                   help="Seconds without a packet before giving up on a sender, keeping what it sent so a restarted sender can resume")
+    p.add_argument("--checkpoint-interval", type=float, default=1,
+                   help="Seconds between saving how much of the file has been written, so an interrupted transfer can be resumed")
+    p.add_argument("--fsync", choices=FSYNC_POLICIES, default="checkpoint",
+                   help="When to force received data to disk: after every buffered write, before each checkpoint, "
+                        "or never (which also saves no checkpoints, so interrupted transfers start over)")
+    p.add_argument("--write-buffer", type=int, default=WRITE_BUFFER,
+                   help="Bytes of received data to collect before each write to the file")
+    p.add_argument("--mmap", action="store_true",
+                   help="Write files whose size the sender announces through a memory mapping instead of a write buffer")
+    p.add_argument("--serve", action="store_true",
+                   help="Keep accepting senders (any number at once) until interrupted, saving each file in the localpath directory")
+    p.add_argument("--stats-interval", type=float, default=1,
+                   help="Seconds between metrics reports")
+    p.add_argument("--metrics-out", type=Path, default=None,
+                   help="Write metrics to this file as JSON lines instead of printing summaries")
     p.add_argument("localpath", type=Path,
-                   help="Local path to save the received file")
+                   help="Local path to save the received file (or directory to save received files in with --serve)")
     return p
 
 
-def main():
-    args = argp().parse_args()
+def create_exporter(args, metrics: Metrics, stack: ExitStack) -> PeriodicExporter:
+    export = print_summary
+    if args.metrics_out is not None:
+        export = JSONLinesWriter(stack.enter_context(open(args.metrics_out, "w")))
+    return PeriodicExporter(metrics, args.stats_interval, export)
 
-    udpd = UDPDuplex(args.interface, args.port, args.sender, args.sender_port)
-    gbnc = UDPDuplexGoBackNClient(udpd, 10)
 
-    with open(args.localpath, "bw") as out_file:
+def receive_file(args, client: ConnectionClient, path_for: Callable[[str | None], Path], striped: StripedFiles, policy: WritePolicy, metrics: Metrics) -> bool:
+    """
+    @return  Whether the whole file has been received, which for a range of a file is once every range has.
+    """
+    out_file = ResumableFile(path_for, args.checkpoint_interval, striped, policy)
+    # Rebuilds the file from the copy that's already there instead, if the sender asks for a delta transfer and there is one
+    delta_file = DeltaFile(path_for, policy)
+    try:
         def write_block(block: bytes) -> bool:
+            if gbnr.signatures is not None:
+                return delta_file.deliver(block)
             if len(block) == 0:
                 # Indicating end-of-file
                 return False
 
             out_file.write(block)
             return True
-        gbnr = GoBackNReceiver(gbnc)
-        gbnr.recv(write_block)
+        # Decompresses as segments arrive, if the sender chose to compress during the handshake
+        decompressor = Decompressor(write_block)
+
+        def deliver(block: bytes) -> bool:
+            if gbnr.compress is not None:
+                return decompressor.deliver(block)
+            return write_block(block)
+
+        if args.protocol == "sr":
+            gbnr = SelectiveRepeatReceiver(
+                client, args.window_size, args.max_mss, conn_id=client.conn_id, observer=metrics, codecs=CODECS,
+                resume=out_file.resume, window=args.window, delta=delta_file.signatures_for, idle_timeout=args.idle_timeout)
+        else:
+            gbnr = GoBackNReceiver(
+                client, args.max_mss, conn_id=client.conn_id, observer=metrics, ack_every=args.ack_every, ack_delay=args.ack_delay,
+                codecs=CODECS, resume=out_file.resume, window=args.window, delta=delta_file.signatures_for, idle_timeout=args.idle_timeout)
+        gbnr.recv(deliver)
+        if not gbnr.finished:
+            print(f"[WARN] Sender {client.addr[0]}:{client.addr[1]} went away, keeping what it sent to resume from.")
+            if gbnr.signatures is None:
+                out_file.checkpoint()
+            return False
+        if gbnr.signatures is not None:
+            print(f"Received delta from {client.addr[0]}:{client.addr[1]} for '{delta_file.path}'")
+            return delta_file.finish()
+        print(f"Wrote {'range' if out_file.stripe is not None else 'file'} from {client.addr[0]}:{client.addr[1]} to '{out_file.path}'")
+        return out_file.finish()
+    finally:
+        # Keeps the checkpoint if the transfer didn't finish
+        out_file.close()
+        delta_file.close()
+
+
+def main():
+    args = argp().parse_args()
+    if args.serve:
+        args.localpath.mkdir(parents=True, exist_ok=True)
+
+    metrics = Metrics()
+    # Without --serve, only the first file is accepted, over one connection or one per range if it's striped,
+    # and the program exits once it's received
+    claim_lock = Lock()
+    claimed: list[str | None] = []
+    finished = Event()
+
+    def claim(file_id: str | None) -> Path:
+        with claim_lock:
+            if not claimed:
+                claimed.append(file_id)
+            elif file_id is None or claimed[0] != file_id:
+                raise RuntimeError("Already receiving another file")
+        return args.localpath
+
+    def path_for(file_id: str) -> Path:
+        # Files are named by their identifier, so a restarted sender resumes into the same file
+        return args.localpath / f"{file_id}.bin" if args.serve else claim(file_id)
+    policy = WritePolicy(args.fsync, args.write_buffer, args.mmap)
+    striped = StripedFiles(path_for, args.checkpoint_interval, policy)
+
+    def handle(client: ConnectionClient):
+        try:
+            if not args.serve:
+                if receive_file(args, client, claim, striped, policy, metrics):
+                    finished.set()
+            else:
+                receive_file(args, client, lambda file_id: path_for(file_id) if file_id is not None else
+                             args.localpath / f"{client.conn_id:08x}.bin", striped, policy, metrics)
+        except RuntimeError as e:
+            print(f"[WARN] Dropped sender {client.addr[0]}:{client.addr[1]}: {e}")
 
-    print(f"Wrote file to '{args.localpath}'")
+    with ExitStack() as stack:
+        stack.enter_context(create_exporter(args, metrics, stack))
+        stack.enter_context(ConnectionListener(
+            args.interface, args.port, handle))
+        try:
+            while not finished.wait(1):
+                pass
+        except KeyboardInterrupt:
+            pass
 
 
 if __name__ == "__main__":
@@ -1,7 +1,16 @@
 from UDPDuplex import UDPDuplex
-from rdt import GoBackNSender, UDPDuplexGoBackNClient
+from capture import Capture
+from compression import CODECS
+from resume import file_id, split_ranges, stripe_id
+from rdt import GoBackNClient, GoBackNSender, SelectiveRepeatSender, UDPDuplexGoBackNClient, DEFAULT_MSS, MAX_MSS
+from congestion import CongestionControl, FixedRateControl, RenoControl, DelayControl
+from metrics import Metrics, PeriodicExporter, JSONLinesWriter, format_summary, print_summary
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 from pathlib import Path
+from random import getrandbits
+import mmap
 
 
 def argp():
@@ -9,30 +18,152 @@ def argp():
     p.add_argument("--interface", type=str, default="localhost",
                    help="Interface to bind to")
     p.add_argument("--port", type=int, default=4381,
-                   help="Port to bind to")
+                   help="Port to bind to (with --streams, each stream binds a port the OS picks instead)")
     p.add_argument("--dest", type=str, default="localhost",
                    help="Destination interface")
     p.add_argument("--dest-port", type=int, default=4382,
                    help="Destination port")
     p.add_argument("--window-size", type=int, default=3,
-                   help="Go-Back-N window size")
+                   help="Maximum Go-Back-N window size")
+    p.add_argument("--protocol", choices=["gbn", "sr"], default="gbn",
+                   help="Reliable transfer protocol (Go-Back-N or Selective Repeat)")
+    p.add_argument("--cc", choices=["fixed", "reno", "delay"], default="reno",
+                   help="Congestion control algorithm")
+    p.add_argument("--rate", type=float, default=500,
+                   help="Link rate in bits per second for fixed rate pacing")
+    p.add_argument("--mss", type=int, default=DEFAULT_MSS,
+                   help=f"Maximum segment size in bytes (at most {MAX_MSS}), which the receiver may lower")
+    p.add_argument("--dup-acks", type=int, default=3,
+                   help="Duplicate ACKs that make the Go-Back-N sender resend its window")
+    p.add_argument("--fec", type=int, default=None,
+                   help="Segments per XOR parity segment for forward error correction (off by default)")
+    p.add_argument("--compress", choices=list(CODECS), default=None,
+                   help="Compress the file with this codec if the receiver supports it, falling back to raw data where it doesn't compress")
+    p.add_argument("--level", type=int, default=6,
+                   help="Compression level")
+    p.add_argument("--no-resume", action="store_true",
+                   help="Always send the whole file, rather than identifying it by its hash so the receiver can resume an interrupted transfer")
+    p.add_argument("--delta", action="store_true",
+                   help="If the receiver already has an older version of the file at its localpath, only send the blocks that changed "
+                        "(not with --streams)")
+    p.add_argument("--streams", type=int, default=1,
+                   help="Split the file into this many byte ranges and send each from its own process and port")
+    p.add_argument("--conn-id", type=int, default=None,
+                   help="Connection ID that tells this transfer apart from others to the same receiver (random by default)")
+    p.add_argument("--stats-interval", type=float, default=1,
+                   help="Seconds between metrics reports")
+    p.add_argument("--metrics-out", type=Path, default=None,
+                   help="Write metrics to this file as JSON lines instead of printing summaries")
+    p.add_argument("--capture", type=Path, default=None,
+                   help="Record every datagram sent and received in this pcapng file (see decode_capture.py)")
     p.add_argument("localpath", type=Path,
                    help="Local path of the file to send")
     return p
 
 
-def main():
-    args = argp().parse_args()
+def create_cc(args) -> CongestionControl:
+    if args.cc == "fixed":
+        return FixedRateControl(args.rate)
+    if args.cc == "delay":
+        return DelayControl()
+    return RenoControl()
+
+
+def create_exporter(args, metrics: Metrics, stack: ExitStack, stream: int | None = None) -> PeriodicExporter:
+    if stream is None:
+        export = print_summary
+    else:
+        def export(snapshot):
+            print(f"[stream {stream}] {format_summary(snapshot)}")
+    if args.metrics_out is not None:
+        path = args.metrics_out if stream is None else args.metrics_out.with_name(f"{args.metrics_out.name}.{stream}")
+        export = JSONLinesWriter(stack.enter_context(open(path, "w")))
+    return PeriodicExporter(metrics, args.stats_interval, export)
+
 
-    udpd = UDPDuplex(args.interface, args.port, args.dest, args.dest_port)
-    gbnc = UDPDuplexGoBackNClient(udpd, 10)
+def create_capture(args, stack: ExitStack, stream: int | None = None) -> Capture | None:
+    if args.capture is None:
+        return None
+    path = args.capture if stream is None else args.capture.with_name(f"{args.capture.name}.{stream}")
+    return stack.enter_context(Capture(stack.enter_context(open(path, "wb"))))
 
+
+def create_sender(args, client: GoBackNClient, conn_id: int, metrics: Metrics, resume_id: str | None, delta_id: str | None = None) -> GoBackNSender:
+    if args.protocol == "sr":
+        return SelectiveRepeatSender(
+            client, args.window_size, cc=create_cc(args), mss=args.mss, negotiate=True, conn_id=conn_id, observer=metrics,
+            fec=args.fec, compress=args.compress, compress_level=args.level, resume_id=resume_id, delta_id=delta_id)
+    return GoBackNSender(client, args.window_size,
+                         cc=create_cc(args), mss=args.mss, negotiate=True, conn_id=conn_id, observer=metrics,
+                         dup_ack_threshold=args.dup_acks, fec=args.fec,
+                         compress=args.compress, compress_level=args.level, resume_id=resume_id, delta_id=delta_id)
+
+
+def send_range(args, stream: int, conn_id: int, resume_id: str, offset: int, length: int):
+    """
+    Sends one byte range of the file as a connection of its own. Runs in a worker process.
+    """
+    metrics = Metrics()
+    with ExitStack() as stack:
+        # The OS picks each stream's port, since consecutive ports from --port may run into the receiver's
+        udpd = UDPDuplex(args.interface, 0,
+                         args.dest, args.dest_port, create_capture(args, stack, stream))
+        gbnc = UDPDuplexGoBackNClient(udpd, 10)
+        gbns = create_sender(args, gbnc, conn_id, metrics, resume_id)
+        if length > 0:
+            in_file = stack.enter_context(open(args.localpath, "br"))
+            # Left open for the life of the worker, since the sender may still hold views of it when it returns
+            mapped = mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ)
+            gbns.push(memoryview(mapped)[offset:offset + length])
+        # Indicator for end of range
+        gbns.push(bytes(0))
+        stack.enter_context(create_exporter(args, metrics, stack, stream))
+        gbns.start()
+
+
+def send_striped(args):
+    """
+    Sends the file as --streams byte ranges at once, each from a process of its own, so they don't share a window, a socket or the GIL.
+    The receiver writes each range at its offset, and checks the whole file once every range has arrived.
+    """
     with open(args.localpath, "br") as in_file:
-        gbns = GoBackNSender(gbnc, args.window_size)
-        gbns.push(in_file.read())
+        whole_id = file_id(in_file)
+    ranges = split_ranges(int(whole_id.split("-")[0]), args.streams)
+    # Chosen here rather than in the workers, which would inherit the same random state
+    conn_ids = [(args.conn_id + i) % 2**32 if args.conn_id is not None else getrandbits(32)
+                for i in range(len(ranges))]
+    with ProcessPoolExecutor(len(ranges)) as pool:
+        futures = [pool.submit(send_range, args, i, conn_ids[i], stripe_id(whole_id, offset, length), offset, length)
+                   for i, (offset, length) in enumerate(ranges)]
+        for future in futures:
+            future.result()
+    print(f"Sent {len(ranges)} ranges.")
+
+
+def main():
+    parser = argp()
+    args = parser.parse_args()
+    if args.delta and args.streams > 1:
+        parser.error("--delta rebuilds the whole file at once, so it can't be split into --streams")
+    if args.streams > 1:
+        send_striped(args)
+        return
+
+    conn_id = args.conn_id if args.conn_id is not None else getrandbits(32)
+    metrics = Metrics()
+    with ExitStack() as stack:
+        udpd = UDPDuplex(args.interface, args.port, args.dest, args.dest_port, create_capture(args, stack))
+        gbnc = UDPDuplexGoBackNClient(udpd, 10)
+        in_file = stack.enter_context(open(args.localpath, "br"))
+        whole_id = file_id(in_file) if args.delta or not args.no_resume else None
+        resume_id = None if args.no_resume else whole_id
+        delta_id = whole_id if args.delta else None
+        gbns = create_sender(args, gbnc, conn_id, metrics, resume_id, delta_id)
+        gbns.push(in_file)
         # Indicator for end of file
         gbns.push(bytes(0))
         # Transmit until done
+        stack.enter_context(create_exporter(args, metrics, stack))
         gbns.start()
 
 
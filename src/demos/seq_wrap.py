@@ -0,0 +1,93 @@
+from UDPDuplex import UDPDuplex
+from rdt import GoBackNClient, GoBackNReceiver, GoBackNSender, SelectiveRepeatReceiver, SelectiveRepeatSender, UDPDuplexGoBackNClient
+from congestion import FixedRateControl
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from threading import Thread
+from random import random
+from os import urandom
+
+
+class LossyClient(GoBackNClient):
+    """Wraps a client and drops a fraction of the packets it sends."""
+    inner: GoBackNClient
+    drop_chance: float
+
+    def __init__(self, inner: GoBackNClient, drop_chance: float) -> None:
+        super().__init__(inner.timeout)
+        self.inner = inner
+        self.drop_chance = drop_chance
+
+    def send(self, payload: bytes):
+        if random() >= self.drop_chance:
+            self.inner.send(payload)
+
+    def recv(self, timeout: float | None = None) -> bytes | None:
+        return self.inner.recv(timeout)
+
+
+def argp():
+    p = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    p.add_argument("--protocol", choices=["gbn", "sr"], default="gbn",
+                   help="Reliable transfer protocol (Go-Back-N or Selective Repeat)")
+    p.add_argument("--seq-bits", type=int, default=32,
+                   help="Size of the sequence number space in bits")
+    p.add_argument("--before-wrap", type=int, default=50,
+                   help="How many segments to send before the sequence number wraps")
+    p.add_argument("--segments", type=int, default=200,
+                   help="Number of segments to transfer")
+    p.add_argument("--window-size", type=int, default=8,
+                   help="Window size")
+    p.add_argument("--drop", type=float, default=0.1,
+                   help="Chance of dropping each packet in either direction")
+    p.add_argument("--port", type=int, default=4390,
+                   help="Sender port (the receiver uses the next port)")
+    return p
+
+
+def main():
+    args = argp().parse_args()
+    mss = 16
+    first_seq = 2**args.seq_bits - args.before_wrap
+    data = urandom(args.segments * mss)
+
+    sender_client = LossyClient(UDPDuplexGoBackNClient(
+        UDPDuplex("localhost", args.port, "localhost", args.port + 1), 0.5), args.drop)
+    receiver_client = LossyClient(UDPDuplexGoBackNClient(
+        UDPDuplex("localhost", args.port + 1, "localhost", args.port), 0.5), args.drop)
+
+    if args.protocol == "sr":
+        sender = SelectiveRepeatSender(sender_client, args.window_size, cc=FixedRateControl(10**6),
+                                       mss=mss, first_seq=first_seq, seq_bits=args.seq_bits)
+        receiver = SelectiveRepeatReceiver(receiver_client, args.window_size,
+                                           first_seq=first_seq, seq_bits=args.seq_bits)
+    else:
+        sender = GoBackNSender(sender_client, args.window_size, cc=FixedRateControl(10**6),
+                               mss=mss, first_seq=first_seq, seq_bits=args.seq_bits)
+        receiver = GoBackNReceiver(receiver_client,
+                                   first_seq=first_seq, seq_bits=args.seq_bits)
+
+    received = bytearray()
+
+    def deliver(block: bytes) -> bool:
+        if len(block) == 0:
+            return False
+        received.extend(block)
+        return True
+
+    receiver_thread = Thread(target=receiver.recv, args=(deliver,))
+    receiver_thread.start()
+    sender.push(data)
+    sender.push(bytes(0))
+    sender.start()
+    receiver_thread.join()
+
+    print(f"Sequence numbers {first_seq} to {sender.curr_seq} "
+          f"(wire {sender.seq_space.wrap(first_seq)} to {sender.seq_space.wrap(sender.curr_seq)}).")
+    if bytes(received) != data:
+        print("[FAIL] Received data does not match what was sent.")
+        exit(1)
+    print("[OK] Received data matches what was sent.")
+
+
+if __name__ == "__main__":
+    main()
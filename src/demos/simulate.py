@@ -0,0 +1,133 @@
+from rdt import GoBackNReceiver, GoBackNSender, SelectiveRepeatReceiver, SelectiveRepeatSender, DEFAULT_MSS
+from router import Router
+from capture import Capture
+from sim import SimulatedNetwork
+from congestion import CongestionControl, FixedRateControl, RenoControl, DelayControl
+from metrics import Metrics
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from pathlib import Path
+from hashlib import sha256
+from random import Random
+from time import perf_counter
+
+
+def argp():
+    p = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    p.add_argument("--protocol", choices=["gbn", "sr"], default="gbn",
+                   help="Reliable transfer protocol (Go-Back-N or Selective Repeat)")
+    p.add_argument("--cc", choices=["fixed", "reno", "delay"], default="reno",
+                   help="Congestion control algorithm")
+    p.add_argument("--rate", type=float, default=10**7,
+                   help="Link rate in bits per second for fixed rate pacing")
+    p.add_argument("--segments", type=int, default=5000,
+                   help="Number of segments to transfer")
+    p.add_argument("--mss", type=int, default=DEFAULT_MSS,
+                   help="Maximum segment size in bytes")
+    p.add_argument("--window-size", type=int, default=64,
+                   help="Window size")
+    p.add_argument("--dup-acks", type=int, default=3,
+                   help="Duplicate ACKs that make the Go-Back-N sender resend its window")
+    p.add_argument("--ack-every", type=int, default=1,
+                   help="In-order segments covered by each of the Go-Back-N receiver's ACKs")
+    p.add_argument("--fec", type=int, default=None,
+                   help="Segments per XOR parity segment for forward error correction (off by default)")
+    p.add_argument("--seed", type=int, default=0,
+                   help="Seed for the data and the router's random decisions")
+    p.add_argument("--drop", type=float, default=0.05,
+                   help="Chance of dropping each packet independently")
+    p.add_argument("--corrupt", type=float, default=0.05,
+                   help="Chance of flipping a(nother) random bit of each packet")
+    p.add_argument("--min-delay", type=float, default=0.02,
+                   help="Minimum propagation delay in seconds")
+    p.add_argument("--max-delay", type=float, default=0.05,
+                   help="Maximum propagation delay in seconds")
+    p.add_argument("--bandwidth", type=float, default=10**7,
+                   help="Link rate in bits per second in each direction")
+    p.add_argument("--runs", type=int, default=2,
+                   help="Number of times to repeat the transfer, which must all give the same result")
+    p.add_argument("--capture", type=Path, default=None,
+                   help="Record the first run's packets in this pcapng file as they enter and leave the router, on the virtual clock (see decode_capture.py)")
+    return p
+
+
+def create_cc(args) -> CongestionControl:
+    if args.cc == "fixed":
+        return FixedRateControl(args.rate)
+    if args.cc == "delay":
+        return DelayControl()
+    return RenoControl()
+
+
+def run(args, data: bytes, capture: Capture | None = None) -> tuple[bytes, float, dict[str, int]]:
+    """
+    Transfers the data once over a freshly seeded simulated network.
+    @param capture  Records the packets that pass through the router, if given.
+    @return  The received data, the virtual time the transfer took, and the sender's counters.
+    """
+    router = Router(args.seed)
+    router.drop_chance = args.drop
+    router.corrupt_chance = args.corrupt
+    router.min_delay = args.min_delay
+    router.max_delay = args.max_delay
+    router.bandwidth = args.bandwidth
+    router.capture = capture
+    network = SimulatedNetwork(router)
+    sender_client, receiver_client = network.connect(1)
+
+    metrics = Metrics()
+    if args.protocol == "sr":
+        sender = SelectiveRepeatSender(sender_client, args.window_size, cc=create_cc(args),
+                                       mss=args.mss, observer=metrics,
+                                       negotiate=args.fec is not None, fec=args.fec)
+        receiver = SelectiveRepeatReceiver(receiver_client, args.window_size)
+    else:
+        sender = GoBackNSender(sender_client, args.window_size, cc=create_cc(args),
+                               mss=args.mss, observer=metrics, dup_ack_threshold=args.dup_acks,
+                               negotiate=args.fec is not None, fec=args.fec)
+        receiver = GoBackNReceiver(receiver_client, ack_every=args.ack_every)
+
+    received = bytearray()
+
+    def deliver(block: bytes) -> bool:
+        if len(block) == 0:
+            return False
+        received.extend(block)
+        return True
+
+    receiver_client.serve(receiver, deliver)
+    sender.push(data)
+    sender.push(bytes(0))
+    sender.start()
+    return bytes(received), network.time(), dict(metrics.counters)
+
+
+def main():
+    args = argp().parse_args()
+    data = Random(args.seed).randbytes(args.segments * args.mss)
+
+    results = set()
+    for i in range(args.runs):
+        start = perf_counter()
+        if i == 0 and args.capture is not None:
+            with open(args.capture, "wb") as file, Capture(file) as capture:
+                received, elapsed, counters = run(args, data, capture)
+        else:
+            received, elapsed, counters = run(args, data)
+        real = perf_counter() - start
+        results.add((sha256(received).hexdigest(), elapsed,
+                     tuple(sorted(counters.items()))))
+        print(f"Run {i + 1}: {elapsed:.3f}s simulated in {real:.3f}s real, "
+              f"{counters['segments_sent']} segments sent ({counters['retransmits']} retransmitted), "
+              f"{counters['parity_sent']} parity segments.")
+        if received != data:
+            print("[FAIL] Received data does not match what was sent.")
+            exit(1)
+
+    if len(results) > 1:
+        print("[FAIL] Runs with the same seed gave different results.")
+        exit(1)
+    print("[OK] Received data matches what was sent, identically on every run.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,84 @@
 from tunnel import UnstableTunnel
 from router import Router
+from link import RED, GilbertElliott
 from cfg import TUNNEL_A_IN, TUNNEL_A_DST, TUNNEL_B_IN, TUNNEL_B_DST
 from UDPDuplex import UDPDuplex
+from capture import Capture
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from contextlib import ExitStack
+from pathlib import Path
 
-a = UDPDuplex("localhost", TUNNEL_A_IN, "localhost", TUNNEL_A_DST)
-b = UDPDuplex("localhost", TUNNEL_B_IN, "localhost", TUNNEL_B_DST)
 
-router = Router()
-router.drop_chance = 0.15
-router.corrupt_chance = 0.25
-router.min_delay = 1
-router.max_delay = 4
+def argp():
+    p = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    p.add_argument("--seed", type=int, default=None,
+                   help="Seed for the router's random decisions, to reproduce a run (random by default)")
+    p.add_argument("--drop", type=float, default=0.15,
+                   help="Chance of dropping each packet independently")
+    p.add_argument("--corrupt", type=float, default=0.25,
+                   help="Chance of flipping a(nother) random bit of each packet")
+    p.add_argument("--bit-error-rate", type=float, default=0,
+                   help="Chance of flipping each individual bit")
+    p.add_argument("--min-delay", type=float, default=1,
+                   help="Minimum propagation delay in seconds")
+    p.add_argument("--max-delay", type=float, default=4,
+                   help="Maximum propagation delay in seconds")
+    p.add_argument("--bandwidth", type=float, default=None,
+                   help="Link rate in bits per second in each direction (unlimited by default)")
+    p.add_argument("--queue", type=int, default=None,
+                   help="Packets the link can queue before tail dropping (unlimited by default)")
+    p.add_argument("--red", type=float, nargs=2, metavar=("MIN_TH", "MAX_TH"), default=None,
+                   help="Enable Random Early Detection between these average queue lengths (in packets)")
+    p.add_argument("--red-max-p", type=float, default=0.1,
+                   help="RED drop probability as the average queue reaches MAX_TH")
+    p.add_argument("--burst-loss", type=float, nargs=2, metavar=("P_ENTER", "P_LEAVE"), default=None,
+                   help="Enable Gilbert-Elliott burst losses with these per-packet chances of entering and leaving the bad state")
+    p.add_argument("--burst-loss-rate", type=float, default=1,
+                   help="Loss rate in the bad state of the burst loss model")
+    p.add_argument("--reorder", type=float, default=0,
+                   help="Chance of holding a packet back so later packets overtake it")
+    p.add_argument("--reorder-delay", type=float, default=0.1,
+                   help="Longest time a reordered packet is held back, in seconds")
+    p.add_argument("--duplicate", type=float, default=0,
+                   help="Chance of delivering a packet twice")
+    p.add_argument("--capture", type=Path, default=None,
+                   help="Record every packet in this pcapng file as it enters and leaves the router, noting what was done to it (see decode_capture.py)")
+    return p
 
-tunnel = UnstableTunnel(router)
-tunnel.start(a, b)
+
+def main():
+    args = argp().parse_args()
+
+    a = UDPDuplex("localhost", TUNNEL_A_IN, "localhost", TUNNEL_A_DST)
+    b = UDPDuplex("localhost", TUNNEL_B_IN, "localhost", TUNNEL_B_DST)
+
+    router = Router(args.seed)
+    router.drop_chance = args.drop
+    router.corrupt_chance = args.corrupt
+    router.bit_error_rate = args.bit_error_rate
+    router.min_delay = args.min_delay
+    router.max_delay = args.max_delay
+    router.bandwidth = args.bandwidth
+    router.queue_limit = args.queue
+    if args.red is not None:
+        router.red = RED(args.red[0], args.red[1], args.red_max_p)
+    if args.burst_loss is not None:
+        router.burst_loss = GilbertElliott(
+            args.burst_loss[0], args.burst_loss[1], loss_bad=args.burst_loss_rate)
+    router.reorder_chance = args.reorder
+    router.reorder_delay = args.reorder_delay
+    router.duplicate_chance = args.duplicate
+
+    with ExitStack() as stack:
+        if args.capture is not None:
+            router.capture = stack.enter_context(Capture(stack.enter_context(open(args.capture, "wb"))))
+        tunnel = UnstableTunnel(router)
+        try:
+            tunnel.start(a, b)
+        except KeyboardInterrupt:
+            # The tunnel runs until interrupted, after which the capture is finished off
+            pass
+
+
+if __name__ == "__main__":
+    main()
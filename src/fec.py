@@ -0,0 +1,159 @@
+from typing import Mapping
+from segments import Buffer
+
+
+class ParityEncoder:
+    """
+    Forward error correction for a sender: XORs each block of k consecutive segments into one parity segment,
+    from which the receiver can rebuild any one segment of the block that was lost.
+    Segments of different sizes are XORed as if padded with zeros, and their sizes are XORed too, so the lost size can be rebuilt as well.
+    """
+    # Segments per block
+    k: int
+    block_start: int
+    # The next seq to add, since only first transmissions are encoded
+    next_seq: int
+    # XOR of the block's segments read as little endian ints, so shorter segments are padded at the end
+    parity: int
+    size_xor: int
+    max_size: int
+
+    def __init__(self, k: int, first_seq: int) -> None:
+        """
+        @param k  The number of data segments per parity segment.
+        @param first_seq  The sequence number of the first segment, where the first block starts.
+        """
+        assert k > 0
+        self.k = k
+        self.next_seq = first_seq
+        self.start_block()
+
+    def start_block(self):
+        self.block_start = self.next_seq
+        self.parity = 0
+        self.size_xor = 0
+        self.max_size = 0
+
+    def add(self, seq: int, payload: Buffer, final: bool) -> tuple[int, int, int, bytes] | None:
+        """
+        Adds a segment to the current block. Segments must be added in order, and any other seq is ignored.
+        @param seq  The sequence number of the segment.
+        @param payload  The segment.
+        @param final  Whether this is the last segment, which ends the block early.
+        @return  (first seq, segment count, XOR of the sizes, parity) once the block is complete, otherwise None.
+        """
+        if seq != self.next_seq:
+            return None
+        self.parity ^= int.from_bytes(payload, "little")
+        self.size_xor ^= len(payload)
+        self.max_size = max(self.max_size, len(payload))
+        self.next_seq += 1
+
+        count = self.next_seq - self.block_start
+        if count < self.k and not final:
+            return None
+        block = (self.block_start, count, self.size_xor,
+                 self.parity.to_bytes(self.max_size, "little"))
+        self.start_block()
+        return block
+
+
+class ParityDecoder:
+    """
+    Forward error correction for a receiver: rebuilds the one missing segment of a block from the block's parity segment
+    and the other segments, whether they have already been delivered or are still held back out of order.
+    """
+    k: int
+    first_seq: int
+    # Parity of the blocks that may still need it, by first seq, as (segment count, XOR of the sizes, parity)
+    parities: dict[int, tuple[int, int, int]]
+    # XOR of the segments of the current block that have been delivered so far
+    delivered_block: int
+    delivered_parity: int
+    delivered_size_xor: int
+
+    def __init__(self, k: int, first_seq: int) -> None:
+        """
+        @param k  The number of data segments per parity segment, as agreed with the sender.
+        @param first_seq  The sequence number of the first segment, where the first block starts.
+        """
+        assert k > 0
+        self.k = k
+        self.first_seq = first_seq
+        self.parities = dict()
+        self.delivered_block = first_seq
+        self.delivered_parity = 0
+        self.delivered_size_xor = 0
+
+    def block_of(self, seq: int) -> int:
+        """
+        @param seq  A sequence number.
+        @return  The first seq of the block that contains it.
+        """
+        return seq - (seq - self.first_seq) % self.k
+
+    def add_parity(self, block: int, count: int, size_xor: int, parity: Buffer):
+        """
+        Stores the parity of a block.
+        @param block  The first seq of the block.
+        @param count  The number of segments in the block, which is less than k for the final block.
+        @param size_xor  The XOR of the sizes of the block's segments.
+        @param parity  The XOR of the block's segments.
+        """
+        if block < self.delivered_block or self.block_of(block) != block or not 0 < count <= self.k:
+            return
+        self.parities[block] = (count, size_xor, int.from_bytes(parity, "little"))
+
+    def has_parity(self, seq: int) -> bool:
+        """
+        @param seq  A sequence number.
+        @return  Whether the parity of the block that contains it has arrived.
+        """
+        return self.block_of(seq) in self.parities
+
+    def delivered(self, seq: int, data: Buffer):
+        """
+        Records a segment that has been delivered, which must happen in order.
+        @param seq  The sequence number of the segment.
+        @param data  The segment.
+        """
+        block = self.block_of(seq)
+        if block != self.delivered_block:
+            for old in [old for old in self.parities if old < block]:
+                del self.parities[old]
+            self.delivered_block = block
+            self.delivered_parity = 0
+            self.delivered_size_xor = 0
+        self.delivered_parity ^= int.from_bytes(data, "little")
+        self.delivered_size_xor ^= len(data)
+
+    def repair(self, seq: int, next_seq: int, held: Mapping[int, Buffer]) -> tuple[int, bytes] | None:
+        """
+        Rebuilds the missing segment of the block that contains the given seq, if exactly one is missing.
+        @param seq  Any sequence number in the block.
+        @param next_seq  The next seq to be delivered. Every segment before it must have been passed to delivered().
+        @param held  The segments that have been received but not delivered yet, by seq.
+        @return  (seq, segment) of the rebuilt segment, or None if the block's parity hasn't arrived or it can't be repaired.
+        """
+        block = self.block_of(seq)
+        if block not in self.parities:
+            return None
+        count, size_xor, parity = self.parities[block]
+
+        missing = None
+        for other in range(max(block, next_seq), block + count):
+            if other in held:
+                parity ^= int.from_bytes(held[other], "little")
+                size_xor ^= len(held[other])
+            elif missing is None:
+                missing = other
+            else:
+                return None
+        if missing is None:
+            return None
+        if block < next_seq:
+            parity ^= self.delivered_parity
+            size_xor ^= self.delivered_size_xor
+
+        del self.parities[block]
+        return missing, parity.to_bytes(size_xor, "little")
@@ -0,0 +1,87 @@
+from typing import Callable
+from collections import deque
+from threading import Condition
+from segments import Buffer
+
+
+class DeliveryBuffer:
+    """
+    A bounded queue of received segments between a receiver and its deliverer, which a thread of its own drains.
+    The receiver advertises the free space to the sender as its receive window,
+    so a deliverer that falls behind (a slow disk, a decompressor, a downstream service) slows the sender down
+    instead of making the receiver drop segments that then have to be retransmitted.
+    """
+    capacity: int
+    # Segments waiting to be delivered, including the one being delivered, which still takes up space until the deliverer returns
+    segments: deque[bytes]
+    # Set once the deliverer has requested to stop (or the buffer was closed), after which segments are discarded
+    stopped: bool
+    cond: Condition
+
+    def __init__(self, capacity: int) -> None:
+        """
+        @param capacity  How many segments may wait to be delivered.
+        """
+        assert capacity > 0
+        self.capacity = capacity
+        self.segments = deque()
+        self.stopped = False
+        self.cond = Condition()
+
+    def space(self) -> int:
+        """
+        @return  How many more segments the buffer has room for.
+        """
+        with self.cond:
+            return max(self.capacity - len(self.segments), 0)
+
+    def put(self, segment: Buffer) -> bool:
+        """
+        Queues a copy of a segment, since it may be a view into a reused receive buffer.
+        Never blocks, as the receiver only accepts segments that the window it advertised has room for.
+        @param segment  The segment to deliver.
+        @return  Whether the deliverer still wants more data.
+        """
+        with self.cond:
+            if self.stopped:
+                return False
+            self.segments.append(bytes(segment))
+            self.cond.notify_all()
+            return True
+
+    def drain(self, deliver: Callable[[Buffer], bool], drained: Callable[[], None]):
+        """
+        Blocking function that delivers queued segments in order until the deliverer requests to stop or the buffer is closed.
+        Meant to run on a thread of its own.
+        @param deliver  A callback function that takes a bytes object and returns a bool indicating whether to continue receiving.
+        @param drained  Called after each delivered segment, once its space is free again.
+        """
+        while True:
+            with self.cond:
+                while not self.segments and not self.stopped:
+                    self.cond.wait()
+                if self.stopped:
+                    return
+                segment = self.segments[0]
+            should_continue = deliver(segment)
+            with self.cond:
+                if self.stopped:
+                    # Closed while delivering
+                    return
+                self.segments.popleft()
+                if not should_continue:
+                    self.stopped = True
+                    self.segments.clear()
+                self.cond.notify_all()
+            if not should_continue:
+                return
+            drained()
+
+    def close(self):
+        """
+        Stops draining, discarding whatever hasn't been delivered yet.
+        """
+        with self.cond:
+            self.stopped = True
+            self.segments.clear()
+            self.cond.notify_all()
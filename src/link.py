@@ -0,0 +1,131 @@
+from dataclasses import dataclass
+from collections import deque
+from random import Random
+
+
+@dataclass
+class GilbertElliott:
+    """
+    Gilbert-Elliott burst loss model.
+    The link flips between a good and a bad state, each with its own loss rate, so losses come in bursts.
+    """
+    # Chance of moving from the good to the bad state, per packet
+    p_enter_bad: float
+    # Chance of moving from the bad to the good state, per packet
+    p_leave_bad: float
+    loss_good: float = 0
+    loss_bad: float = 1
+    bad: bool = False
+
+    def lose(self, rng: Random) -> bool:
+        """
+        Advances the model by one packet.
+        @param rng  The random number generator to draw from.
+        @return  Whether the packet is lost.
+        """
+        if rng.random() < (self.p_leave_bad if self.bad else self.p_enter_bad):
+            self.bad = not self.bad
+        return rng.random() < (self.loss_bad if self.bad else self.loss_good)
+
+
+@dataclass
+class RED:
+    """
+    Random Early Detection queue management.
+    Packets are dropped with a probability that grows with the average queue length,
+    which signals congestion to senders before the queue overflows.
+    """
+    # Average queue length (in packets) at which early drops start
+    min_th: float
+    # Average queue length (in packets) at which every packet is dropped
+    max_th: float
+    # Drop probability as the average reaches max_th
+    max_p: float = 0.1
+    # Weight of each new sample in the average queue length
+    weight: float = 0.002
+    avg: float = 0
+    # Packets accepted since the last drop, which spreads drops out evenly
+    count: int = 0
+
+    def drop(self, queue_len: int, rng: Random) -> bool:
+        """
+        Decides whether to drop an arriving packet.
+        @param queue_len  The current queue length, in packets.
+        @param rng  The random number generator to draw from.
+        @return  Whether the packet is dropped.
+        """
+        self.avg += self.weight * (queue_len - self.avg)
+        if self.avg < self.min_th:
+            self.count = 0
+            return False
+        if self.avg >= self.max_th:
+            self.count = 0
+            return True
+
+        self.count += 1
+        p = self.max_p * (self.avg - self.min_th) / (self.max_th - self.min_th)
+        if self.count * p >= 1 or rng.random() < p / (1 - self.count * p):
+            self.count = 0
+            return True
+        return False
+
+
+class Link:
+    """
+    One direction of a bottleneck link: a FIFO queue that is drained at a fixed bandwidth.
+    The queue is modelled by when each queued packet finishes serializing, so no packets are held here.
+    """
+    # Bits per second, or None for no limit
+    bandwidth: float | None
+    # Maximum queued packets (including the one being serialized), or None for no limit
+    queue_limit: int | None
+    red: RED | None
+    burst_loss: GilbertElliott | None
+    # Times at which the queued packets finish serializing, in order
+    departures: deque[float]
+
+    def __init__(self, bandwidth: float | None = None, queue_limit: int | None = None, red: RED | None = None, burst_loss: GilbertElliott | None = None) -> None:
+        """
+        @param bandwidth  The link rate in bits per second, or None for no limit.
+        @param queue_limit  The most packets that can be queued before arrivals are tail dropped, or None for no limit.
+        @param red  Random Early Detection settings, or None to only tail drop.
+        @param burst_loss  A burst loss model, or None for no burst losses.
+        """
+        assert bandwidth is None or bandwidth > 0
+        assert queue_limit is None or queue_limit > 0
+        self.bandwidth = bandwidth
+        self.queue_limit = queue_limit
+        self.red = red
+        self.burst_loss = burst_loss
+        self.departures = deque()
+
+    def lose(self, rng: Random) -> bool:
+        """
+        @param rng  The random number generator to draw from.
+        @return  Whether the burst loss model loses the next packet.
+        """
+        return self.burst_loss is not None and self.burst_loss.lose(rng)
+
+    def enqueue(self, now: float, size: int, rng: Random) -> float | None:
+        """
+        Queues a packet on the link.
+        @param now  The current time, in seconds.
+        @param size  The size of the packet, in bytes.
+        @param rng  The random number generator to draw from.
+        @return  The time at which the packet has been fully sent, or None if it was dropped.
+        """
+        while self.departures and self.departures[0] <= now:
+            self.departures.popleft()
+        queue_len = len(self.departures)
+
+        if self.queue_limit is not None and queue_len >= self.queue_limit:
+            return None
+        if self.red is not None and self.red.drop(queue_len, rng):
+            return None
+
+        if self.bandwidth is None:
+            return now
+        start = self.departures[-1] if self.departures else now
+        departure = start + size * 8 / self.bandwidth
+        self.departures.append(departure)
+        return departure
@@ -0,0 +1,367 @@
+from types import TracebackType
+from typing import Any, Callable, TextIO
+from contextlib import AbstractContextManager
+from threading import Event, Lock, Thread
+import json
+import math
+import time
+
+
+class Observer:
+    """
+    Receives events from senders and receivers.
+    Every method is a no-op, so this class doubles as the default observer that costs next to nothing on the hot path.
+    """
+
+    def segment_sent(self, seq: int, size: int, retransmit: bool):
+        """
+        @param seq  The sequence number of the sent segment.
+        @param size  The payload size, in bytes.
+        @param retransmit  Whether the segment had been sent before.
+        """
+        pass
+
+    def ack_received(self, seq: int, acked_segments: int, acked_bytes: int):
+        """
+        @param seq  The acknowledged sequence number.
+        @param acked_segments  The number of segments newly acknowledged by this ACK.
+        @param acked_bytes  The number of payload bytes newly acknowledged by this ACK.
+        """
+        pass
+
+    def dup_ack(self, seq: int):
+        """
+        @param seq  The sequence number of an ACK that acknowledged nothing new.
+        """
+        pass
+
+    def timeout(self, seq: int):
+        """
+        @param seq  The sequence number whose retransmission timer expired.
+        """
+        pass
+
+    def rtt_sample(self, rtt: float):
+        """
+        @param rtt  A round trip time sample, in seconds.
+        """
+        pass
+
+    def checksum_failure(self):
+        """
+        Called when a packet is discarded because it is malformed or its checksum doesn't match.
+        """
+        pass
+
+    def segment_received(self, seq: int, size: int, in_order: bool):
+        """
+        @param seq  The sequence number of the received segment.
+        @param size  The payload size, in bytes.
+        @param in_order  Whether the segment was the next one expected.
+        """
+        pass
+
+    def segment_delivered(self, seq: int, size: int):
+        """
+        @param seq  The sequence number of the delivered segment.
+        @param size  The payload size, in bytes.
+        """
+        pass
+
+    def parity_sent(self, seq: int, size: int):
+        """
+        @param seq  The sequence number of the first segment covered by the sent parity segment.
+        @param size  The parity size, in bytes.
+        """
+        pass
+
+    def parity_received(self, seq: int, size: int):
+        """
+        @param seq  The sequence number of the first segment covered by the received parity segment.
+        @param size  The parity size, in bytes.
+        """
+        pass
+
+    def segment_recovered(self, seq: int, size: int):
+        """
+        @param seq  The sequence number of a lost segment that was rebuilt from parity instead of being retransmitted.
+        @param size  The payload size, in bytes.
+        """
+        pass
+
+    def window_probe(self, seq: int):
+        """
+        @param seq  The sequence number of a segment sent past the receiver's closed window, to find out when it reopens.
+        """
+        pass
+
+    def window_full(self, seq: int):
+        """
+        @param seq  The sequence number of a segment the receiver dropped since its delivery buffer had no room for it.
+        """
+        pass
+
+
+class Histogram:
+    """A histogram with logarithmic buckets, each a quarter of a power of two wide (about 19%)."""
+    # Buckets per power of two
+    RESOLUTION = 4
+    buckets: dict[float, int]
+    count: int
+    total: float
+    min: float
+    max: float
+
+    def __init__(self) -> None:
+        self.buckets = dict()
+        self.count = 0
+        self.total = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def record(self, value: float):
+        """
+        @param value  The value to record.
+        """
+        bucket = math.floor(math.log2(value) * self.RESOLUTION) if value > 0 else -math.inf
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float | None:
+        """
+        @param q  The quantile, between 0 and 1.
+        @return  The upper bound of the bucket containing the quantile, or None if nothing has been recorded.
+        """
+        if self.count == 0:
+            return None
+        target = q * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= target:
+                return min(2 ** ((bucket + 1) / self.RESOLUTION), self.max)
+        return self.max
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        @return  A summary of the recorded values.
+        """
+        if self.count == 0:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": self.total / self.count,
+            "min": self.min,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+class Metrics(Observer):
+    """Observer that keeps counters and histograms of everything it observes."""
+    counters: dict[str, int]
+    rtt: Histogram
+    # Goodput (acknowledged or delivered payload bits per second) measured at each tick
+    goodput: Histogram
+    started: float
+    last_tick: float
+    last_good_bytes: int
+    lock: Lock
+
+    def __init__(self) -> None:
+        self.counters = dict.fromkeys([
+            "segments_sent", "bytes_sent", "retransmits",
+            "acks_received", "dup_acks", "segments_acked", "bytes_acked",
+            "timeouts", "checksum_failures",
+            "segments_received", "out_of_order", "segments_delivered", "bytes_delivered",
+            "parity_sent", "parity_received", "segments_recovered",
+            "window_probes", "window_drops",
+        ], 0)
+        self.rtt = Histogram()
+        self.goodput = Histogram()
+        self.started = time.time()
+        self.last_tick = self.started
+        self.last_good_bytes = 0
+        # Senders call in from their event loop and their receiver thread
+        self.lock = Lock()
+
+    def count(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def segment_sent(self, seq: int, size: int, retransmit: bool):
+        with self.lock:
+            self.counters["segments_sent"] += 1
+            self.counters["bytes_sent"] += size
+            if retransmit:
+                self.counters["retransmits"] += 1
+
+    def ack_received(self, seq: int, acked_segments: int, acked_bytes: int):
+        with self.lock:
+            self.counters["acks_received"] += 1
+            self.counters["segments_acked"] += acked_segments
+            self.counters["bytes_acked"] += acked_bytes
+
+    def dup_ack(self, seq: int):
+        with self.lock:
+            self.counters["acks_received"] += 1
+            self.counters["dup_acks"] += 1
+
+    def timeout(self, seq: int):
+        self.count("timeouts")
+
+    def rtt_sample(self, rtt: float):
+        with self.lock:
+            self.rtt.record(rtt)
+
+    def checksum_failure(self):
+        self.count("checksum_failures")
+
+    def segment_received(self, seq: int, size: int, in_order: bool):
+        with self.lock:
+            self.counters["segments_received"] += 1
+            if not in_order:
+                self.counters["out_of_order"] += 1
+
+    def segment_delivered(self, seq: int, size: int):
+        with self.lock:
+            self.counters["segments_delivered"] += 1
+            self.counters["bytes_delivered"] += size
+
+    def parity_sent(self, seq: int, size: int):
+        self.count("parity_sent")
+
+    def parity_received(self, seq: int, size: int):
+        self.count("parity_received")
+
+    def segment_recovered(self, seq: int, size: int):
+        self.count("segments_recovered")
+
+    def window_probe(self, seq: int):
+        self.count("window_probes")
+
+    def window_full(self, seq: int):
+        self.count("window_drops")
+
+    def tick(self):
+        """
+        Records the goodput since the previous tick.
+        """
+        with self.lock:
+            now = time.time()
+            good_bytes = self.counters["bytes_acked"] + \
+                self.counters["bytes_delivered"]
+            if now > self.last_tick:
+                self.goodput.record(
+                    (good_bytes - self.last_good_bytes) * 8 / (now - self.last_tick))
+            self.last_tick = now
+            self.last_good_bytes = good_bytes
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        @return  The current counters and histogram summaries.
+        """
+        with self.lock:
+            return {
+                "time": time.time(),
+                "elapsed": time.time() - self.started,
+                **self.counters,
+                "rtt": self.rtt.snapshot(),
+                "goodput_bps": self.goodput.snapshot(),
+            }
+
+
+def format_summary(snapshot: dict[str, Any]) -> str:
+    """
+    @param snapshot  A Metrics snapshot.
+    @return  A one line human readable summary.
+    """
+    parts = [f"[{snapshot['elapsed']:.1f}s]"]
+    if snapshot["segments_sent"]:
+        parts.append(f"sent={snapshot['segments_sent']} retx={snapshot['retransmits']} "
+                     f"acked={snapshot['bytes_acked']}B dupacks={snapshot['dup_acks']} timeouts={snapshot['timeouts']}")
+        if snapshot["parity_sent"]:
+            parts.append(f"parity={snapshot['parity_sent']}")
+        if snapshot["window_probes"]:
+            parts.append(f"probes={snapshot['window_probes']}")
+    if snapshot["segments_received"]:
+        parts.append(f"recv={snapshot['segments_received']} ooo={snapshot['out_of_order']} "
+                     f"delivered={snapshot['bytes_delivered']}B")
+        if snapshot["parity_received"]:
+            parts.append(f"parity={snapshot['parity_received']} recovered={snapshot['segments_recovered']}")
+        if snapshot["window_drops"]:
+            parts.append(f"window_drops={snapshot['window_drops']}")
+    parts.append(f"bad={snapshot['checksum_failures']}")
+    if snapshot["rtt"]["count"]:
+        parts.append(f"rtt_p50={snapshot['rtt']['p50'] * 1000:.1f}ms")
+    if snapshot["goodput_bps"]["count"]:
+        parts.append(f"goodput_mean={snapshot['goodput_bps']['mean'] / 1000:.1f}kbps")
+    return " ".join(parts)
+
+
+def print_summary(snapshot: dict[str, Any]):
+    """
+    Prints a one line summary of a Metrics snapshot.
+    @param snapshot  A Metrics snapshot.
+    """
+    print(format_summary(snapshot))
+
+
+class JSONLinesWriter:
+    """Writes Metrics snapshots to a file as JSON lines."""
+    file: TextIO
+
+    def __init__(self, file: TextIO) -> None:
+        """
+        @param file  The file to write to.
+        """
+        self.file = file
+
+    def __call__(self, snapshot: dict[str, Any]):
+        self.file.write(json.dumps(snapshot) + "\n")
+        self.file.flush()
+
+
+class PeriodicExporter(AbstractContextManager):
+    """Exports Metrics snapshots from a background thread at a fixed interval, and once more when stopped."""
+    metrics: Metrics
+    interval: float
+    export: Callable[[dict[str, Any]], Any]
+    stop_event: Event
+    thread: Thread | None
+
+    def __init__(self, metrics: Metrics, interval: float, export: Callable[[dict[str, Any]], Any] = print_summary) -> None:
+        """
+        @param metrics  The metrics to export.
+        @param interval  The time between exports, in seconds.
+        @param export  Called with each snapshot, e.g. print_summary or a JSONLinesWriter.
+        """
+        assert interval > 0
+        self.metrics = metrics
+        self.interval = interval
+        self.export = export
+        self.stop_event = Event()
+        self.thread = None
+
+    def __enter__(self) -> "PeriodicExporter":
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, exc_value: BaseException | None, traceback: TracebackType | None) -> bool | None:
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+        return False
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.metrics.tick()
+            self.export(self.metrics.snapshot())
+        self.metrics.tick()
+        self.export(self.metrics.snapshot())
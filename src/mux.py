@@ -0,0 +1,161 @@
+from types import TracebackType
+from typing import Any, Callable, Tuple
+from socket import socket, AF_INET, SOCK_DGRAM as SOCK_UDP, timeout
+from contextlib import AbstractContextManager
+from queue import Queue, Empty, Full
+from threading import Event, Lock, Thread
+from cfg import BUF_SIZE
+from codec import decode_data_packet, peek_conn_id
+from rdt import GoBackNClient
+import time
+
+
+class ConnectionClient(GoBackNClient):
+    """
+    One connection of a ConnectionListener.
+    Receives the datagrams the listener routes to it, and replies to the address the peer last sent from.
+    """
+    listener: "ConnectionListener"
+    conn_id: int
+    addr: Tuple[str, int]
+    inbox: Queue[bytes]
+
+    def __init__(self, listener: "ConnectionListener", conn_id: int, addr: Tuple[str, int], timeout: float, queue_size: int) -> None:
+        """
+        @param listener  The listener that owns the socket.
+        @param conn_id  The ID of the connection.
+        @param addr  The peer's address.
+        @param timeout  The timeout for receiving packets, in seconds.
+        @param queue_size  How many datagrams can wait to be received before new ones are dropped.
+        """
+        super().__init__(timeout)
+        self.listener = listener
+        self.conn_id = conn_id
+        self.addr = addr
+        self.inbox = Queue(queue_size)
+
+    def send(self, payload: bytes | bytearray | memoryview):
+        self.listener.sock.sendto(payload, self.addr)
+
+    def recv(self, timeout: float | None = None) -> bytes | None:
+        try:
+            return self.inbox.get(timeout=self.timeout if timeout is None else timeout)
+        except Empty:
+            return None
+
+
+class ConnectionListener(AbstractContextManager):
+    """
+    Serves many connections on a single UDP port by routing datagrams on their connection ID.
+    Each new connection is passed to the handler on a thread of its own, and is closed when the handler returns.
+    """
+    sock: socket
+    handler: Callable[[ConnectionClient], Any]
+    timeout: float
+    time_wait: float
+    queue_size: int
+    connections: dict[int, ConnectionClient]
+    # Close times of finished connections, whose stray retransmissions are ignored rather than starting new connections
+    closed: dict[int, float]
+    lock: Lock
+    close_event: Event
+    listen_thread: Thread | None
+
+    def __init__(
+            self,
+            host: str,
+            port: int,
+            handler: Callable[[ConnectionClient], Any],
+            timeout: float = 10,
+            time_wait: float = 30,
+            queue_size: int = 1024,
+    ) -> None:
+        """
+        @param host  The interface to bind to.
+        @param port  The port to bind to.
+        @param handler  Called with the client of each new connection. Runs on its own thread.
+        @param timeout  The timeout for receiving packets on each connection, in seconds.
+        @param time_wait  How long a finished connection's ID is remembered, in seconds.
+        @param queue_size  How many datagrams each connection can have waiting before new ones are dropped.
+        """
+        self.sock = socket(AF_INET, SOCK_UDP)
+        self.sock.settimeout(1.0)
+        self.sock.bind((host, port))
+        self.handler = handler
+        self.timeout = timeout
+        self.time_wait = time_wait
+        self.queue_size = queue_size
+        self.connections = dict()
+        self.closed = dict()
+        self.lock = Lock()
+        self.close_event = Event()
+        self.listen_thread = None
+
+    def __enter__(self) -> "ConnectionListener":
+        self.listen_thread = Thread(target=self.listen)
+        self.listen_thread.start()
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, exc_value: BaseException | None, traceback: TracebackType | None) -> bool | None:
+        self.close()
+        if self.listen_thread:
+            self.listen_thread.join()
+        return False
+
+    def listen(self):
+        """
+        Receives datagrams and routes them to their connections until the listener is closed.
+        Blocks, so either call it directly or use the listener as a context manager to run it on a thread.
+        """
+        while not self.close_event.is_set():
+            try:
+                packet, addr = self.sock.recvfrom(BUF_SIZE)
+            except timeout:
+                continue
+            except OSError:
+                # Socket is no longer valid
+                break
+            self.route(packet, addr)
+
+    def route(self, packet: bytes, addr: Tuple[str, int]):
+        """
+        Hands a datagram to its connection, starting a new connection for an unknown ID.
+        @param packet  The received datagram.
+        @param addr  The address it was received from.
+        """
+        conn_id = peek_conn_id(packet)
+        if conn_id is None:
+            return
+        with self.lock:
+            client = self.connections.get(conn_id)
+            if client is None:
+                # Only open connections for intact data packets of IDs that aren't winding down
+                if time.time() - self.closed.get(conn_id, 0) < self.time_wait or decode_data_packet(packet) is None:
+                    return
+                client = ConnectionClient(
+                    self, conn_id, addr, self.timeout, self.queue_size)
+                self.connections[conn_id] = client
+                Thread(target=self.run_handler, args=(client,)).start()
+            client.addr = addr
+        try:
+            client.inbox.put_nowait(packet)
+        except Full:
+            pass
+
+    def run_handler(self, client: ConnectionClient):
+        try:
+            self.handler(client)
+        finally:
+            with self.lock:
+                del self.connections[client.conn_id]
+                now = time.time()
+                self.closed = {conn_id: closed_at for conn_id, closed_at in self.closed.items()
+                               if now - closed_at < self.time_wait}
+                self.closed[client.conn_id] = now
+
+    def close(self):
+        """
+        Stops listening and closes the socket. Handlers that are still running lose their connection.
+        """
+        self.close_event.set()
+        self.sock.close()
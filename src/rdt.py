@@ -1,10 +1,207 @@
-from typing import Callable
-import zlib
-from UDPDuplex import UDPDuplex, JoinedUDPHandle
+from typing import Any, BinaryIO, Callable, Iterable, Iterator
+from UDPDuplex import UDPDuplex, JoinedUDPHandle, BufferPool
+from compression import CODECS, COMPRESS_CHUNK, compress_segments
+from codec import HEADER_SIZE, MAX_DATAGRAM, MAX_WINDOW, PARITY_HEADER, PacketEncoder, encode_data_packet, decode_data_packet, encode_ack_packet, decode_ack_packet, encode_parity_packet, decode_parity_packet, encode_options, decode_options
+from congestion import CongestionControl, FixedRateControl
+from delta import SIGNATURE, SIGNATURE_CHUNK, DeltaEncoder, Signatures, as_buffer, decode_signature_chunk, pack_segments
+from fec import ParityEncoder, ParityDecoder
+from flow import DeliveryBuffer
+from metrics import Observer
+from segments import Buffer, SegmentBuffer, iter_segments
+import io
 import sched
 import time
-from asyncio import Event
-from threading import Thread
+from threading import Thread, Lock, Event
+
+
+# Largest payload that fits in a single UDP datagram over IPv4
+MAX_MSS = MAX_DATAGRAM - HEADER_SIZE
+# Largest payload that fits in a typical 1500 byte Ethernet MTU after IPv4 and UDP headers
+DEFAULT_MSS = 1500 - 20 - 8 - HEADER_SIZE
+# Longest wait between zero window probes, in seconds
+MAX_PROBE_INTERVAL = 60
+# How often a receiver with a delivery buffer checks whether its deliverer has stopped, in seconds
+FLOW_POLL_INTERVAL = 0.1
+
+
+class SeqSpace:
+    """
+    A sequence number space of a fixed number of bits, compared with serial number arithmetic (RFC 1982).
+    Senders and receivers count with unbounded ints and only wrap sequence numbers on the wire.
+    Received sequence numbers are unwrapped to the value closest to a reference point,
+    which is unambiguous as long as windows are smaller than half of the space.
+    """
+    bits: int
+    modulus: int
+
+    def __init__(self, bits: int = 32) -> None:
+        """
+        @param bits  The number of bits in a sequence number, at most 32 to fit the packet formats.
+        """
+        assert 1 < bits <= 32
+        self.bits = bits
+        self.modulus = 2**bits
+
+    def wrap(self, seq: int) -> int:
+        """
+        @param seq  An unbounded sequence number.
+        @return  The sequence number as sent on the wire.
+        """
+        return seq % self.modulus
+
+    def diff(self, a: int, b: int) -> int:
+        """
+        Computes the signed serial distance from b to a.
+        @param a  A wrapped or unbounded sequence number.
+        @param b  A wrapped or unbounded sequence number.
+        @return  The distance, in [-modulus/2, modulus/2).
+        """
+        d = (a - b) % self.modulus
+        return d - self.modulus if d >= self.modulus // 2 else d
+
+    def unwrap(self, seq: int, ref: int) -> int:
+        """
+        @param seq  A sequence number received on the wire.
+        @param ref  The unbounded sequence number the received one is expected to be near.
+        @return  The unbounded sequence number closest to ref that wraps to seq.
+        """
+        return ref + self.diff(seq, ref)
+
+    def max_window(self) -> int:
+        """
+        @return  The largest window that keeps unwrapping unambiguous.
+        """
+        return self.modulus // 2 - 1
+
+
+class WakeableScheduler(sched.scheduler):
+    """
+    A sched.scheduler whose sleeps are cut short whenever an event is entered.
+    This lets events scheduled from another thread (e.g. a receiver thread) run on time
+    instead of waiting for whatever the scheduler was already sleeping on.
+    """
+    wake: Event
+
+    def __init__(self) -> None:
+        self.wake = Event()
+        super().__init__(time.time, self.delay)
+
+    def delay(self, duration: float):
+        """
+        Sleeps for the given duration or until an event is entered.
+        @param duration  The maximum time to sleep, in seconds.
+        """
+        self.wake.wait(duration)
+        self.wake.clear()
+
+    def enterabs(self, *args: Any, **kwargs: Any) -> sched.Event:
+        ev = super().enterabs(*args, **kwargs)
+        self.wake.set()
+        return ev
+
+
+class RTTEstimator:
+    """
+    Round trip time estimator that derives the retransmission timeout (RFC 6298).
+    """
+    # Gains for the smoothed RTT and RTT variance
+    alpha: float = 1 / 8
+    beta: float = 1 / 4
+    k: float = 4
+
+    srtt: float | None
+    rttvar: float | None
+    rto: float
+    min_rto: float
+    max_rto: float
+    backoffs: int
+    last_sample: float | None
+
+    def __init__(self, initial_rto: float = 1, min_rto: float = 0.2, max_rto: float = 60) -> None:
+        """
+        @param initial_rto  The timeout to use before any RTT has been sampled, in seconds.
+        @param min_rto  The lower bound on the timeout, in seconds.
+        @param max_rto  The upper bound on the timeout, including backoff, in seconds.
+        """
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial_rto
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.backoffs = 0
+        self.last_sample = None
+
+    def sample(self, rtt: float):
+        """
+        Updates the estimate with a new RTT measurement and recomputes the timeout.
+        Must only be called with samples from segments that were not retransmitted.
+        @param rtt  The measured round trip time, in seconds.
+        """
+        if self.srtt is None or self.rttvar is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.beta) * self.rttvar + \
+                self.beta * abs(self.srtt - rtt)
+            self.srtt = (1 - self.alpha) * self.srtt + self.alpha * rtt
+        self.last_sample = rtt
+        self.backoffs = 0
+        self.rto = min(max(self.srtt + self.k * self.rttvar,
+                       self.min_rto), self.max_rto)
+
+    def backoff(self):
+        """
+        Doubles the timeout after a retransmission timeout (exponential backoff).
+        """
+        self.backoffs += 1
+        self.rto = min(self.rto * 2, self.max_rto)
+
+
+class SendTimes:
+    """
+    Send times of a Go-Back-N sender's segments for RTT sampling, with constant work per send and per ACK however large the window.
+    The times are kept in a ring indexed like the segment buffer's, and retransmissions are tracked by a single boundary
+    rather than per segment, since Go-Back-N only ever resends from the window base up.
+    """
+    # Send times of the segments up to highest_sent, which is only ever one window ahead of the base
+    times: list[float]
+    # The highest seq that has been sent, which bounds valid ACKs even if the window shrinks
+    highest_sent: int
+    # The highest seq that has been sent more than once. ACKs up to it are never sampled since they're ambiguous (Karn's rule).
+    karn_seq: int
+
+    def __init__(self, size: int, first_seq: int) -> None:
+        """
+        @param size  The size of the ring, which must cover every segment that can be in flight (the window plus one).
+        @param first_seq  The sequence number of the first segment.
+        """
+        self.times = [0.0] * size
+        self.highest_sent = first_seq - 1
+        self.karn_seq = first_seq - 1
+
+    def sent(self, seq: int, now: float) -> bool:
+        """
+        Records that a segment was sent.
+        @param seq  The sequence number of the segment.
+        @param now  The time it was sent.
+        @return  Whether it was a retransmission.
+        """
+        if seq <= self.highest_sent:
+            self.karn_seq = max(self.karn_seq, seq)
+            return True
+        self.times[seq % len(self.times)] = now
+        self.highest_sent = seq
+        return False
+
+    def rtt(self, ack_seq: int, now: float) -> float | None:
+        """
+        @param ack_seq  A new cumulative ACK, which must be at most highest_sent.
+        @param now  The time it arrived.
+        @return  The RTT of the acknowledged segment, or None if it was retransmitted and so gives no sample.
+        """
+        if ack_seq <= self.karn_seq:
+            return None
+        return now - self.times[ack_seq % len(self.times)]
 
 
 class GoBackNClient:
@@ -14,43 +211,70 @@ class GoBackNClient:
     def __init__(self, timeout: float | None) -> None:
         self.timeout = timeout
 
-    def send(self, payload: bytes):
+    def send(self, payload: Buffer):
         """
         Sends a payload to the remote endpoint.
+        The payload may be a view into a reused buffer, so it must not be retained after returning.
         @param payload  The bytes to send.
         """
         raise NotImplementedError()
 
-    def recv(self) -> bytes | None:
+    def recv(self, timeout: float | None = None) -> Buffer | None:
         """
         Receives a payload from the remote endpoint.
-        @return  The received bytes, or None if timed out.
+        @param timeout  How long to wait in seconds, or None to wait for the client's timeout.
+        @return  The received bytes, or None if timed out. May be a view into a pooled buffer that is reused by later receives.
         """
         raise NotImplementedError()
 
+    def time(self) -> float:
+        """
+        @return  The current time in seconds, which senders time their segments with.
+        """
+        return time.time()
+
+    def create_scheduler(self) -> sched.scheduler:
+        """
+        @return  A scheduler for a sender's events, running on the same clock as time().
+        """
+        return WakeableScheduler()
+
+    def listen(self, on_packet: Callable[[Buffer], Any] | None) -> bool:
+        """
+        Asks the client to pass received payloads to a callback instead of returning them from recv().
+        Clients that can't do so return False, and callers then call recv() from a thread of their own instead.
+        @param on_packet  Called with each received payload, or None to stop.
+        @return  Whether the client will call on_packet.
+        """
+        return False
+
 
 class UDPDuplexGoBackNClient(GoBackNClient):
     """Go-Back-N client implementation over UDPDuplex"""
     duplex: UDPDuplex
     handle: JoinedUDPHandle
 
-    def __init__(self, duplex: UDPDuplex, timeout: float | None) -> None:
+    def __init__(self, duplex: UDPDuplex, timeout: float | None, pool_size: int = 8) -> None:
         """
         @param duplex  The UDPDuplex instance to use for communication.
         @param timeout  The timeout for receiving packets, in seconds.
+        @param pool_size  How many preallocated receive buffers to cycle through.
         """
         super().__init__(timeout)
         self.duplex = duplex
-        self.handle = duplex.create_handle()
+        self.handle = duplex.create_handle(pool=BufferPool(pool_size))
         self.handle.sock.settimeout(timeout)
 
-    def send(self, payload: bytes):
+    def send(self, payload: Buffer):
         self.handle.send(payload)
 
-    def recv(self) -> bytes | None:
+    def recv(self, timeout: float | None = None) -> Buffer | None:
+        self.handle.sock.settimeout(
+            self.timeout if timeout is None else timeout)
         try:
             return self.handle.listen_once()
-        except TimeoutError:
+        except (TimeoutError, BlockingIOError):
+            # A zero timeout makes the socket non-blocking
             return None
 
 
@@ -60,136 +284,648 @@ class GoBackNSender:
     n: int
     curr_seq: int
     seq_max: int
-    buf: list[bytes]
+    next_seq: int
+    buf: SegmentBuffer
+    rtt: RTTEstimator
+    cc: CongestionControl
+    mss: int
+    negotiate: bool
+    seq_space: SeqSpace
+    conn_id: int
+    encoder: PacketEncoder
+    observer: Observer
+    # Duplicate ACKs of the window base that trigger a fast retransmit
+    dup_ack_threshold: int
+    # Segments per parity segment, or None without forward error correction
+    fec: int | None
+    # The codec that compresses queued data (see compression.CODECS), or None to send it as is
+    compress: str | None
+    compress_level: int
+    # Identifies the pushed data so an interrupted transfer of it can be resumed, or None
+    resume_id: str | None
+    # Bytes at the start of the pushed data that the receiver already has, which are yet to be skipped
+    skip: int
+    # Identifies the pushed data so the receiver can offer an older version of it to send a delta against, or None
+    delta_id: str | None
+    # The block size and block count of the receiver's older version, once it has offered one in the handshake
+    delta_basis: tuple[int, int] | None
+    # Encodes the pushed data against the signatures of the receiver's older version, once they've been fetched
+    delta: DeltaEncoder | None
+    # The highest seq the receiver has advertised room for, or None if it doesn't advertise a receive window
+    peer_window_end: int | None
+    # Timeouts in a row, once the end of the data has been sent, after which the receiver is assumed to have finished
+    # and gone away with only its final ACKs lost
+    final_retries: int = 5
 
-    def __init__(self, client: GoBackNClient, n: int) -> None:
+    def __init__(
+            self,
+            client: GoBackNClient,
+            n: int,
+            rtt: RTTEstimator | None = None,
+            cc: CongestionControl | None = None,
+            mss: int = DEFAULT_MSS,
+            negotiate: bool = False,
+            first_seq: int = 1,
+            seq_bits: int = 32,
+            conn_id: int = 0,
+            observer: Observer | None = None,
+            dup_ack_threshold: int = 3,
+            fec: int | None = None,
+            compress: str | None = None,
+            compress_level: int = 6,
+            resume_id: str | None = None,
+            delta_id: str | None = None,
+    ) -> None:
         """
         @param client  The GoBackNClient instance to use for communication.
-        @param n  The window size for the Go-Back-N protocol.
+        @param n  The maximum window size for the Go-Back-N protocol.
+        @param rtt  The RTT estimator that drives retransmission timeouts. Can be inspected while the sender runs.
+        @param cc  The congestion controller that sizes the window and paces sends. Defaults to a fixed 500 bps pacer.
+        @param mss  The maximum segment size (payload bytes per packet).
+        @param negotiate  Whether to negotiate options (such as the MSS) with the receiver before sending.
+        @param first_seq  The sequence number of the first segment. Must match the receiver's.
+        @param seq_bits  The size of the sequence number space in bits. Must match the receiver's.
+        @param conn_id  The connection ID stamped on every packet, which lets a receiver serve many senders on one port.
+        @param observer  Receives per-packet events, such as a metrics.Metrics instance. Defaults to a no-op observer.
+        @param dup_ack_threshold  How many duplicate ACKs of the window base to wait for before resending the window, rather than resending on the first one,
+                                  since reordered packets cause a few duplicates too.
+        @param fec  Send an XOR parity segment after every this many segments, so the receiver can rebuild a lost segment without a retransmission.
+                    Requires negotiate, since the receiver learns the block size from the handshake.
+        @param compress  The codec to compress queued data with, if the receiver agrees to it during the handshake. Requires negotiate.
+        @param compress_level  The compression level, from 0 (fastest) to 9 (smallest) for zlib.
+        @param resume_id  Identifies the data that will be pushed, such as resume.file_id() of a file.
+                          If the receiver already has the start of the same data from an interrupted transfer, it's skipped. Requires negotiate.
+        @param delta_id  Identifies the data that will be pushed, such as resume.file_id() of a file. If the receiver has an older version of it,
+                         it sends the signatures of its blocks during the handshake, and only the parts of the data it doesn't have are sent,
+                         as a delta stream for delta.DeltaFile. Pushes are encoded together, so the data should be pushed in one go. Requires negotiate.
         """
-        assert n > 0
+        self.seq_space = SeqSpace(seq_bits)
+        assert 0 < n <= self.seq_space.max_window()
+        assert dup_ack_threshold > 0
+        assert fec is None or (fec > 0 and negotiate), "FEC is set up during the handshake"
+        assert compress is None or (compress in CODECS and negotiate), "Compression is set up during the handshake"
+        assert resume_id is None or negotiate, "Resuming is set up during the handshake"
+        assert delta_id is None or negotiate, "Delta transfers are set up during the handshake"
+        # Parity packets carry a small header on top of a full segment
+        assert fec is None or mss <= MAX_MSS - PARITY_HEADER.size
+        assert 0 < mss <= MAX_MSS
         self.client = client
         self.n = n
-        self.curr_seq = 1
+        self.curr_seq = first_seq
         self.seq_max = self.curr_seq + self.n
-        self.buf = list()
+        self.next_seq = self.curr_seq
+        # One extra slot so the sender can look one segment past a full window for the end of the data
+        self.buf = SegmentBuffer(n + 1, self.curr_seq)
+        self.rtt = rtt if rtt is not None else RTTEstimator()
+        self.cc = cc if cc is not None else FixedRateControl(500)
+        self.mss = mss
+        self.negotiate = negotiate
+        self.conn_id = conn_id
+        # Only sized for segments, see create_packet()
+        self.encoder = PacketEncoder(mss, conn_id)
+        self.observer = observer if observer is not None else Observer()
+        self.dup_ack_threshold = dup_ack_threshold
+        self.fec = fec
+        self.compress = compress
+        self.compress_level = compress_level
+        self.resume_id = resume_id
+        self.skip = 0
+        self.delta_id = delta_id
+        self.delta_basis = None
+        self.delta = None
+        self.peer_window_end = None
 
-    def create_packet(self, data: bytes, seq_num: int | None = None) -> bytes:
+    def create_packet(self, data: Buffer, seq_num: int | None = None) -> memoryview:
         """
-        Creates a packet with the given data and sequence number.
-        @param data  The data payload for the packet.
+        Creates a packet for a segment in the sender's reusable buffer, which only has room for segments of up to the MSS the sender was created with.
+        Packets that aren't segments, such as the SYN, are created with create_control_packet().
+        @param data  The data payload for the packet, at most the MSS.
         @param seq_num  The sequence number for the packet. If None, uses the current sequence number.
-        @return  The encoded packet as bytes.
+        @return  The encoded packet, which is only valid until the next packet is created.
         """
-        # Packet format: <checksum(4 bytes)><seq_num(4 bytes)><data_size(4 bytes)><data(data_size bytes)>
         if seq_num is None:
             seq_num = self.curr_seq
+        return self.encoder.data(self.seq_space.wrap(seq_num), data)
 
-        assert seq_num < 2**32
-        seq_bytes = seq_num.to_bytes(4, byteorder="big")
-
-        assert len(data) < 2**32
-        data_size = len(data).to_bytes(4, byteorder="big")
-
-        dat = seq_bytes + data_size + data
-        checksum = zlib.crc32(dat).to_bytes(4, byteorder="big")
-
-        return checksum + dat
+    def create_control_packet(self, data: Buffer, seq_num: int) -> bytes:
+        """
+        Creates a data packet that isn't a segment of the pushed data, such as the SYN, in a buffer of its own,
+        since its payload isn't bounded by the MSS.
+        @param data  The data payload for the packet, at most MAX_MSS.
+        @param seq_num  The sequence number for the packet.
+        @return  The encoded packet.
+        """
+        assert len(data) <= MAX_MSS, f"A {len(data)} byte payload doesn't fit in a datagram"
+        return encode_data_packet(self.seq_space.wrap(seq_num), data, self.conn_id)
 
-    def decode_ack_packet(self, packet: bytes) -> int | None:
+    def decode_ack_packet(self, packet: Buffer) -> tuple[int, int | None] | None:
         """
         Decodes an ACK packet and returns the acknowledged sequence number.
         @param packet  The received ACK packet.
-        @return  The acknowledged sequence number, or None if the packet is invalid.
+        @return  A tuple of (acknowledged sequence number unwrapped relative to the window base, advertised receive window or None),
+                 or None if the packet is invalid or belongs to another connection.
         """
-        if len(packet) != 8:
+        res = decode_ack_packet(packet)
+        if res is None or res[0] != self.conn_id:
             return None
+        return self.seq_space.unwrap(res[1], self.curr_seq), res[2]
 
-        recv_checksum = int.from_bytes(packet[0:4], byteorder="big")
-        seq_num = int.from_bytes(packet[4:8], byteorder="big")
-
-        computed_checksum = zlib.crc32(packet[4:8])
-        if recv_checksum != computed_checksum:
+    def decode_data_packet(self, packet: Buffer) -> tuple[int, memoryview] | None:
+        """
+        Decodes a data packet sent by the receiver, which it only does to answer a handshake.
+        @param packet  The received data packet.
+        @return  A tuple of (sequence number unwrapped relative to the window base, view of the data), or None if the packet is invalid or belongs to another connection.
+        """
+        res = decode_data_packet(packet)
+        if res is None or res[0] != self.conn_id:
             return None
+        return self.seq_space.unwrap(res[1], self.curr_seq), res[2]
 
-        return seq_num
-
-    def push(self, data: bytes):
+    def push(self, data: Buffer | BinaryIO | Iterable[Buffer]):
         """
         Queues data to be sent by the sender.
-        Splits data into chunks of maximum 64 bytes.
-        @param data  The data bytes to queue.
+        Data is split into chunks of at most the MSS lazily, as the window reaches it,
+        so only the unacknowledged window is held in memory.
+        Pushing an empty buffer queues a single empty segment.
+        With compression, each push is compressed as a separate stream.
+        @param data  A buffer, a binary file object (read from its current position), or an iterable of buffers.
         """
-        max_len = 64
-        if len(data) < max_len:
-            self.buf.append(data)
+        self.buf.push(self.segments(data))
+
+    def segments(self, data: Buffer | BinaryIO | Iterable[Buffer]) -> Iterator[Buffer]:
+        """
+        Lazily splits pushed data into segments, skipping what the receiver already has and compressing the rest if the receiver agreed to it.
+        In a delta transfer, the data is encoded against the receiver's older version of it first.
+        Nothing is decided until the first segment is needed, which is after the handshake.
+        @param data  The pushed data.
+        @return  An iterator over the segments.
+        """
+        if self.delta is not None:
+            # The whole push is needed to find blocks the receiver has anywhere in it
+            data = as_buffer(data)
+            if len(data) > 0:
+                data = pack_segments(self.delta.encode(data), lambda: self.mss if self.compress is None else COMPRESS_CHUNK)
+        if self.skip > 0 and hasattr(data, "seekable") and data.seekable():  # type: ignore
+            # Files are skipped without reading them
+            file: BinaryIO = data  # type: ignore
+            start = file.tell()
+            skipped = min(self.skip, file.seek(0, io.SEEK_END) - start)
+            file.seek(start + skipped)
+            self.skip -= skipped
+        chunks = iter_segments(data, lambda: self.mss if self.compress is None else COMPRESS_CHUNK)
+        if self.skip > 0:
+            chunks = self.skip_segments(chunks)
+        if self.compress is None:
+            yield from chunks
         else:
-            payloads = [data[i:i+max_len]
-                        for i in range(0, len(data), max_len)]
-            self.buf += payloads
+            yield from compress_segments(chunks, lambda: self.mss,
+                                         CODECS[self.compress], self.compress_level)
+
+    def skip_segments(self, segments: Iterator[Buffer]) -> Iterator[Buffer]:
+        """
+        Drops the bytes that are yet to be skipped from the start of the segments.
+        Empty segments aren't data, so they're kept.
+        @param segments  The segments.
+        @return  An iterator over the rest of the segments.
+        """
+        for segment in segments:
+            if self.skip > 0 and len(segment) > 0:
+                skipped = min(self.skip, len(segment))
+                self.skip -= skipped
+                if skipped == len(segment):
+                    continue
+                segment = memoryview(segment).cast("B")[skipped:]
+            yield segment
+
+    def options(self) -> dict[str, Any]:
+        """
+        @return  The connection options this sender proposes during the handshake.
+        """
+        options: dict[str, Any] = {"mss": self.mss}
+        if self.fec is not None:
+            options["fec"] = self.fec
+        if self.compress is not None:
+            options["compress"] = self.compress
+        if self.resume_id is not None:
+            options["resume"] = self.resume_id
+        if self.delta_id is not None:
+            options["delta"] = self.delta_id
+        return options
+
+    def apply_options(self, options: dict[str, Any]):
+        """
+        Applies the options the receiver agreed to during the handshake.
+        @param options  The options from the receiver's handshake reply.
+        """
+        mss = options.get("mss")
+        if isinstance(mss, int) and 0 < mss < self.mss:
+            # Queued data hasn't been split yet, so it will be cut with the new MSS
+            self.mss = mss
+        if options.get("fec") != self.fec:
+            # The receiver doesn't decode parity (or agreed to something else)
+            self.fec = None
+        if options.get("compress") != self.compress:
+            # The receiver can't decompress this codec, so the data is sent as is
+            self.compress = None
+        skip = options.get("resume")
+        if self.resume_id is not None and isinstance(skip, int) and skip > 0:
+            # Queued data hasn't been split yet, so the start of it can still be skipped
+            self.skip = skip
+            print(f"Resuming from byte {skip}.")
+        basis = options.get("delta")
+        if self.delta_id is not None and isinstance(basis, dict) and isinstance(basis.get("block"), int) and isinstance(basis.get("blocks"), int) \
+                and basis["block"] > 0 and basis["blocks"] >= 0:
+            self.delta_basis = (basis["block"], basis["blocks"])
+        window = options.get("window")
+        if isinstance(window, int) and window >= 0:
+            # The receiver's delivery buffer bounds the first window too, before any ACK advertises it
+            self.update_peer_window(self.curr_seq - 1, window)
+
+    def create_syn_packet(self) -> bytes:
+        """
+        Creates the SYN, which carries the options this sender proposes.
+        The options (such as a resume identifier) may be longer than a segment, so it's built as a control packet.
+        @return  The encoded SYN.
+        @throws ValueError  If the options don't fit in a datagram.
+        """
+        options = encode_options(self.options())
+        if len(options) > MAX_MSS:
+            raise ValueError(f"The handshake options take {len(options)} bytes, more than the {MAX_MSS} that fit in a datagram")
+        return self.create_control_packet(options, self.curr_seq - 1)
+
+    def handshake(self, attempts: int = 10) -> bool:
+        """
+        Blocking function that negotiates connection options with the receiver before any data is sent.
+        The SYN is an ordinary data packet that carries the options, using the sequence number just before the first segment.
+        Receivers that don't negotiate simply ACK it, in which case the sender keeps its own options.
+        @param attempts  How many times to send the SYN before giving up.
+        @return  True if the receiver replied, False if every attempt went unanswered.
+        """
+        syn_seq = self.curr_seq - 1
+        syn = self.create_syn_packet()
+        for attempt in range(attempts):
+            sent_at = self.client.time()
+            self.client.send(syn)
+            print(f"Sent SYN (attempt {attempt + 1}/{attempts}).")
+            deadline = sent_at + self.rtt.rto
+            while self.client.time() < deadline:
+                pkt = self.client.recv(max(deadline - self.client.time(), 0))
+                if pkt is None:
+                    break
+
+                ack = self.decode_ack_packet(pkt)
+                if ack is not None and ack[0] == syn_seq:
+                    options: dict[str, Any] | None = dict()
+                else:
+                    res = self.decode_data_packet(pkt)
+                    if res is None or res[0] != syn_seq:
+                        continue
+                    options = decode_options(res[1])
+                if options is None:
+                    continue
+
+                if attempt == 0:
+                    self.rtt.sample(self.client.time() - sent_at)
+                self.apply_options(options)
+                print(f"Handshake complete (mss={self.mss}, compress={self.compress}).")
+                if self.delta_basis is not None:
+                    self.delta = DeltaEncoder(self.fetch_signatures(attempts))
+                return True
+            self.rtt.backoff()
+        print("[WARN] Handshake went unanswered, using local options.")
+        return False
+
+    def fetch_signatures(self, attempts: int = 10) -> Signatures:
+        """
+        Blocking function that fetches the signatures of the receiver's older version of the data, after a handshake in which it offered one.
+        Like the SYN, each request is a data packet at the sequence number just before the first segment, and so is each reply,
+        which carries the signatures of as many blocks as fit in a segment. A window of requests is kept outstanding at a time.
+        @param attempts  How many windows of requests may go entirely unanswered in a row before giving up.
+        @return  The signatures, or none at all if fetching them failed, in which case all of the data is sent as literals.
+        """
+        assert self.delta_basis is not None
+        block_size, blocks = self.delta_basis
+        syn_seq = self.curr_seq - 1
+        per_chunk = max((self.mss - SIGNATURE_CHUNK.size) // SIGNATURE.size, 1)
+        weak: list[int] = [0] * blocks
+        strong: list[bytes] = [b""] * blocks
+        missing = list(range(0, blocks, per_chunk))
+        unanswered = 0
+        while missing and unanswered < attempts:
+            window = missing[:self.n]
+            requested = set(window)
+            sent_at = self.client.time()
+            for first in requested:
+                self.client.send(self.create_control_packet(
+                    encode_options({"signatures": first, "count": per_chunk}), syn_seq))
+            deadline = sent_at + self.rtt.rto
+            while requested and self.client.time() < deadline:
+                pkt = self.client.recv(max(deadline - self.client.time(), 0))
+                if pkt is None:
+                    break
+                res = self.decode_data_packet(pkt)
+                if res is None or res[0] != syn_seq:
+                    continue
+                chunk = decode_signature_chunk(res[1], blocks)
+                if chunk is None or chunk[0] not in requested or len(chunk[1]) != min(per_chunk, blocks - chunk[0]):
+                    # A duplicate, or a late reply to the SYN
+                    continue
+                first, signatures = chunk
+                for i, (checksum, digest) in enumerate(signatures):
+                    weak[first + i] = checksum
+                    strong[first + i] = digest
+                requested.remove(first)
+            answered = len(requested) < len(window)
+            missing = [first for first in window if first in requested] + missing[len(window):]
+            if answered:
+                unanswered = 0
+            else:
+                unanswered += 1
+                self.rtt.backoff()
+        if missing:
+            print("[WARN] The receiver's signatures went unanswered, sending the whole file.")
+            return Signatures(block_size, [], [])
+        print(f"Fetched the signatures of {blocks} blocks of {block_size} bytes.")
+        return Signatures(block_size, weak, strong)
+
+    def pacing_delay(self, payload: Buffer) -> float:
+        """
+        Computes how long to wait after sending a payload before the next send.
+        @param payload  The payload that is being sent.
+        @return  The delay in seconds.
+        """
+        return self.cc.pacing_delay(len(payload) + HEADER_SIZE, self.rtt.srtt)
+
+    def window_end(self) -> int:
+        """
+        @return  The highest sequence number that may currently be in flight.
+                 Less than the window base when the receiver's advertised window is closed.
+        """
+        window = max(int(min(self.n, self.cc.window())), 1)
+        end = self.curr_seq + window - 1
+        if self.peer_window_end is not None:
+            end = min(end, self.peer_window_end)
+        return self.buf.fill(end)
+
+    def update_peer_window(self, ack_seq: int, window: int | None) -> bool:
+        """
+        Moves the right edge of the receiver's advertised window forward.
+        It never moves back, since segments up to it may already be in flight, and an older ACK may arrive after a newer one.
+        @param ack_seq  The sequence number the window is relative to.
+        @param window  How many segments after ack_seq the receiver has room for, or None if it didn't advertise a window.
+        @return  Whether the edge moved forward.
+        """
+        if window is None:
+            return False
+        end = ack_seq + window
+        if self.peer_window_end is not None and end <= self.peer_window_end:
+            return False
+        self.peer_window_end = end
+        return True
+
+    def window_closed(self) -> bool:
+        """
+        @return  Whether all data up to the receiver's advertised window has been acknowledged and more is waiting to be sent,
+                 in which case the sender must probe the receiver to learn when its window reopens.
+        """
+        if self.peer_window_end is None or self.peer_window_end >= self.curr_seq:
+            return False
+        return self.buf.fill(self.curr_seq) == self.curr_seq
+
+    def probe_interval(self, probes: int) -> float:
+        """
+        @param probes  How many zero window probes have gone unanswered by a reopened window so far.
+        @return  How long to wait before the next probe, in seconds, which backs off exponentially like retransmissions.
+        """
+        return min(self.rtt.rto * 2**probes, MAX_PROBE_INTERVAL)
+
+    def create_parity_encoder(self) -> ParityEncoder | None:
+        """
+        @return  A parity encoder for the blocks starting at the window base, or None without forward error correction.
+        """
+        return ParityEncoder(self.fec, self.curr_seq) if self.fec is not None else None
+
+    def send_parity(self, encoder: ParityEncoder | None, seq: int, payload: Buffer):
+        """
+        Adds a segment that was just sent to the parity encoder, and sends the block's parity once the block is complete.
+        Only the first transmission of each segment is encoded, so retransmissions are ignored.
+        @param encoder  The parity encoder, or None without forward error correction.
+        @param seq  The sequence number of the sent segment.
+        @param payload  The sent segment.
+        """
+        if encoder is None or seq != encoder.next_seq:
+            return
+        # Look one past the segment, which the buffer has room for, to end the final block early
+        self.buf.fill(seq + 1)
+        block = encoder.add(seq, payload, self.buf.final_seq == seq)
+        if block is None:
+            return
+        first, count, size_xor, parity = block
+        self.client.send(encode_parity_packet(
+            self.seq_space.wrap(first), count, size_xor, parity, self.conn_id))
+        self.observer.parity_sent(first, len(parity))
+
+    def fast_retransmit_due(self, dup_acks: int) -> bool:
+        """
+        Decides whether enough duplicate ACKs of the window base have arrived to treat it as lost.
+        Small windows can't produce dup_ack_threshold duplicates, so the threshold is capped at one less than the window.
+        @param dup_acks  How many duplicate ACKs of the window base have arrived, including the latest one.
+        @return  True exactly once per window base, when the latest duplicate reaches the threshold.
+        """
+        return dup_acks == max(min(self.dup_ack_threshold, self.seq_max - self.curr_seq), 1)
 
     def start(self):
         """
         Blocking function that transmits until all queued data has been received by the client.
         """
-        sch = sched.scheduler(time.time, time.sleep)
-        self.seq_max = min(self.seq_max, len(self.buf))
+        if self.negotiate:
+            self.handshake()
+        sch = self.client.create_scheduler()
+        lock = Lock()
+        self.seq_max = self.window_end()
+        self.next_seq = self.curr_seq
+        # Losses of segments up to this seq have already been reported to the congestion controller
+        recover_seq = self.curr_seq - 1
+        # Sized like the segment buffer, which holds the whole window plus one
+        send_times = SendTimes(self.n + 1, self.curr_seq)
+        # The queued send, which sends the segment at the send cursor (next_seq), if any
+        send_event: sched.Event | None = None
+        # The retransmission timer, which covers the window base, so there is only ever one however many segments are in flight.
+        # Restarted whenever the base moves, as in RFC 6298.
+        rto_event: sched.Event | None = None
+        # Bumped whenever the timer is stopped, so a timeout that fired while it was being stopped is ignored
+        rto_gen = 0
+        # Duplicate ACKs of the window base so far
+        dup_acks = 0
+        # The queued zero window probe, if any, and how many probes have been sent since the receiver's window last opened
+        probe_event: sched.Event | None = None
+        probes = 0
+        # Timeouts in a row while the end of the data is in flight, and whether the sender has given up on its final ACK
+        final_timeouts = 0
+        gave_up = False
+        parity = self.create_parity_encoder()
 
         # This function contains what are effectively different states of the sender,
         # which are implemented as mutually recursive events, and a receiver thread.
+        # Only a send, a timeout and a probe are ever queued, so cancelling events is cheap.
 
-        def timeout_ev(seq_n: int):
-            if seq_n < self.curr_seq:
-                # Old timeout that's no longer relevant
-                return
-            print(f"Packet {seq_n} timed out!")
+        def timeout_ev(gen: int):
+            nonlocal rto_event, final_timeouts, gave_up, send_event, probe_event
+            with lock:
+                if gen != rto_gen:
+                    # Stopped while firing
+                    return
+                rto_event = None
+                if self.buf.final_seq is not None and send_times.highest_sent >= self.buf.final_seq:
+                    final_timeouts += 1
+                    if final_timeouts > self.final_retries:
+                        # A receiver that got everything stops answering once it has lingered, so the scheduler is left to empty
+                        print(f"[WARN] No ACK for seq={self.curr_seq} after {self.final_retries} retries, assuming the receiver finished.")
+                        gave_up = True
+                        send_event = cancel(send_event)
+                        probe_event = cancel(probe_event)
+                        return
+                self.rtt.backoff()
+                self.observer.timeout(self.curr_seq)
+                report_loss(True)
+                go_back()
 
-        def send_ev(seq_n: int, payload: bytes):
-            if seq_n < self.curr_seq:
-                # Old send that's no longer relevant
-                return
+        def transmit(seq_n: int) -> Buffer:
+            payload = self.buf[seq_n]
             pkt = self.create_packet(payload, seq_n)
             self.client.send(pkt)
-            sch_timeout(seq_n)
-            print(
-                f"Sent packet {seq_n}/{len(self.buf)} ({len(payload)} bytes).")
+            retransmit = send_times.sent(seq_n, self.client.time())
+            self.observer.segment_sent(seq_n, len(payload), retransmit)
+            self.send_parity(parity, seq_n, payload)
+            return payload
+
+        def send_ev():
+            nonlocal send_event
+            with lock:
+                send_event = None
+                # ACKs may have overtaken the send cursor
+                seq_n = max(self.next_seq, self.curr_seq)
+                if seq_n > self.seq_max:
+                    return
+                payload = transmit(seq_n)
+                start_timer()
+
+                # Checking if another send should be scheduled and scheduling it if need be
+                self.next_seq = seq_n + 1
+                sch_send(self.pacing_delay(payload))
 
-            # Checking if another send should be scheduled and scheduling it if need be
-            if seq_n < self.seq_max:
-                sch_send(seq_n + 1, self.buf[seq_n])
+        def probe_ev():
+            nonlocal probe_event, probes
+            with lock:
+                probe_event = None
+                if not self.window_closed():
+                    return
+                # The receiver accepts the segment if its deliverer has made room by now, and otherwise answers with its current window.
+                # Either way the answer isn't a sign of loss, so no retransmission timer is armed.
+                self.observer.window_probe(self.curr_seq)
+                transmit(self.curr_seq)
+                probes += 1
+                sch_probe()
 
-        def recv_ev(pkt: bytes):
+        def report_loss(timeout: bool):
+            nonlocal recover_seq
+            # Timeouts always count, other signals only once per window
+            if timeout or self.curr_seq > recover_seq:
+                recover_seq = self.next_seq - 1
+                self.cc.on_loss(timeout)
+                self.seq_max = self.window_end()
+
+        def go_back():
+            nonlocal send_event
+            send_event = cancel(send_event)
+            # Restarted when the window base is resent
+            stop_timer()
+            self.next_seq = self.curr_seq
+            sch_send(self.pacing_delay(self.buf[self.curr_seq]))
+            sch_probe()
+
+        def recv_ev(pkt: Buffer):
+            nonlocal dup_acks, probes, probe_event, final_timeouts
             res = self.decode_ack_packet(pkt)
             if res is None:
-                print(f"Recieved invalid ACK packet!")
+                self.observer.checksum_failure()
                 return
 
-            ack_seq: int = res
-            print(f"Recieved ACK for seq={ack_seq}")
-            if ack_seq < self.curr_seq:
-                # If the ACK is low, then the sender rejected a packet,
-                # and we resend the start of the current window.
-                print(f"Low ACK (ACK={ack_seq} < seq={self.curr_seq})")
-                ev = sch_send(self.curr_seq, self.buf[self.curr_seq - 1])
-                for ex_ev in sch.queue:
-                    if ex_ev != ev:
-                        sch.cancel(ex_ev)
-            elif ack_seq > self.seq_max:
-                print(f"Recieved ACK above expected range... ignoring.")
-            else:
-                # Cumulative seqs
-                delta_seq = ack_seq - self.curr_seq + 1
-                self.curr_seq += delta_seq
-                self.seq_max = min(self.seq_max + delta_seq, len(self.buf))
+            ack_seq, window = res
+            with lock:
+                opened = ack_seq <= send_times.highest_sent and self.update_peer_window(ack_seq, window)
+                if opened:
+                    # The probe timer restarts if the window closes again
+                    probes = 0
+                    probe_event = cancel(probe_event)
+                if ack_seq < self.curr_seq and opened:
+                    # A window update rather than a duplicate, which lets the sender carry on where the receiver's window stopped it
+                    dup_acks = 0
+                    self.seq_max = self.window_end()
+                    sch_send(0)
+                elif ack_seq < self.curr_seq:
+                    # If the ACK repeats the last one, then the receiver rejected a packet.
+                    # Once enough of them arrive, we resend the start of the current window.
+                    # Older ACKs were merely overtaken by newer ones.
+                    self.observer.dup_ack(ack_seq)
+                    if ack_seq == self.curr_seq - 1:
+                        dup_acks += 1
+                        if self.curr_seq <= self.seq_max and self.fast_retransmit_due(dup_acks):
+                            report_loss(False)
+                            go_back()
+                elif ack_seq > send_times.highest_sent:
+                    # ACK for a segment that was never sent, ignoring
+                    self.observer.dup_ack(ack_seq)
+                else:
+                    sample = send_times.rtt(ack_seq, self.client.time())
+                    if sample is not None:
+                        self.rtt.sample(sample)
+                        self.observer.rtt_sample(sample)
+                    acked_bytes = self.buf.span(self.curr_seq, ack_seq)
+
+                    # Cumulative seqs
+                    delta_seq = ack_seq - self.curr_seq + 1
+                    self.observer.ack_received(ack_seq, delta_seq, acked_bytes)
+                    self.curr_seq += delta_seq
+                    dup_acks = 0
+                    final_timeouts = 0
+                    self.cc.on_ack(delta_seq, sample)
+                    self.buf.release(self.curr_seq)
+                    self.seq_max = self.window_end()
+                    # The new base has been in flight for less time than the old one
+                    stop_timer()
+                    if self.curr_seq <= send_times.highest_sent:
+                        start_timer()
+                    sch_send(0)
+                sch_probe()
+
+        def start_timer():
+            nonlocal rto_event
+            if rto_event is None:
+                rto_event = sch.enter(self.rtt.rto, 0, timeout_ev, (rto_gen,))
 
-        def sch_timeout(seq_n: int, delay: float = 10) -> sched.Event:
-            return sch.enter(delay, 0, timeout_ev, (seq_n,))
+        def stop_timer():
+            nonlocal rto_event, rto_gen
+            rto_event = cancel(rto_event)
+            rto_gen += 1
 
-        def sch_send(seq_n: int, payload: bytes, delay: float | None = None) -> sched.Event:
-            if delay is None:
-                # Max of 500 bits per second on link
-                delay = (len(payload) + 12) * 8 / 500
-            return sch.enter(delay, 0, send_ev, (seq_n, payload))
+        def sch_send(delay: float):
+            nonlocal send_event
+            if send_event is None and max(self.next_seq, self.curr_seq) <= self.seq_max:
+                send_event = sch.enter(delay, 0, send_ev)
+
+        def sch_probe():
+            nonlocal probe_event
+            if probe_event is None and self.window_closed():
+                probe_event = sch.enter(self.probe_interval(probes), 0, probe_ev)
+
+        def cancel(event: sched.Event | None) -> None:
+            if event is not None:
+                try:
+                    sch.cancel(event)
+                except ValueError:
+                    # Already fired
+                    pass
 
         def recver(end_ev: Event):
             while not end_ev.is_set():
@@ -201,99 +937,922 @@ class GoBackNSender:
 
         # Indicate to receiver when to stop
         recver_end_ev = Event()
-        recver_thread = Thread(target=recver, args=(recver_end_ev,))
+        recver_thread = None
 
-        if len(self.buf) > 0:
-            sch_send(self.curr_seq, self.buf[0])
+        with lock:
+            if self.seq_max >= self.curr_seq:
+                sch_send(self.pacing_delay(self.buf[self.curr_seq]))
+            # The handshake may have advertised no room at all
+            sch_probe()
 
-        recver_thread.start()
+        if not self.client.listen(recv_ev):
+            recver_thread = Thread(target=recver, args=(recver_end_ev,))
+            recver_thread.start()
         while True:
             sch.run(blocking=True)
-            if self.curr_seq < len(self.buf):
-                print("[WARN] Sender event queue emptied without finishing transfer.")
-                sch_send(self.curr_seq, self.buf[self.curr_seq - 1])
-                time.sleep(1)
-            else:
-                break
+            with lock:
+                # Look one past the window base for the end of the data
+                self.buf.fill(self.curr_seq + 1)
+                if gave_up or self.buf.final_seq is not None and self.curr_seq >= self.buf.final_seq:
+                    break
+                if sch.empty():
+                    print("[WARN] Sender event queue emptied without finishing transfer.")
+                    go_back()
         recver_end_ev.set()
-        recver_thread.join()
+        if recver_thread is not None:
+            recver_thread.join()
+        else:
+            self.client.listen(None)
 
 
 class GoBackNReceiver:
     """Go-Back-N receiver implementation"""
     client: GoBackNClient
     curr_seq: int
+    max_mss: int
+    # Whether any data has been delivered yet, after which handshakes are no longer answered
+    delivered: bool
+    # Whether the deliverer has requested to stop receiving
+    finished: bool
+    seq_space: SeqSpace
+    # The connection this receiver serves, or None to adopt the ID of the first valid packet
+    conn_id: int | None
+    encoder: PacketEncoder
+    observer: Observer
+    # In-order segments to receive before ACKing them, and the longest an ACK is held back in seconds
+    ack_every: int
+    ack_delay: float
+    # In-order segments that have been delivered but not yet ACKed
+    unacked: int
+    # When the held back ACK must be sent, or None if there is none
+    ack_deadline: float | None
+    # Rebuilds lost segments once the sender has agreed to forward error correction in the handshake
+    fec: ParityDecoder | None
+    # Segments received ahead of the next expected one, by seq.
+    # Go-Back-N only holds on to them with forward error correction, which may fill the gap before them.
+    held: dict[int, Buffer]
+    # Duplicate ACKs held back while the parity of the gap's block may still arrive
+    suppressed_dup_acks: int
+    # Compression codecs the deliverer can decode, and the one the sender agreed to use in the handshake, if any
+    codecs: list[str]
+    compress: str | None
+    # Given the sender's identifier for its data, returns how many bytes of it the deliverer already has, or None if it can't resume
+    resume: Callable[[str], int] | None
+    # Given the sender's identifier for its data, returns the signatures of an older version of it that the deliverer has, or None
+    delta: Callable[[str], Signatures | None] | None
+    # The signatures sent to the sender, which then sends a delta stream against them, or None if the data is sent as is
+    signatures: Signatures | None
+    # Capacity of the delivery buffer in segments, or None to deliver synchronously without advertising a receive window
+    window: int | None
+    # The delivery buffer and the thread that drains it while recv() runs
+    flow: DeliveryBuffer | None
+    drainer: Thread | None
+    # The highest seq the sender has been told there is room for
+    advertised_end: int
+    # How long recv() waits without receiving anything before giving up on the sender, in seconds, or None to wait forever
+    idle_timeout: float | None
 
-    def __init__(self, client: GoBackNClient) -> None:
+    def __init__(
+            self,
+            client: GoBackNClient,
+            max_mss: int = MAX_MSS,
+            first_seq: int = 1,
+            seq_bits: int = 32,
+            conn_id: int | None = None,
+            observer: Observer | None = None,
+            ack_every: int = 1,
+            ack_delay: float = 0.05,
+            codecs: Iterable[str] = (),
+            resume: Callable[[str], int] | None = None,
+            window: int | None = None,
+            delta: Callable[[str], Signatures | None] | None = None,
+            idle_timeout: float | None = 60,
+    ) -> None:
         """
         @param client  The GoBackNClient instance to use for communication.
+        @param max_mss  The largest segment size the receiver agrees to during a handshake.
+        @param first_seq  The sequence number of the first segment. Must match the sender's.
+        @param seq_bits  The size of the sequence number space in bits. Must match the sender's.
+        @param conn_id  The connection ID to accept packets for, or None to adopt the ID of the first valid packet.
+        @param observer  Receives per-packet events, such as a metrics.Metrics instance. Defaults to a no-op observer.
+        @param ack_every  How many in-order segments one cumulative ACK covers. 1 ACKs every segment right away.
+        @param ack_delay  The longest an ACK is held back waiting for more segments, in seconds.
+        @param codecs  Compression codecs the deliverer can decode (see compression.Decompressor), which the sender may then use.
+                       Check compress after the handshake to find out whether the data is compressed.
+        @param resume  Called during the handshake with the sender's identifier for its data, if it sent one (see resume.ResumableFile.resume).
+                       Returns how many bytes of that data the deliverer already has, which the sender then skips.
+        @param window  Deliver through a buffer of this many segments that a thread of its own drains, and advertise its free space in every ACK,
+                       so a deliverer that falls behind slows the sender down. Requires recv() and a sender that reads windows.
+        @param delta  Called during the handshake with the sender's identifier for its data, if it asked for a delta transfer (see delta.DeltaFile.signatures_for).
+                      Returns the signatures of an older version of the data, or None if there is none. Check signatures after the handshake
+                      to find out whether the data is a delta stream, in which case resume isn't offered.
+        @param idle_timeout  How long recv() waits without receiving anything before giving up on a sender that has gone away, in seconds,
+                             or None to wait forever. Check finished after recv() returns to find out whether the data was all received.
         """
+        assert 0 < max_mss <= MAX_MSS
+        assert ack_every > 0
+        assert window is None or 0 < window <= MAX_WINDOW
+        self.seq_space = SeqSpace(seq_bits)
+        self.conn_id = conn_id
+        self.encoder = PacketEncoder(0, conn_id or 0)
         self.client = client
-        self.curr_seq = 1
+        self.curr_seq = first_seq
+        self.max_mss = max_mss
+        self.delivered = False
+        self.finished = False
+        self.observer = observer if observer is not None else Observer()
+        self.ack_every = ack_every
+        self.ack_delay = ack_delay
+        self.unacked = 0
+        self.ack_deadline = None
+        self.fec = None
+        self.held = dict()
+        self.suppressed_dup_acks = 0
+        self.codecs = list(codecs)
+        self.compress = None
+        self.resume = resume
+        self.delta = delta
+        self.signatures = None
+        self.window = window
+        self.flow = None
+        self.drainer = None
+        self.advertised_end = self.curr_seq - 1
+        self.idle_timeout = idle_timeout
 
-    def create_ack_packet(self, seq_num: int | None = None) -> bytes:
+    def create_ack_packet(self, seq_num: int | None = None) -> memoryview:
         """
-        Creates an ACK packet for the given sequence number.
+        Creates an ACK packet for the given sequence number, which advertises the receive window if there is a delivery buffer.
         @param seq_num  The sequence number to acknowledge. If None, acknowledges the current sequence.
-        @return  The ACK packet bytes.
+        @return  The ACK packet, which is only valid until the next ACK is created.
         """
-        # ACK Packet format: <checksum(4 bytes)><seq_num(4 bytes)>
         if seq_num is None:
             seq_num = self.curr_seq
-        seq_bytes = seq_num.to_bytes(4, byteorder="big")
-        checksum = zlib.crc32(seq_bytes).to_bytes(4, byteorder="big")
-        return checksum + seq_bytes
+        return self.encoder.ack(self.seq_space.wrap(seq_num), self.advertised_window(seq_num))
+
+    def window_edge(self) -> int:
+        """
+        @return  The highest seq the delivery buffer has room for. It never moves back,
+                 since segments are only accepted up to it and each one takes up the space it was given.
+        """
+        assert self.flow is not None
+        return self.curr_seq - 1 + self.flow.space()
+
+    def advertised_window(self, seq: int) -> int | None:
+        """
+        Computes the receive window to advertise relative to a sequence number, and records that the sender has been told about it.
+        @param seq  The sequence number the window is relative to.
+        @return  How many segments after seq the delivery buffer has room for, or None without a delivery buffer.
+        """
+        if self.flow is None:
+            return None
+        window = min(max(self.window_edge() - seq, 0), MAX_WINDOW)
+        self.advertised_end = max(self.advertised_end, seq + window)
+        return window
 
-    def decode_packet(self, packet: bytes) -> tuple[int, bytes] | None:
+    def window_update(self):
         """
-        Decodes a data packet and returns the sequence number and data.
+        Called from the delivery buffer's thread after each delivered segment.
+        Once the sender has used up the window it was last told about, all it can do is probe, so it's told about the reopened window
+        as soon as half of the buffer is free again, rather than a segment at a time, which would shrink its sends to match.
+        """
+        assert self.flow is not None
+        ack_seq = self.curr_seq - 1
+        if ack_seq < self.advertised_end or self.window_edge() - self.advertised_end < max(self.flow.capacity // 2, 1):
+            return
+        # The receiving thread may be encoding into the shared encoder's buffer, so this ACK gets its own
+        self.client.send(encode_ack_packet(
+            self.seq_space.wrap(ack_seq), self.encoder.conn_id, self.advertised_window(ack_seq)))
+
+    def open_flow(self, deliver: Callable[[Buffer], bool]) -> Callable[[Buffer], bool]:
+        """
+        Starts draining a delivery buffer into the deliverer on a thread of its own, if the receiver has a window.
+        @param deliver  A callback function that takes a bytes object and returns a bool indicating whether to continue receiving.
+        @return  The callback to hand received segments to, which queues them in the delivery buffer if there is one.
+        """
+        if self.window is None:
+            return deliver
+        self.flow = DeliveryBuffer(self.window)
+        self.drainer = Thread(target=self.flow.drain, args=(deliver, self.window_update), daemon=True)
+        self.drainer.start()
+        return self.flow.put
+
+    def check_flow(self):
+        """
+        Finishes receiving once the deliverer behind the delivery buffer has requested to stop, as it would have if it were called directly.
+        """
+        if self.flow is None or not self.flow.stopped or self.finished:
+            return
+        print("Deliverer requested to stop receiving.")
+        self.finished = True
+        self.held.clear()
+        if self.unacked > 0:
+            # The sender is waiting on the end of the data
+            self.send_ack()
+
+    def close_flow(self):
+        """
+        Stops the delivery buffer's thread, discarding anything the deliverer hasn't taken, which is nothing once it has requested to stop.
+        """
+        if self.flow is None:
+            return
+        self.flow.close()
+        assert self.drainer is not None
+        self.drainer.join()
+        self.flow = None
+        self.drainer = None
+
+    def recv_timeout(self) -> float | None:
+        """
+        @return  How long to wait for the next packet: until the held back ACK must be sent, and at most FLOW_POLL_INTERVAL while a deliverer
+                 drains the delivery buffer, so the receiver notices promptly when it stops. None waits for the client's timeout.
+        """
+        timeout = self.ack_wait()
+        if self.flow is not None and not self.finished:
+            timeout = FLOW_POLL_INTERVAL if timeout is None else min(timeout, FLOW_POLL_INTERVAL)
+        return timeout
+
+    def idle(self, heard_at: float) -> bool:
+        """
+        @param heard_at  When the last packet was received, or when receiving started.
+        @return  Whether the sender has been quiet for so long that it has gone away, which is only the case if it hasn't finished.
+        """
+        if self.finished or self.idle_timeout is None or self.client.time() - heard_at < self.idle_timeout:
+            return False
+        print(f"[WARN] Gave up waiting for seq={self.curr_seq} after {self.idle_timeout}s without a packet.")
+        return True
+
+    def decode_packet(self, packet: Buffer) -> tuple[int, memoryview] | None:
+        """
+        Decodes a data packet and returns the sequence number and data without copying.
         @param packet  The received data packet.
-        @return  A tuple of (sequence number, data), or None if the packet is invalid.
+        @return  A tuple of (sequence number unwrapped relative to the expected one, view of the data), or None if the packet is invalid or belongs to another connection.
         """
-        if len(packet) < 12:
+        res = decode_data_packet(packet)
+        if res is None:
             return None
+        conn_id, seq_num, data = res
+        if self.conn_id is None:
+            self.conn_id = self.encoder.conn_id = conn_id
+        elif conn_id != self.conn_id:
+            return None
+        return self.seq_space.unwrap(seq_num, self.curr_seq), data
+
+    def decode_parity_packet(self, packet: Buffer) -> tuple[int, int, int, memoryview] | None:
+        """
+        Decodes a parity packet without copying it.
+        @param packet  The received parity packet.
+        @return  A tuple of (first covered sequence number unwrapped relative to the expected one, segment count, XOR of the sizes, view of the parity),
+                 or None if the packet is invalid or belongs to another connection.
+        """
+        res = decode_parity_packet(packet)
+        if res is None or res[0] != self.conn_id:
+            return None
+        _, seq_num, count, size_xor, parity = res
+        return self.seq_space.unwrap(seq_num, self.curr_seq), count, size_xor, parity
+
+    def accept_options(self, options: dict[str, Any]) -> dict[str, Any]:
+        """
+        Decides which of the sender's proposed options to agree to.
+        @param options  The options from the sender's SYN.
+        @return  The options to reply with.
+        """
+        mss = options.get("mss")
+        if not isinstance(mss, int) or mss <= 0:
+            mss = self.max_mss
+        reply: dict[str, Any] = {"mss": min(mss, self.max_mss)}
+        fec = options.get("fec")
+        if isinstance(fec, int) and fec > 0:
+            reply["fec"] = fec
+        compress = options.get("compress")
+        if compress in self.codecs:
+            reply["compress"] = compress
+        delta_id = options.get("delta")
+        self.signatures = None
+        if isinstance(delta_id, str) and self.delta is not None:
+            self.signatures = self.delta(delta_id)
+        if self.signatures is not None:
+            # The older version is rebuilt rather than appended to, so there's nothing to resume
+            reply["delta"] = {"block": self.signatures.block_size, "blocks": len(self.signatures)}
+        else:
+            resume_id = options.get("resume")
+            if isinstance(resume_id, str) and self.resume is not None:
+                reply["resume"] = self.resume(resume_id)
+        if self.flow is not None:
+            reply["window"] = self.advertised_window(self.curr_seq - 1)
+        return reply
+
+    def handle_syn(self, seq: int, data: Buffer) -> bool:
+        """
+        Answers the sender's handshake if the given packet is a SYN.
+        @param seq  The sequence number of the received packet.
+        @param data  The data of the received packet.
+        @return  True if the packet was a SYN and has been answered.
+        """
+        if self.delivered or seq != self.curr_seq - 1:
+            return False
+        options = decode_options(data)
+        if options is None:
+            return False
+        if "signatures" in options:
+            return self.send_signatures(seq, options)
+        reply = self.accept_options(options)
+        self.fec = ParityDecoder(reply["fec"], self.curr_seq) if "fec" in reply else None
+        self.compress = reply.get("compress")
+        self.client.send(encode_data_packet(
+            self.seq_space.wrap(seq), encode_options(reply), self.encoder.conn_id))
+        print(f"Answered SYN (mss={reply['mss']}, compress={self.compress}).")
+        return True
+
+    def send_signatures(self, seq: int, request: dict[str, Any]) -> bool:
+        """
+        Answers the sender's request for a chunk of the signatures that were offered in the handshake.
+        @param seq  The sequence number of the request, which the reply is sent with.
+        @param request  The request's options.
+        @return  True if the request was valid and has been answered.
+        """
+        first = request.get("signatures")
+        count = request.get("count")
+        if self.signatures is None or not isinstance(first, int) or not isinstance(count, int) \
+                or not 0 <= first < len(self.signatures) or count <= 0:
+            return False
+        # Replies never exceed the largest segment the receiver accepts itself
+        count = min(count, max((self.max_mss - SIGNATURE_CHUNK.size) // SIGNATURE.size, 1))
+        self.client.send(encode_data_packet(
+            self.seq_space.wrap(seq), self.signatures.chunk(first, count), self.encoder.conn_id))
+        return True
+
+    def send_ack(self):
+        """
+        Cumulatively ACKs every segment delivered so far, including any held back ones.
+        """
+        self.client.send(self.create_ack_packet(self.curr_seq - 1))
+        self.unacked = 0
+        self.ack_deadline = None
 
-        recv_checksum = int.from_bytes(packet[0:4], byteorder="big")
-        seq_num = int.from_bytes(packet[4:8], byteorder="big")
-        data_size = int.from_bytes(packet[8:12], byteorder="big")
-        if len(packet) != 12 + data_size:
+    def queue_ack(self):
+        """
+        ACKs the segment that was just delivered, or holds the ACK back until ack_every segments are waiting or ack_delay has passed.
+        """
+        self.unacked += 1
+        if self.unacked >= self.ack_every:
+            self.send_ack()
+        elif self.ack_deadline is None:
+            self.ack_deadline = self.client.time() + self.ack_delay
+
+    def flush_ack(self):
+        """
+        Sends the held back ACK if its deadline has passed.
+        """
+        if self.ack_deadline is not None and self.client.time() >= self.ack_deadline:
+            self.send_ack()
+
+    def ack_wait(self) -> float | None:
+        """
+        @return  How long until the held back ACK must be sent, in seconds, or None if there is none.
+        """
+        if self.ack_deadline is None:
             return None
+        return max(self.ack_deadline - self.client.time(), 0)
 
-        data = packet[12:12+data_size]
-        computed_checksum = zlib.crc32(packet[4:12+data_size])
-        if recv_checksum != computed_checksum:
+    def deliver_in_order(self, data: Buffer, deliver: Callable[[Buffer], bool]) -> int:
+        """
+        Delivers the next expected segment, followed by any held segments that are now in order,
+        rebuilding missing ones from parity where possible.
+        @param data  The next expected segment.
+        @param deliver  A callback function that takes a bytes object and returns a bool indicating whether to continue receiving.
+        @return  The number of segments delivered.
+        """
+        count = 0
+        while data is not None:
+            self.delivered = True
+            should_continue = deliver(data)
+            self.observer.segment_delivered(self.curr_seq, len(data))
+            if self.fec is not None:
+                self.fec.delivered(self.curr_seq, data)
+            self.curr_seq += 1
+            count += 1
+            if not should_continue:
+                print("Deliverer requested to stop receiving.")
+                self.finished = True
+                self.held.clear()
+                break
+            data = self.held.pop(self.curr_seq, None)
+            if data is None and self.fec is not None and self.repair(self.curr_seq) is not None:
+                data = self.held.pop(self.curr_seq)
+        return count
+
+    def accept(self, data: Buffer, deliver: Callable[[Buffer], bool]):
+        """
+        Delivers the next expected segment and any that follow it, and ACKs them.
+        @param data  The next expected segment.
+        @param deliver  A callback function that takes a bytes object and returns a bool indicating whether to continue receiving.
+        """
+        self.suppressed_dup_acks = 0
+        if self.deliver_in_order(data, deliver) > 1 or self.finished:
+            # A gap was filled, or the sender is waiting on the end of the data, so there's nothing to wait for
+            self.send_ack()
+        else:
+            self.queue_ack()
+
+    def repair(self, seq: int) -> int | None:
+        """
+        Rebuilds the missing segment of the block that contains the given seq from its parity, and holds it like a received segment.
+        @param seq  Any sequence number in the block.
+        @return  The seq of the rebuilt segment, or None if it couldn't be rebuilt.
+        """
+        assert self.fec is not None
+        res = self.fec.repair(seq, self.curr_seq, self.held)
+        if res is None:
             return None
+        seq, data = res
+        self.observer.segment_recovered(seq, len(data))
+        self.held[seq] = data
+        self.ack_recovered(seq)
+        return seq
+
+    def ack_recovered(self, seq: int):
+        """
+        Called with each rebuilt segment. Go-Back-N ACKs cumulatively once the segment is delivered, so there is nothing to do yet.
+        @param seq  The seq of the rebuilt segment.
+        """
+        pass
+
+    def handle_parity(self, pkt: Buffer, deliver: Callable[[Buffer], bool]):
+        """
+        Handles a packet that isn't a valid data packet, which is either a parity packet or is counted as a checksum failure.
+        @param pkt  The received packet.
+        @param deliver  A callback function that takes a bytes object and returns a bool indicating whether to continue receiving.
+        """
+        parity = self.decode_parity_packet(pkt)
+        if parity is None:
+            self.observer.checksum_failure()
+            return
+        block, count, size_xor, data = parity
+        self.observer.parity_received(block, len(data))
+        if self.fec is None or self.finished:
+            return
+
+        self.fec.add_parity(block, count, size_xor, data)
+        self.repair(block)
+        if self.curr_seq in self.held:
+            self.accept(self.held.pop(self.curr_seq), deliver)
+        elif self.fec.has_parity(self.curr_seq):
+            # The gap couldn't be filled, so the sender gets the duplicate ACKs it would have had
+            self.send_dup_acks()
 
-        return seq_num, data
+    def send_dup_acks(self):
+        """
+        Sends one duplicate ACK for the latest out-of-order segment, plus any that were held back.
+        """
+        for _ in range(self.suppressed_dup_acks + 1):
+            self.send_ack()
+        self.suppressed_dup_acks = 0
 
-    def recv(self, deliver: Callable[[bytes], bool]):
+    def handle_packet(self, pkt: Buffer, deliver: Callable[[Buffer], bool]) -> bool:
+        """
+        Handles a single received packet, delivering its data to the provided callback if it's the next in order.
+        In-order segments may be ACKed later (see queue_ack), but anything unexpected is ACKed right away,
+        so the sender sees duplicate ACKs promptly.
+        The exception is while the parity of the gap's block may still arrive and fill it, which would make a retransmission pointless.
+        Packets that arrive after the deliverer requested to stop are still ACKed, which helps the sender finish.
+        @param pkt  The received packet.
+        @param deliver  A callback function that takes a bytes object and returns a bool indicating whether to continue receiving.
+        @return  Whether to keep receiving.
+        """
+        self.flush_ack()
+        res = self.decode_packet(pkt)
+        if res == None:
+            self.handle_parity(pkt, deliver)
+            return not self.finished
+
+        seq, data = res
+
+        if self.handle_syn(seq, data):
+            return not self.finished
+
+        self.observer.segment_received(
+            seq, len(data), seq == self.curr_seq)
+        if self.finished or seq < self.curr_seq:
+            # Unexpected seq, ACKing the last in-order one
+            self.send_ack()
+        elif self.flow is not None and seq > self.window_edge():
+            # No room in the delivery buffer, so the sender is told the current window instead, which is also how zero window probes are answered
+            self.observer.window_full(seq)
+            self.send_ack()
+        elif seq == self.curr_seq:
+            self.accept(data, deliver)
+        elif self.fec is None:
+            self.send_ack()
+        else:
+            # Segments that can't be delivered right away outlive the receive buffer they arrived in
+            self.held.setdefault(seq, bytes(data))
+            self.repair(seq)
+            if self.curr_seq in self.held:
+                self.accept(self.held.pop(self.curr_seq), deliver)
+            elif self.fec.block_of(seq) == self.fec.block_of(self.curr_seq) and not self.fec.has_parity(self.curr_seq):
+                self.suppressed_dup_acks += 1
+            else:
+                self.send_dup_acks()
+        return not self.finished
+
+    def recv(self, deliver: Callable[[Buffer], bool]):
         """
         Blocking function that receives packets and delivers data to the provided callback.
+        Delivered data may be a view into a reused receive buffer, so the callback must consume or copy it before returning.
+        After the deliverer requests to stop, the receiver keeps re-ACKing retransmissions
+        until a receive times out, so the sender can learn that its final segments arrived.
         @param deliver  A callback function that takes a bytes object and returns a bool indicating whether to continue receiving.
         """
+        deliver = self.open_flow(deliver)
+        heard_at = self.client.time()
+        try:
+            while True:
+                pkt = self.client.recv(self.recv_timeout())
+                self.check_flow()
+                if pkt == None:
+                    if self.ack_deadline is not None:
+                        self.flush_ack()
+                    elif self.finished or self.idle(heard_at):
+                        break
+                    elif self.flow is None:
+                        print(f"Timed out waiting for seq={self.curr_seq}")
+                    continue
+
+                heard_at = self.client.time()
+                self.handle_packet(pkt, deliver)
+        finally:
+            self.close_flow()
+        print("Receiver finished receiving.")
+
+
+class SelectiveRepeatSender(GoBackNSender):
+    """
+    Selective Repeat sender implementation.
+    Each segment has its own retransmission timer, and only segments that time out are resent.
+    """
+    timeout: float | None
+    acked: set[int]
+
+    def __init__(
+            self,
+            client: GoBackNClient,
+            n: int,
+            timeout: float | None = None,
+            cc: CongestionControl | None = None,
+            mss: int = DEFAULT_MSS,
+            negotiate: bool = False,
+            first_seq: int = 1,
+            seq_bits: int = 32,
+            conn_id: int = 0,
+            observer: Observer | None = None,
+            fec: int | None = None,
+            compress: str | None = None,
+            compress_level: int = 6,
+            resume_id: str | None = None,
+            delta_id: str | None = None,
+    ) -> None:
+        """
+        @param client  The GoBackNClient instance to use for communication.
+        @param n  The maximum window size for the Selective Repeat protocol.
+        @param timeout  A fixed per-segment retransmission timeout in seconds, or None to use the RTT estimator's timeout.
+        @param cc  The congestion controller that sizes the window and paces sends. Defaults to a fixed 500 bps pacer.
+        @param mss  The maximum segment size (payload bytes per packet).
+        @param negotiate  Whether to negotiate options (such as the MSS) with the receiver before sending.
+        @param first_seq  The sequence number of the first segment. Must match the receiver's.
+        @param seq_bits  The size of the sequence number space in bits. Must match the receiver's.
+        @param conn_id  The connection ID stamped on every packet, which lets a receiver serve many senders on one port.
+        @param observer  Receives per-packet events, such as a metrics.Metrics instance. Defaults to a no-op observer.
+        @param fec  Send an XOR parity segment after every this many segments, so the receiver can rebuild a lost segment without a retransmission.
+                    Requires negotiate, since the receiver learns the block size from the handshake.
+        @param compress  The codec to compress queued data with, if the receiver agrees to it during the handshake. Requires negotiate.
+        @param compress_level  The compression level, from 0 (fastest) to 9 (smallest) for zlib.
+        @param resume_id  Identifies the data that will be pushed, so that what the receiver already has of it is skipped. Requires negotiate.
+        @param delta_id  Identifies the data that will be pushed, so that only what differs from the receiver's older version of it is sent. Requires negotiate.
+        """
+        super().__init__(client, n, cc=cc, mss=mss, negotiate=negotiate,
+                         first_seq=first_seq, seq_bits=seq_bits, conn_id=conn_id, observer=observer, fec=fec,
+                         compress=compress, compress_level=compress_level, resume_id=resume_id, delta_id=delta_id)
+        self.timeout = timeout
+        self.acked = set()
+
+    def start(self):
+        """
+        Blocking function that transmits until all queued data has been acknowledged by the client.
+        """
+        if self.negotiate:
+            self.handshake()
+        sch = self.client.create_scheduler()
+        lock = Lock()
+        timers: dict[int, sched.Event] = dict()
+        # Send times of segments that have only been transmitted once (Karn's rule)
+        sent_at: dict[int, float] = dict()
+        retransmitted: set[int] = set()
+        # Whether a chain of paced sends for new segments is currently scheduled
+        pumping = False
+        # The queued zero window probe, if any, and how many probes have been sent since the receiver's window last opened
+        probe_event: sched.Event | None = None
+        probes = 0
+        # The highest seq sent as a zero window probe, which may be ACKed even though the send cursor hasn't reached it
+        probed = self.curr_seq - 1
+        # Timeouts in a row once the end of the data has been sent, and whether the sender has given up on its final ACK
+        final_timeouts = 0
+        gave_up = False
+        parity = self.create_parity_encoder()
+
+        # Losses of segments up to this seq have already been reported to the congestion controller
+        recover_seq = self.curr_seq - 1
+
+        def cancel_timer(seq_n: int):
+            ev = timers.pop(seq_n, None)
+            if ev is not None:
+                try:
+                    sch.cancel(ev)
+                except ValueError:
+                    # Already fired
+                    pass
+
+        def transmit(seq_n: int, timer: bool = True):
+            payload = self.buf[seq_n]
+            self.client.send(self.create_packet(payload, seq_n))
+            retransmit = seq_n in sent_at or seq_n in retransmitted
+            if retransmit:
+                sent_at.pop(seq_n, None)
+                retransmitted.add(seq_n)
+            else:
+                sent_at[seq_n] = self.client.time()
+            cancel_timer(seq_n)
+            if timer:
+                timeout = self.timeout if self.timeout is not None else self.rtt.rto
+                timers[seq_n] = sch.enter(timeout, 0, timeout_ev, (seq_n,))
+            self.observer.segment_sent(seq_n, len(payload), retransmit)
+            self.send_parity(parity, seq_n, payload)
+
+        def timeout_ev(seq_n: int):
+            nonlocal recover_seq, final_timeouts, gave_up
+            with lock:
+                timers.pop(seq_n, None)
+                if seq_n < self.curr_seq or seq_n in self.acked:
+                    return
+                if self.buf.final_seq is not None and self.next_seq > self.buf.final_seq:
+                    final_timeouts += 1
+                    if final_timeouts > self.final_retries:
+                        # As in the Go-Back-N sender, the receiver stops answering once it has lingered
+                        print(f"[WARN] No ACK for seq={seq_n} after {self.final_retries} retries, assuming the receiver finished.")
+                        gave_up = True
+                        for seq in list(timers):
+                            cancel_timer(seq)
+                        cancel_probe()
+                        return
+                self.observer.timeout(seq_n)
+                if seq_n > recover_seq:
+                    # Back off and reduce the window once per window of data rather than per segment
+                    recover_seq = self.next_seq - 1
+                    self.rtt.backoff()
+                    self.cc.on_loss(True)
+                transmit(seq_n)
+
+        def pump_ev():
+            nonlocal pumping
+            with lock:
+                if self.next_seq > self.window_end():
+                    pumping = False
+                    return
+                seq_n = self.next_seq
+                self.next_seq += 1
+                transmit(seq_n)
+                sch.enter(self.pacing_delay(self.buf[seq_n]), 0, pump_ev)
+
+        def start_pump():
+            nonlocal pumping
+            if not pumping and self.next_seq <= self.window_end():
+                pumping = True
+                sch.enter(0, 0, pump_ev)
+
+        def probe_ev():
+            nonlocal probe_event, probes, probed
+            with lock:
+                probe_event = None
+                if not self.window_closed():
+                    return
+                # Sent without a retransmission timer, since a receiver without room answers with its current window instead.
+                # The send cursor stays put, so the pump sends the segment again once the window opens.
+                self.observer.window_probe(self.curr_seq)
+                transmit(self.curr_seq, timer=False)
+                probed = self.curr_seq
+                probes += 1
+                sch_probe()
+
+        def sch_probe():
+            nonlocal probe_event
+            if probe_event is None and self.window_closed():
+                probe_event = sch.enter(self.probe_interval(probes), 0, probe_ev)
+
+        def cancel_probe():
+            nonlocal probe_event
+            if probe_event is not None:
+                try:
+                    sch.cancel(probe_event)
+                except ValueError:
+                    # Already fired
+                    pass
+                probe_event = None
+
+        def recv_ev(pkt: Buffer):
+            nonlocal probes, final_timeouts
+            res = self.decode_ack_packet(pkt)
+            if res is None:
+                self.observer.checksum_failure()
+                return
+
+            ack_seq, window = res
+            with lock:
+                sent = ack_seq < max(self.next_seq, probed + 1)
+                opened = sent and self.update_peer_window(ack_seq, window)
+                if opened:
+                    # The probe timer restarts if the window closes again
+                    probes = 0
+                    cancel_probe()
+                    self.seq_max = self.window_end()
+                    start_pump()
+                if ack_seq < self.curr_seq or not sent or ack_seq in self.acked:
+                    # Duplicate ACK or ACK for a segment that was never sent, unless it merely updated the window
+                    if not opened:
+                        self.observer.dup_ack(ack_seq)
+                    sch_probe()
+                    return
+                self.acked.add(ack_seq)
+                cancel_timer(ack_seq)
+                final_timeouts = 0
+                sample = None
+                if ack_seq in sent_at:
+                    sample = self.client.time() - sent_at.pop(ack_seq)
+                    self.rtt.sample(sample)
+                    self.observer.rtt_sample(sample)
+                retransmitted.discard(ack_seq)
+                self.observer.ack_received(
+                    ack_seq, 1, len(self.buf[ack_seq]))
+                self.cc.on_ack(1, sample)
+                # Slide the window past every contiguously acknowledged segment
+                while self.curr_seq in self.acked:
+                    self.acked.remove(self.curr_seq)
+                    self.curr_seq += 1
+                # An accepted probe moves the window base past the send cursor
+                self.next_seq = max(self.next_seq, self.curr_seq)
+                self.buf.release(self.curr_seq)
+                self.seq_max = self.window_end()
+                start_pump()
+                sch_probe()
+
+        def recver(end_ev: Event):
+            while not end_ev.is_set():
+                pkt_in = self.client.recv()
+                if pkt_in is None:
+                    continue
+                recv_ev(pkt_in)
+            print("No longer accepting packets.")
+
+        recver_end_ev = Event()
+        recver_thread = None
+
+        with lock:
+            start_pump()
+            sch_probe()
+
+        if not self.client.listen(recv_ev):
+            recver_thread = Thread(target=recver, args=(recver_end_ev,))
+            recver_thread.start()
         while True:
-            pkt = self.client.recv()
-            if pkt == None:
-                print(f"Timed out waiting for seq={self.curr_seq}")
-                continue
+            sch.run(blocking=True)
+            with lock:
+                self.buf.fill(self.curr_seq)
+                if gave_up or self.buf.done(self.curr_seq):
+                    break
+                if sch.empty():
+                    print("[WARN] Sender event queue emptied without finishing transfer.")
+                    transmit(self.curr_seq)
+        recver_end_ev.set()
+        if recver_thread is not None:
+            recver_thread.join()
+        else:
+            self.client.listen(None)
+
+
+class SelectiveRepeatReceiver(GoBackNReceiver):
+    """
+    Selective Repeat receiver implementation.
+    Out-of-order segments within the window are buffered and individually ACKed.
+    """
+    n: int
+
+    def __init__(
+            self,
+            client: GoBackNClient,
+            n: int,
+            max_mss: int = MAX_MSS,
+            first_seq: int = 1,
+            seq_bits: int = 32,
+            conn_id: int | None = None,
+            observer: Observer | None = None,
+            codecs: Iterable[str] = (),
+            resume: Callable[[str], int] | None = None,
+            window: int | None = None,
+            delta: Callable[[str], Signatures | None] | None = None,
+            idle_timeout: float | None = 60,
+    ) -> None:
+        """
+        @param client  The GoBackNClient instance to use for communication.
+        @param n  The window size for the Selective Repeat protocol.
+        @param max_mss  The largest segment size the receiver agrees to during a handshake.
+        @param first_seq  The sequence number of the first segment. Must match the sender's.
+        @param seq_bits  The size of the sequence number space in bits. Must match the sender's.
+        @param conn_id  The connection ID to accept packets for, or None to adopt the ID of the first valid packet.
+        @param observer  Receives per-packet events, such as a metrics.Metrics instance. Defaults to a no-op observer.
+        @param codecs  Compression codecs the deliverer can decode (see compression.Decompressor), which the sender may then use.
+        @param resume  Called during the handshake with the sender's identifier for its data, and returns how many bytes of it the deliverer already has.
+        @param window  Deliver through a buffer of this many segments that a thread of its own drains, and advertise its free space in every ACK.
+        @param delta  Called during the handshake with the sender's identifier for its data, and returns the signatures of an older version of it, if any.
+        @param idle_timeout  How long recv() waits without receiving anything before giving up on the sender, in seconds, or None to wait forever.
+        """
+        # Selective ACKs name a single segment each, so they're never held back to cover more
+        super().__init__(client, max_mss, first_seq, seq_bits, conn_id, observer, codecs=codecs, resume=resume, window=window, delta=delta,
+                         idle_timeout=idle_timeout)
+        assert 0 < n <= self.seq_space.max_window()
+        self.n = n
+
+    def accept(self, data: Buffer, deliver: Callable[[Buffer], bool]):
+        # Every segment has already been ACKed individually
+        self.deliver_in_order(data, deliver)
+
+    def ack_recovered(self, seq: int):
+        # The sender would otherwise retransmit the segment once its timer expires
+        self.client.send(self.create_ack_packet(seq))
+
+    def handle_packet(self, pkt: Buffer, deliver: Callable[[Buffer], bool]) -> bool:
+        """
+        Handles a single received packet, buffering its data and delivering any that is now in order to the provided callback.
+        @param pkt  The received packet.
+        @param deliver  A callback function that takes a bytes object and returns a bool indicating whether to continue receiving.
+        @return  Whether the deliverer still wants more data.
+        """
+        res = self.decode_packet(pkt)
+        if res == None:
+            self.handle_parity(pkt, deliver)
+            return not self.finished
 
-            res = self.decode_packet(pkt)
-            if res == None:
-                print(f"Malformed packet (seq={self.curr_seq})!")
-                continue
+        seq, data = res
 
-            seq, data = res
-            print(f"Recieved packet seq={seq}, expected seq={self.curr_seq}")
+        if self.handle_syn(seq, data):
+            return not self.finished
 
+        self.observer.segment_received(
+            seq, len(data), seq == self.curr_seq)
+        if self.curr_seq - self.n <= seq < self.curr_seq:
+            # Already delivered, the ACK must have been lost
+            self.client.send(self.create_ack_packet(seq))
+        elif self.flow is not None and not self.finished and self.window_edge() < seq < self.curr_seq + self.n:
+            # No room in the delivery buffer, so the sender is told the current window instead, which is also how zero window probes are answered
+            self.observer.window_full(seq)
+            self.client.send(self.create_ack_packet(self.curr_seq - 1))
+        elif self.curr_seq <= seq < self.curr_seq + self.n:
+            self.client.send(self.create_ack_packet(seq))
+            if self.finished:
+                return False
             if seq == self.curr_seq:
-                should_continue = deliver(data)
-                print(f"Delivered packet seq={seq} ({len(data)} bytes).")
-                self.client.send(self.create_ack_packet())
-                self.curr_seq += 1
-                if not should_continue:
-                    print("Deliverer requested to stop receiving.")
-                    break
+                self.deliver_in_order(data, deliver)
             else:
-                print(f"Unexpected seq, ACKing seq={self.curr_seq - 1}.")
-                self.client.send(self.create_ack_packet(self.curr_seq - 1))
+                # Segments that can't be delivered right away outlive the receive buffer they arrived in
+                self.held.setdefault(seq, bytes(data))
+                if self.fec is not None:
+                    self.repair(seq)
+                if self.curr_seq in self.held:
+                    self.deliver_in_order(self.held.pop(self.curr_seq), deliver)
+        # Otherwise the seq is outside of the window and is ignored
+        return not self.finished
+
+    def recv(self, deliver: Callable[[Buffer], bool]):
+        """
+        Blocking function that receives packets and delivers data to the provided callback.
+        Delivered data may be a view into a reused receive buffer, so the callback must consume or copy it before returning.
+        After the deliverer requests to stop, the receiver keeps re-ACKing retransmissions
+        until a receive times out, so the sender can learn that its final segments arrived.
+        @param deliver  A callback function that takes a bytes object and returns a bool indicating whether to continue receiving.
+        """
+        deliver = self.open_flow(deliver)
+        heard_at = self.client.time()
+        try:
+            while True:
+                pkt = self.client.recv(self.recv_timeout())
+                if pkt == None:
+                    if self.finished or self.idle(heard_at):
+                        break
+                    if self.flow is None:
+                        print(f"Timed out waiting for seq={self.curr_seq}")
+                    self.check_flow()
+                    continue
+
+                heard_at = self.client.time()
+                self.handle_packet(pkt, deliver)
+                self.check_flow()
+        finally:
+            self.close_flow()
         print("Receiver finished receiving.")
@@ -0,0 +1,523 @@
+from typing import Any, BinaryIO, Callable
+from pathlib import Path
+from segments import Buffer
+from sink import FileSink, WritePolicy
+from threading import Lock
+import hashlib
+import json
+import mmap
+import os
+import re
+import time
+
+# A file identifier: the size in bytes and the SHA-256 of the contents
+FILE_ID = re.compile(r"[0-9]+-[0-9a-f]{64}")
+# Identifies a byte range of a file that is sent over a connection of its own, as <file id>@<offset>+<length>
+STRIPE_ID = re.compile(rf"({FILE_ID.pattern})@([0-9]+)\+([0-9]+)")
+
+
+def file_id(file: BinaryIO) -> str:
+    """
+    Identifies the rest of a file by its size and a hash of its contents, so that a receiver can tell whether
+    the data it already has belongs to the same file.
+    @param file  The file, which is read from its current position and then returned to it.
+    @return  The identifier.
+    """
+    start = file.tell()
+    digest = hashlib.sha256()
+    size = 0
+    while chunk := file.read(1 << 20):
+        digest.update(chunk)
+        size += len(chunk)
+    file.seek(start)
+    return f"{size}-{digest.hexdigest()}"
+
+
+def file_size(file_id: str) -> int:
+    """
+    @param file_id  A file identifier. See file_id().
+    @return  The size of the file it identifies, in bytes.
+    """
+    return int(file_id.split("-")[0])
+
+
+def split_ranges(size: int, count: int) -> list[tuple[int, int]]:
+    """
+    Splits a file into contiguous byte ranges of nearly equal length.
+    @param size  The size of the file.
+    @param count  The number of ranges wanted. Fewer are returned if the file is smaller than that, but always at least one.
+    @return  The ranges as (offset, length).
+    """
+    count = max(min(count, size), 1)
+    bounds = [size * i // count for i in range(count + 1)]
+    return [(start, end - start) for start, end in zip(bounds, bounds[1:])]
+
+
+def stripe_id(file_id: str, offset: int, length: int) -> str:
+    """
+    @param file_id  The identifier of the whole file. See file_id().
+    @param offset  The offset of the range.
+    @param length  The length of the range.
+    @return  The identifier of the range, which is what a sender that sends only this range resumes with.
+    """
+    return f"{file_id}@{offset}+{length}"
+
+
+def parse_stripe_id(resume_id: str) -> tuple[str, int, int] | None:
+    """
+    @param resume_id  A sender's identifier for its data.
+    @return  (file id, offset, length) if it identifies a range of a file, otherwise None.
+    """
+    match = STRIPE_ID.fullmatch(resume_id)
+    if match is None:
+        return None
+    return match[1], int(match[2]), int(match[3])
+
+
+def write_checkpoint(path: Path, checkpoint: dict[str, Any]):
+    """
+    Replaces a checkpoint file atomically, so a crash leaves either the old one or the new one.
+    @param path  The checkpoint file.
+    @param checkpoint  The checkpoint, which is saved as JSON.
+    """
+    temp = path.with_name(path.name + ".tmp")
+    with open(temp, "w") as file:
+        json.dump(checkpoint, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp, path)
+
+
+def checkpoint_path(path: Path) -> Path:
+    """
+    @param path  A file being received.
+    @return  Where its checkpoint is saved.
+    """
+    return path.with_name(path.name + ".checkpoint")
+
+
+class StripedFile:
+    """
+    A file that is received as several byte ranges at once, each over a connection of its own.
+    The file is preallocated at its full size up front and each range is written at its offset by a sink of its own
+    (see sink.WritePolicy), so the connections never wait on each other's writes.
+    Like ResumableFile, the progress of every range is checkpointed, and once every range is complete
+    the file is checked against the hash in its identifier.
+    """
+    path: Path
+    file_id: str
+    size: int
+    fd: int
+    interval: float
+    policy: WritePolicy
+    # The file's memory mapping, if the policy writes through one
+    mapping: mmap.mmap | None
+    # Bytes written at the start of each range, and each range's length, by the range's offset
+    written: dict[int, int]
+    lengths: dict[int, int]
+    # The sink that writes each range that is being received, by the range's offset
+    sinks: dict[int, FileSink]
+    # Whether every range has been written and the file has been closed, and whether it then matched its hash
+    done: bool
+    intact: bool
+    saved_at: float
+    lock: Lock
+
+    def __init__(self, path: Path, file_id: str, interval: float = 1, policy: WritePolicy | None = None) -> None:
+        """
+        @param path  Where to write the file.
+        @param file_id  The file's identifier. See file_id().
+        @param interval  The time between checkpoints in seconds.
+        @param policy  How to write the file. Defaults to a write buffer per range, synced at every checkpoint.
+        """
+        self.path = path
+        self.file_id = file_id
+        self.size = file_size(file_id)
+        self.interval = interval
+        self.policy = policy if policy is not None else WritePolicy()
+        self.written = self.load_checkpoint()
+        self.lengths = dict()
+        self.sinks = dict()
+        self.done = False
+        self.intact = False
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if not self.written:
+            # Nothing to resume, so an older, longer file doesn't leave its tail behind (preallocating only grows the file)
+            os.ftruncate(self.fd, 0)
+        self.mapping = self.policy.map(self.fd, self.size)
+        self.saved_at = time.monotonic()
+        self.lock = Lock()
+
+    def load_checkpoint(self) -> dict[int, int]:
+        """
+        @return  How many bytes of each range an earlier transfer of the same file wrote, by the range's offset.
+        """
+        try:
+            checkpoint = json.loads(checkpoint_path(self.path).read_text())
+            size = self.path.stat().st_size
+        except (OSError, ValueError):
+            return dict()
+        if not isinstance(checkpoint, dict) or checkpoint.get("file_id") != self.file_id or size != self.size:
+            return dict()
+        written = checkpoint.get("written")
+        if not isinstance(written, dict):
+            return dict()
+        return {int(offset): count for offset, count in written.items()
+                if offset.isdigit() and isinstance(count, int) and count >= 0}
+
+    def resume(self, offset: int, length: int) -> int:
+        """
+        Starts receiving a range, which an earlier transfer may have partly written already.
+        @param offset  The offset of the range.
+        @param length  The length of the range.
+        @return  How many bytes at the start of the range the sender can skip.
+        """
+        if offset + length > self.size:
+            raise ValueError(f"Range {offset}+{length} is outside of '{self.path}'")
+        with self.lock:
+            self.lengths[offset] = length
+            self.written[offset] = min(self.written.get(offset, 0), length)
+            if offset in self.sinks:
+                # The handshake was repeated
+                self.sinks[offset].close()
+            self.sinks[offset] = self.policy.sink(self.fd, offset + self.written[offset], self.mapping)
+            return self.written[offset]
+
+    def write(self, offset: int, block: Buffer):
+        """
+        Appends data to a range, and saves a checkpoint if one is due.
+        @param offset  The offset of the range, which only one connection writes to.
+        @param block  The data.
+        """
+        written = self.written[offset]
+        if written + len(block) > self.lengths[offset]:
+            raise ValueError(f"Range {offset}+{self.lengths[offset]} of '{self.path}' received too much data")
+        self.sinks[offset].write(block)
+        with self.lock:
+            self.written[offset] += len(block)
+            if time.monotonic() - self.saved_at >= self.interval:
+                self.save()
+
+    def save(self):
+        """
+        Saves a checkpoint once the data written so far is on disk, unless the policy never syncs. Must be called with the lock held.
+        Data that other connections' sinks are still holding on to isn't on disk yet, so only what they have flushed is counted.
+        """
+        if self.policy.fsync == "never":
+            return
+        written = {offset: self.sinks[offset].flushed - offset if offset in self.sinks else count
+                   for offset, count in self.written.items()}
+        self.policy.sync(self.fd, self.mapping)
+        write_checkpoint(checkpoint_path(self.path), {
+            "file_id": self.file_id,
+            "written": {str(offset): count for offset, count in written.items()},
+        })
+        self.saved_at = time.monotonic()
+
+    def checkpoint(self, offset: int):
+        """
+        Saves a checkpoint of what has been written so far, for a range whose connection was interrupted.
+        @param offset  The offset of the range.
+        """
+        with self.lock:
+            if self.done:
+                return
+            self.sinks[offset].flush()
+            self.save()
+
+    def complete(self) -> bool:
+        """
+        @return  Whether the ranges that have been started cover the whole file and have all been written.
+                 Must be called with the lock held.
+        """
+        end = 0
+        for offset in sorted(self.lengths):
+            if offset > end or self.written[offset] < self.lengths[offset]:
+                return False
+            end = max(end, offset + self.lengths[offset])
+        return end >= self.size
+
+    def verify(self) -> bool:
+        """
+        @return  Whether the file's contents match the hash in its identifier.
+        """
+        with open(self.path, "rb") as file:
+            return file_id(file) == self.file_id
+
+    def finish_range(self, offset: int) -> bool:
+        """
+        Called when a range has been received. Once every range has, the file is closed and checked, and its checkpoint is removed
+        unless it doesn't match.
+        @param offset  The offset of the range.
+        @return  Whether the whole file has been received intact.
+        """
+        with self.lock:
+            if self.done:
+                return self.intact
+            # Flushed under the lock, since the connection that completes the file closes every sink
+            self.sinks[offset].flush()
+            if not self.complete():
+                self.save()
+                return False
+            self.done = True
+            for sink in self.sinks.values():
+                sink.close()
+            self.policy.sync(self.fd, self.mapping)
+            if self.mapping is not None:
+                self.mapping.close()
+            os.close(self.fd)
+            self.intact = self.verify()
+        if not self.intact:
+            print(f"[FAIL] '{self.path}' doesn't match the hash it was sent with, so its checkpoint is kept.")
+            return False
+        print(f"All ranges of '{self.path}' received and verified.")
+        checkpoint_path(self.path).unlink(missing_ok=True)
+        return True
+
+
+class StripedFiles:
+    """
+    The striped files being received, so that every connection that sends a range of one file writes to the same StripedFile.
+    """
+    # Chooses where to write given the file's identifier
+    path_for: Callable[[str], Path]
+    interval: float
+    policy: WritePolicy | None
+    files: dict[str, StripedFile]
+    lock: Lock
+
+    def __init__(self, path_for: Callable[[str], Path], interval: float = 1, policy: WritePolicy | None = None) -> None:
+        """
+        @param path_for  Chooses where to write given the file's identifier.
+        @param interval  The time between checkpoints in seconds.
+        @param policy  How to write the files. See StripedFile.
+        """
+        self.path_for = path_for
+        self.interval = interval
+        self.policy = policy
+        self.files = dict()
+        self.lock = Lock()
+
+    def open(self, file_id: str) -> StripedFile:
+        """
+        @param file_id  The identifier of the file.
+        @return  The file that is being received with that identifier, which is opened if this is its first range.
+        """
+        with self.lock:
+            file = self.files.get(file_id)
+            if file is None or file.done:
+                file = StripedFile(self.path_for(file_id), file_id, self.interval, self.policy)
+                self.files[file_id] = file
+            return file
+
+
+class ResumableFile:
+    """
+    Writes a received file so that an interrupted transfer can be resumed.
+    Every interval seconds, the number of contiguous bytes written is saved along with the file's identifier
+    to a checkpoint file next to it. The data is flushed to disk first, so a checkpoint never counts data that a crash could lose.
+    When the same file is sent again, the data up to the checkpoint is kept and the rest is overwritten.
+    The identifier includes the file's size, so the file is preallocated, and written through a sink (see sink.WritePolicy).
+    If the sender only sends a range of the file, the range is written to a StripedFile instead.
+    """
+    # Chooses where to write given the file's identifier, or None if the sender didn't send one
+    path_for: Callable[[str | None], Path]
+    interval: float
+    policy: WritePolicy
+    path: Path | None
+    fd: int | None
+    # The file's memory mapping, if the policy writes through one, and the sink that writes to the file
+    mapping: mmap.mmap | None
+    sink: FileSink | None
+    file_id: str | None
+    # Bytes written so far, including any kept from an earlier transfer
+    offset: int
+    saved_at: float
+    # Where ranges of files are written, or None to not accept them
+    striped: StripedFiles | None
+    # The file and the offset of the range that is being received, if the sender only sends a range
+    stripe: StripedFile | None
+    stripe_offset: int
+
+    def __init__(self, path_for: Callable[[str | None], Path], interval: float = 1, striped: StripedFiles | None = None, policy: WritePolicy | None = None) -> None:
+        """
+        @param path_for  Chooses where to write given the file's identifier, or None if the sender didn't send one.
+        @param interval  The time between checkpoints in seconds.
+        @param striped  Where ranges of files are written, shared by every connection that may send a range of the same file.
+                        Senders of ranges aren't resumed without it, so they send the whole range to this file.
+        @param policy  How to write the file. Defaults to a write buffer that is synced at every checkpoint.
+        """
+        self.path_for = path_for
+        self.interval = interval
+        self.policy = policy if policy is not None else WritePolicy()
+        self.path = None
+        self.fd = None
+        self.mapping = None
+        self.sink = None
+        self.file_id = None
+        self.offset = 0
+        self.saved_at = time.monotonic()
+        self.striped = striped
+        self.stripe = None
+        self.stripe_offset = 0
+
+    def checkpoint_path(self) -> Path:
+        assert self.path is not None
+        return checkpoint_path(self.path)
+
+    def load_checkpoint(self) -> int:
+        """
+        @return  How many bytes of the file an earlier transfer of the same file wrote, or 0 if there is no such checkpoint.
+        """
+        assert self.path is not None
+        try:
+            checkpoint = json.loads(self.checkpoint_path().read_text())
+            size = self.path.stat().st_size
+        except (OSError, ValueError):
+            return 0
+        if not isinstance(checkpoint, dict) or checkpoint.get("file_id") != self.file_id:
+            return 0
+        offset = checkpoint.get("offset")
+        if not isinstance(offset, int) or not 0 <= offset <= size:
+            return 0
+        return offset
+
+    def resume(self, file_id: str) -> int:
+        """
+        Opens the file being sent, keeping the data an earlier transfer of it wrote up to its checkpoint.
+        Meant to be a receiver's resume callback, so it may be called again if the handshake is repeated.
+        @param file_id  The sender's identifier for the file. See file_id().
+        @return  How many bytes the sender can skip.
+        """
+        stripe = parse_stripe_id(file_id)
+        if stripe is not None and self.striped is not None:
+            self.close()
+            file_id, self.stripe_offset, length = stripe
+            self.stripe = self.striped.open(file_id)
+            self.path = self.stripe.path
+            self.offset = self.stripe.resume(self.stripe_offset, length)
+            return self.offset
+        if not FILE_ID.fullmatch(file_id):
+            # Not something this receiver sent out, and not safe to use in a path
+            return 0
+        self.close()
+        self.file_id = file_id
+        self.path = self.path_for(file_id)
+        self.offset = self.load_checkpoint()
+        self.open(file_size(file_id))
+        if self.offset > 0:
+            print(f"Resuming '{self.path}' from byte {self.offset}.")
+        self.saved_at = time.monotonic()
+        return self.offset
+
+    def open(self, size: int | None):
+        """
+        Opens the file at path to write from offset, discarding anything after it, and preallocates it if its size is known.
+        @param size  The size of the whole file, or None if it isn't known.
+        """
+        assert self.path is not None
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        # Anything past the checkpoint may not have been flushed before the interruption
+        os.ftruncate(self.fd, self.offset)
+        self.mapping = self.policy.map(self.fd, size)
+        self.sink = self.policy.sink(self.fd, self.offset, self.mapping)
+
+    def write(self, block: Buffer):
+        """
+        Appends data to the file, and saves a checkpoint if one is due.
+        @param block  The data.
+        """
+        if self.stripe is not None:
+            self.stripe.write(self.stripe_offset, block)
+            self.offset += len(block)
+            return
+        if self.sink is None:
+            # The sender didn't identify the file, so it can't be resumed
+            self.path = self.path_for(None)
+            self.open(None)
+            assert self.sink is not None
+        self.sink.write(block)
+        self.offset += len(block)
+        if self.file_id is not None and time.monotonic() - self.saved_at >= self.interval:
+            self.save()
+
+    def save(self):
+        """
+        Saves a checkpoint once the data written so far is on disk, unless the policy never syncs.
+        The checkpoint is replaced atomically, so a crash leaves either the old one or the new one.
+        """
+        assert self.sink is not None
+        if self.policy.fsync == "never":
+            return
+        self.sink.sync()
+        write_checkpoint(self.checkpoint_path(), {
+                         "file_id": self.file_id, "offset": self.offset})
+        self.saved_at = time.monotonic()
+
+    def verify(self) -> bool:
+        """
+        @return  Whether the file's contents match the hash in its identifier, or True if the sender didn't send one.
+        """
+        assert self.path is not None
+        if self.file_id is None:
+            return True
+        with open(self.path, "rb") as file:
+            return file_id(file) == self.file_id
+
+    def finish(self) -> bool:
+        """
+        Checks the file against the hash in its identifier, then closes it and removes its checkpoint, since there's nothing left to resume.
+        A file that doesn't match is closed with its checkpoint kept, so the transfer can be resumed, or retried from the start.
+        @return  Whether the whole file has been received intact, which for a range of a file is once every range has.
+        """
+        if self.stripe is not None:
+            return self.stripe.finish_range(self.stripe_offset)
+        if self.sink is None:
+            self.write(bytes(0))
+        assert self.fd is not None and self.sink is not None
+        self.sink.flush()
+        if not self.verify():
+            print(f"[FAIL] '{self.path}' doesn't match the hash it was sent with, so its checkpoint is kept.")
+            assert self.file_id is not None
+            if self.offset < file_size(self.file_id):
+                # The sender sent less than it announced, so a resumed transfer picks up where it stopped
+                self.save()
+            self.close()
+            return False
+        self.sink.close()
+        if self.mapping is not None:
+            self.mapping.close()
+            self.mapping = None
+        self.policy.sync(self.fd)
+        os.close(self.fd)
+        self.fd = None
+        self.sink = None
+        assert self.path is not None
+        self.checkpoint_path().unlink(missing_ok=True)
+        return True
+
+    def checkpoint(self):
+        """
+        Saves a checkpoint of everything received so far, for a transfer whose sender has gone away,
+        so that a transfer that is resumed later doesn't have to start from an older one.
+        """
+        if self.stripe is not None:
+            self.stripe.checkpoint(self.stripe_offset)
+        elif self.sink is not None and self.file_id is not None:
+            self.save()
+
+    def close(self):
+        """
+        Closes the file without saving a checkpoint, so an interrupted transfer resumes from the last one.
+        A range of a file is left to its StripedFile, which other connections may still be writing to.
+        """
+        self.stripe = None
+        if self.fd is not None:
+            assert self.sink is not None
+            self.sink.close()
+            if self.mapping is not None:
+                self.mapping.close()
+            os.close(self.fd)
+            self.fd = None
+            self.mapping = None
+            self.sink = None
@@ -1,24 +1,97 @@
-from typing import Any, Callable
-from sched import scheduler
+from typing import Any, Callable, Iterator
 from time import time, sleep
-from random import random, randrange
+from random import Random
+from threading import Lock
+from link import Link, RED, GilbertElliott
+from capture import Capture, INBOUND, OUTBOUND
+import copy
+import heapq
+import itertools
+import math
+
+
+def geometric(rng: Random, p: float) -> int:
+    """
+    Draws how many trials succeed before the first failure, where each trial succeeds with probability p.
+    Uses a single random draw however many trials there are.
+    @param rng  The random number generator to draw from.
+    @param p  The probability of each trial succeeding, which must be less than 1.
+    @return  The number of successes, which is at least n with probability p^n.
+    """
+    if p <= 0:
+        return 0
+    # 1 - random() is in (0, 1], so the log is defined
+    return int(math.log(1 - rng.random()) / math.log(p))
 
 
 class Router:
-    """A simulated unreliable router that can drop, corrupt, and delay packets."""
+    """
+    A simulated unreliable router that can drop, corrupt, delay, reorder and duplicate packets,
+    and can model a bottleneck link with a bounded queue on each port.
+    All random decisions come from the router's own generator, so runs with the same seed impair the same packets.
+    Packets in flight wait in a heap ordered by delivery time, which whoever drives the router drains with deliver_due.
+    """
     drop_chance: float
+    # Chance of flipping a(nother) random bit, applied repeatedly, so the number of flips is geometric
     corrupt_chance: float
+    # Chance of each individual bit being flipped, so the number of flips is binomial
+    bit_error_rate: float
+    # Propagation delay range, on top of any queueing and serialization delay
     min_delay: float
     max_delay: float
+    # Chance of holding a packet back by up to reorder_delay seconds, so later packets overtake it
+    reorder_chance: float
+    reorder_delay: float
+    duplicate_chance: float
+    # Link settings for each port. RED and burst loss are copied per port, since they have state.
+    bandwidth: float | None
+    queue_limit: int | None
+    red: RED | None
+    burst_loss: GilbertElliott | None
     auto_start: bool
+    # Records each packet as it's transmitted, annotated with what the router did to it, and again as it's delivered
+    capture: Capture | None
+    # Each port's interface ID in the capture
+    capture_ports: dict[int, int]
 
     rxs: dict[int, list[Callable[[bytes], None]]]
-    sch: scheduler
+    links: dict[int, Link]
+    # Packets in flight as (delivery time, tie breaker, port, packet)
+    pending: list[tuple[float, int, int, bytes]]
+    order: Iterator[int]
+    clock: Callable[[], float]
+    rng: Random
+    # Packets may be transmitted from several threads
+    lock: Lock
 
-    def __init__(self) -> None:
+    def __init__(self, seed: int | None = None, clock: Callable[[], float] = time) -> None:
+        """
+        @param seed  Seed for the router's random decisions, or None for an unpredictable seed.
+        @param clock  Returns the current time in seconds.
+        """
         self.rxs = dict()
-        self.sch = scheduler(time, sleep)
+        self.pending = list()
+        # Packets due at the same time are delivered in the order they were scheduled
+        self.order = itertools.count()
+        self.clock = clock
         self.auto_start = False
+        self.rng = Random(seed)
+        self.drop_chance = 0
+        self.corrupt_chance = 0
+        self.bit_error_rate = 0
+        self.min_delay = 0
+        self.max_delay = 0
+        self.reorder_chance = 0
+        self.reorder_delay = 0
+        self.duplicate_chance = 0
+        self.bandwidth = None
+        self.queue_limit = None
+        self.red = None
+        self.burst_loss = None
+        self.links = dict()
+        self.capture = None
+        self.capture_ports = dict()
+        self.lock = Lock()
 
     def register_rx(self, port: int, rx: Callable[[bytes], Any]):
         """
@@ -47,48 +120,148 @@ class Router:
         @param port    The port number to send the packet to.
         @param packet  The packet data to send.
         """
+        self.trace(port, packet, OUTBOUND)
         for rx_handler in self.rxs.get(port, list()):
             rx_handler(packet)
 
+    def link(self, port: int) -> Link:
+        """
+        @param port  The port number.
+        @return  The link that packets to the port are queued on, created from the link settings on first use.
+        """
+        if port not in self.links:
+            self.links[port] = Link(self.bandwidth, self.queue_limit,
+                                    copy.copy(self.red), copy.copy(self.burst_loss))
+        return self.links[port]
+
+    def error_bits(self, bit_len: int) -> list[int]:
+        """
+        Picks which bits of a packet to flip, based on the corrupt_chance and bit_error_rate.
+        The cost is proportional to the number of flipped bits rather than to the packet size.
+        @param bit_len  The size of the packet in bits.
+        @return  The indices of the bits to flip.
+        """
+        if bit_len == 0:
+            return []
+
+        if self.corrupt_chance >= 1:
+            cnt = bit_len
+        else:
+            cnt = min(geometric(self.rng, self.corrupt_chance), bit_len)
+        bits = [self.rng.randrange(bit_len) for _ in range(cnt)]
+
+        if self.bit_error_rate >= 1:
+            bits.extend(range(bit_len))
+        elif self.bit_error_rate > 0:
+            # Skip straight to each erroneous bit, the gaps between them being geometric
+            bit = geometric(self.rng, 1 - self.bit_error_rate)
+            while bit < bit_len:
+                bits.append(bit)
+                bit += 1 + geometric(self.rng, 1 - self.bit_error_rate)
+        return bits
+
     def corrupt_packet(self, packet: bytes) -> bytes:
         """
-        Corrupts a packet by flipping random bits based on the corrupt_chance.
+        Corrupts a packet by flipping random bits based on the corrupt_chance and bit_error_rate.
         @param packet  The original packet bytes.
-        @return  The corrupted packet bytes.
+        @return  The corrupted packet bytes, which is the original packet itself if no bits were flipped.
         """
-        bit_len = len(packet) * 8
+        bits = self.error_bits(len(packet) * 8)
+        if not bits:
+            return packet
 
         result = bytearray(packet)
-        cnt = 0
-        while random() < self.corrupt_chance and cnt < bit_len:
-            bit = randrange(0, bit_len)
+        for bit in bits:
             byte_idx = bit // 8
             bit_idx = bit % 8
             result[byte_idx] ^= 1 << bit_idx
-            cnt += 1
 
         return bytes(result)
 
     def tx(self, port: int, packet: bytes):
         """
-        Transmits a packet on a given port, potentially dropping, corrupting, and delaying it.
+        Transmits a packet on a given port, potentially dropping, corrupting, queueing, delaying, reordering and duplicating it.
         @param port    The port number to send the packet to.
-        @param packet  The packet data to send.
+        @param packet  The packet data to send. Must not be a view into a buffer that gets reused, since it is held until delivered.
         """
-        if random() < self.drop_chance:
-            return
+        with self.lock:
+            link = self.link(port)
+            if self.rng.random() < self.drop_chance or link.lose(self.rng):
+                self.trace(port, packet, INBOUND, "dropped")
+                return
+
+            corrupted = self.corrupt_packet(packet)
 
-        packet = self.corrupt_packet(packet)
+            now = self.clock()
+            departure = link.enqueue(now, len(corrupted), self.rng)
+            if departure is None:
+                self.trace(port, packet, INBOUND, "dropped, queue full")
+                return
 
-        delay = self.min_delay + random() * (self.max_delay - self.min_delay)
-        self.sch.enter(delay, 0, lambda: self.output_packet(port, packet), ())
+            copies = 2 if self.duplicate_chance and self.rng.random() < self.duplicate_chance else 1
+            reordered = False
+            for _ in range(copies):
+                delay = departure - now + self.min_delay + \
+                    self.rng.random() * (self.max_delay - self.min_delay)
+                if self.reorder_chance and self.rng.random() < self.reorder_chance:
+                    delay += self.rng.random() * self.reorder_delay
+                    reordered = True
+                heapq.heappush(self.pending, (now + delay, next(self.order), port, corrupted))
+
+            if self.capture is not None:
+                notes = [note for note, applies in [("corrupted", corrupted is not packet),
+                                                    ("duplicated", copies > 1), ("reordered", reordered)] if applies]
+                self.trace(port, packet, INBOUND, ", ".join(notes) or None)
 
         if self.auto_start:
             self.start(False)
 
+    def trace(self, port: int, packet: bytes, direction: int, note: str | None = None):
+        """
+        Records a packet in the capture, if there is one.
+        @param port  The port the packet was transmitted to.
+        @param packet  The packet.
+        @param direction  INBOUND as it's transmitted, or OUTBOUND as it's delivered.
+        @param note  What the router did to the packet.
+        """
+        if self.capture is None:
+            return
+        if port not in self.capture_ports:
+            self.capture_ports[port] = self.capture.interface(f"router port {port}")
+        self.capture.record(self.capture_ports[port], self.clock(), packet, direction, note)
+
+    def next_deadline(self) -> float | None:
+        """
+        @return  When the next packet in flight is due to be delivered, or None if no packets are in flight.
+        """
+        with self.lock:
+            return self.pending[0][0] if self.pending else None
+
+    def deliver_due(self) -> int:
+        """
+        Delivers every packet in flight that is due.
+        @return  The number of packets delivered.
+        """
+        due: list[tuple[int, bytes]] = list()
+        with self.lock:
+            now = self.clock()
+            while self.pending and self.pending[0][0] <= now:
+                _, _, port, packet = heapq.heappop(self.pending)
+                due.append((port, packet))
+        # Receivers may transmit in response, so they're called without holding the lock
+        for port, packet in due:
+            self.output_packet(port, packet)
+        return len(due)
+
     def start(self, blocking: bool = True):
         """
-        Starts the router's scheduler to process events.
-        @param blocking  If True, blocks until all scheduled events are processed.
+        Delivers packets in flight as they become due.
+        @param blocking  If True, blocks until every packet in flight has been delivered. Otherwise only delivers the packets that are already due.
         """
-        self.sch.run(blocking=blocking)
+        self.deliver_due()
+        while blocking:
+            deadline = self.next_deadline()
+            if deadline is None:
+                break
+            sleep(max(deadline - self.clock(), 0))
+            self.deliver_due()
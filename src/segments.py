@@ -0,0 +1,178 @@
+from collections import deque
+from typing import BinaryIO, Callable, Iterable, Iterator
+import io
+import mmap
+
+# Anything that supports the buffer protocol and can be sent as a payload
+Buffer = bytes | bytearray | memoryview
+
+
+def split_segments(data: Buffer, mss: Callable[[], int]) -> Iterator[memoryview]:
+    """
+    Splits a buffer into segments without copying it.
+    Empty data produces a single empty segment.
+    @param data  The data to split.
+    @param mss  Returns the maximum segment size at the time each segment is cut.
+    @return  An iterator over memoryview slices of the data.
+    """
+    view = memoryview(data).cast("B")
+    if len(view) == 0:
+        yield view
+        return
+    pos = 0
+    while pos < len(view):
+        size = mss()
+        yield view[pos:pos+size]
+        pos += size
+
+
+def file_segments(file: BinaryIO, mss: Callable[[], int]) -> Iterator[Buffer]:
+    """
+    Lazily splits the rest of a binary file into segments.
+    Regular files are memory-mapped so segments are slices of the page cache rather than copies.
+    Anything that can't be mapped (pipes, sockets, in-memory files) is read one segment at a time.
+    An empty file produces no segments.
+    @param file  The file to read from its current position.
+    @param mss  Returns the maximum segment size at the time each segment is cut.
+    @return  An iterator over the file's segments.
+    """
+    try:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError, io.UnsupportedOperation):
+        # Not mappable or empty
+        while chunk := file.read(mss()):
+            yield chunk
+        return
+
+    view = memoryview(mapped)
+    try:
+        pos = file.tell()
+        while pos < len(view):
+            size = mss()
+            yield view[pos:pos+size]
+            pos += size
+    finally:
+        # Unmaps the file once iteration ends or the generator is closed.
+        # Segments that are still in flight keep it mapped, and it's unmapped once the last of them is dropped.
+        view.release()
+        try:
+            mapped.close()
+        except BufferError:
+            pass
+
+
+def iter_segments(data: Buffer | BinaryIO | Iterable[Buffer], mss: Callable[[], int]) -> Iterator[Buffer]:
+    """
+    Lazily splits any supported data source into segments.
+    @param data  A buffer, a binary file object, or an iterable of buffers. Each buffer of an iterable is split on its own.
+    @param mss  Returns the maximum segment size at the time each segment is cut.
+    @return  An iterator over the segments.
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return split_segments(data, mss)
+    if hasattr(data, "read"):
+        return file_segments(data, mss)  # type: ignore
+    return (seg for chunk in data for seg in split_segments(chunk, mss))  # type: ignore
+
+
+class SegmentBuffer:
+    """
+    Ring buffer of the segments in the send window.
+    Segments are pulled from the queued sources only when the window reaches them
+    and their slots are reused once acknowledged, so memory use is bounded by the window rather than the data size.
+    Every operation takes constant time, however large the window.
+    """
+    slots: list[Buffer | None]
+    # The number of bytes loaded before each slot's segment, so the size of a run of segments is a subtraction
+    starts: list[int]
+    # The number of bytes loaded so far
+    loaded: int
+    sources: deque[Iterator[Buffer]]
+    # Oldest retained seq
+    base: int
+    # One past the newest loaded seq
+    end: int
+    # The seq of the final segment, known once every source has been exhausted
+    final_seq: int | None
+
+    def __init__(self, capacity: int, first_seq: int = 1) -> None:
+        """
+        @param capacity  The maximum number of segments retained at once, i.e. the largest window.
+        @param first_seq  The sequence number of the first segment.
+        """
+        assert capacity > 0
+        self.slots = [None] * capacity
+        self.starts = [0] * capacity
+        self.loaded = 0
+        self.sources = deque()
+        self.base = first_seq
+        self.end = first_seq
+        self.final_seq = None
+
+    def push(self, source: Iterator[Buffer]):
+        """
+        Queues a source of segments after all previously queued sources.
+        @param source  An iterator over segments.
+        """
+        self.sources.append(source)
+        self.final_seq = None
+
+    def fill(self, seq: int) -> int:
+        """
+        Loads segments from the sources until the given seq is loaded or the sources run out.
+        @param seq  The highest seq to load.
+        @return  The highest seq that is loaded and at most the given seq. This is base - 1 if no segments are available.
+        """
+        while self.end <= seq and self.final_seq is None:
+            assert self.end - self.base < len(self.slots), "Window exceeds segment buffer capacity"
+            segment = None
+            while self.sources:
+                segment = next(self.sources[0], None)
+                if segment is not None:
+                    break
+                self.sources.popleft()
+            if segment is None:
+                self.final_seq = self.end - 1
+                break
+            self.slots[self.end % len(self.slots)] = segment
+            self.starts[self.end % len(self.slots)] = self.loaded
+            self.loaded += len(segment)
+            self.end += 1
+        return min(seq, self.end - 1)
+
+    def release(self, seq: int):
+        """
+        Drops every segment before the given seq.
+        Their slots keep the segments until they're reused, which is no more than a full window holds anyway.
+        @param seq  The oldest seq to keep.
+        """
+        self.base = max(self.base, min(seq, self.end))
+
+    def span(self, first: int, last: int) -> int:
+        """
+        @param first  The first seq of a run of retained segments.
+        @param last  The last seq of the run.
+        @return  The total size of the segments, in bytes.
+        """
+        assert self.base <= first and last < self.end
+        end = self.loaded if last + 1 == self.end else self.starts[(last + 1) % len(self.slots)]
+        return end - self.starts[first % len(self.slots)]
+
+    def done(self, seq: int) -> bool:
+        """
+        @param seq  A sequence number.
+        @return  True if the given seq is past the final segment.
+        """
+        return self.final_seq is not None and seq > self.final_seq
+
+    def total(self) -> str:
+        """
+        @return  The final seq for display, or "?" if it isn't known yet.
+        """
+        return "?" if self.final_seq is None else str(self.final_seq)
+
+    def __getitem__(self, seq: int) -> Buffer:
+        assert self.base <= seq < self.end
+        segment = self.slots[seq % len(self.slots)]
+        assert segment is not None
+        return segment
@@ -0,0 +1,197 @@
+from typing import Any, Callable, Iterator
+from collections import deque
+from rdt import GoBackNClient, GoBackNReceiver
+from router import Router
+from segments import Buffer
+import heapq
+import itertools
+import math
+import sched
+
+
+class SimulatedNetwork:
+    """
+    Connects endpoints in memory through a Router, on a virtual clock that jumps straight to the next event.
+    Everything runs on the caller's thread: whoever is waiting (a scheduler sleeping or a client receiving)
+    advances the clock and delivers the packets that come due in the meantime.
+    Given the same seed, every run makes the same decisions, and delays cost no real time.
+    """
+    router: Router
+    # The virtual time in seconds, starting at 0
+    now: float
+    # Actions to run at a virtual time, as (time, tie breaker, action)
+    timers: list[tuple[float, int, Callable[[], Any]]]
+    order: Iterator[int]
+
+    def __init__(self, router: Router | None = None, seed: int | None = None) -> None:
+        """
+        @param router  The router that connects the endpoints, whose clock is replaced by the virtual one. A lossless router is created by default.
+        @param seed  Seed for the default router's random decisions.
+        """
+        self.router = router if router is not None else Router(seed)
+        self.router.clock = self.time
+        self.now = 0
+        self.timers = list()
+        self.order = itertools.count()
+
+    def time(self) -> float:
+        """
+        @return  The current virtual time in seconds.
+        """
+        return self.now
+
+    def call_at(self, when: float, action: Callable[[], Any]):
+        """
+        Runs an action once the virtual clock reaches the given time, for endpoints that aren't driven by a scheduler.
+        @param when  The virtual time to run the action at.
+        @param action  The action to run.
+        """
+        heapq.heappush(self.timers, (when, next(self.order), action))
+
+    def run_until(self, until: float, stop: Callable[[], bool] | None = None) -> bool:
+        """
+        Advances the virtual clock, delivering packets in flight and running timers in the order they come due.
+        @param until  The virtual time to advance to, if not stopped first.
+        @param stop  Checked after each delivery or timer, stopping the clock at that point once it returns True.
+        @return  Whether stop returned True.
+        """
+        while True:
+            if stop is not None and stop():
+                return True
+            deadline = self.router.next_deadline()
+            timer = self.timers[0][0] if self.timers else None
+            if timer is not None and (deadline is None or timer < deadline):
+                deadline = timer
+            if deadline is None or deadline > until:
+                # Nothing will ever happen if nothing is in flight, so waiting forever ends right away
+                if not math.isinf(until):
+                    self.now = max(self.now, until)
+                return False
+            self.now = max(self.now, deadline)
+            if deadline == timer:
+                _, _, action = heapq.heappop(self.timers)
+                action()
+            else:
+                self.router.deliver_due()
+
+    def transmit(self, port: int, packet: Buffer):
+        """
+        Transmits a packet through the router.
+        @param port  The router port to transmit to.
+        @param packet  The packet, which is copied since the router holds it until delivered.
+        """
+        self.router.tx(port, bytes(packet))
+
+    def connect(self, timeout: float, a_port: int = 1, b_port: int = 2) -> tuple["SimulatedClient", "SimulatedClient"]:
+        """
+        Creates a pair of clients that are connected to each other.
+        Each client receives on its own router port, so each direction has its own link.
+        @param timeout  The receive timeout of both clients, in virtual seconds.
+        @param a_port  The router port of the first client.
+        @param b_port  The router port of the second client.
+        @return  The two clients.
+        """
+        return SimulatedClient(self, a_port, b_port, timeout), SimulatedClient(self, b_port, a_port, timeout)
+
+
+class SimulatedScheduler(sched.scheduler):
+    """
+    A sched.scheduler that sleeps on a SimulatedNetwork's virtual clock.
+    Like WakeableScheduler, sleeps are cut short whenever an event is entered,
+    which here happens when a delivered packet schedules something.
+    """
+    network: SimulatedNetwork
+    woken: bool
+
+    def __init__(self, network: SimulatedNetwork) -> None:
+        self.network = network
+        self.woken = False
+        super().__init__(network.time, self.delay)
+
+    def delay(self, duration: float):
+        """
+        Runs the network for the given duration or until an event is entered.
+        @param duration  The maximum virtual time to sleep, in seconds.
+        """
+        self.woken = False
+        self.network.run_until(self.network.time() + duration,
+                               lambda: self.woken)
+
+    def enterabs(self, *args: Any, **kwargs: Any) -> sched.Event:
+        ev = super().enterabs(*args, **kwargs)
+        self.woken = True
+        return ev
+
+
+class SimulatedClient(GoBackNClient):
+    """
+    A client on one port of a SimulatedNetwork.
+    Senders are driven by the scheduler it creates, and receivers either by its listen() callback or by calling recv(),
+    which both run the network, so no threads are needed.
+    """
+    network: SimulatedNetwork
+    port: int
+    peer_port: int
+    # Packets received while nothing is listening
+    inbox: deque[bytes]
+    on_packet: Callable[[Buffer], Any] | None
+
+    def __init__(self, network: SimulatedNetwork, port: int, peer_port: int, timeout: float) -> None:
+        """
+        @param network  The network to connect to.
+        @param port  The router port this client receives on.
+        @param peer_port  The router port of the other endpoint.
+        @param timeout  The receive timeout, in virtual seconds.
+        """
+        super().__init__(timeout)
+        self.network = network
+        self.port = port
+        self.peer_port = peer_port
+        self.inbox = deque()
+        self.on_packet = None
+        network.router.register_rx(port, self.receive)
+
+    def receive(self, packet: bytes):
+        """
+        Called by the router with each packet delivered to this client's port.
+        @param packet  The delivered packet.
+        """
+        if self.on_packet is not None:
+            self.on_packet(packet)
+        else:
+            self.inbox.append(packet)
+
+    def send(self, payload: Buffer):
+        self.network.transmit(self.peer_port, payload)
+
+    def recv(self, timeout: float | None = None) -> Buffer | None:
+        if not self.inbox:
+            self.network.run_until(self.network.time() + (self.timeout if timeout is None else timeout),
+                                   lambda: len(self.inbox) > 0)
+        return self.inbox.popleft() if self.inbox else None
+
+    def time(self) -> float:
+        return self.network.time()
+
+    def create_scheduler(self) -> sched.scheduler:
+        return SimulatedScheduler(self.network)
+
+    def serve(self, receiver: GoBackNReceiver, deliver: Callable[[Buffer], bool]):
+        """
+        Drives a receiver with the packets that arrive on this client, and sends its held back ACKs on time.
+        @param receiver  The receiver, whose client must be this one.
+        @param deliver  The receiver's delivery callback.
+        """
+        def on_packet(pkt: Buffer):
+            armed = receiver.ack_deadline
+            receiver.handle_packet(pkt, deliver)
+            if receiver.ack_deadline is not None and receiver.ack_deadline != armed:
+                self.network.call_at(receiver.ack_deadline, receiver.flush_ack)
+        self.listen(on_packet)
+
+    def listen(self, on_packet: Callable[[Buffer], Any] | None) -> bool:
+        self.on_packet = on_packet
+        # Hand over anything that arrived before listening started
+        while on_packet is not None and self.inbox:
+            on_packet(self.inbox.popleft())
+        return True
@@ -0,0 +1,235 @@
+from segments import Buffer
+import errno
+import mmap
+import os
+
+# When received data is forced to disk: after every write to the file, before each checkpoint is saved (so a resumed transfer
+# never trusts data a crash could have lost), or never, which leaves it to the OS and saves no checkpoints at all
+FSYNC_POLICIES = ["always", "checkpoint", "never"]
+# Default size of a sink's write buffer, which is also the alignment of its writes
+WRITE_BUFFER = 1 << 20
+
+
+def preallocate(fd: int, size: int) -> bool:
+    """
+    Reserves the disk space for a file of a known size up front, so it isn't extended a little at a time as it's written,
+    and a full disk is noticed before the transfer rather than partway through it.
+    Falls back to setting the file's size where the platform or filesystem can't reserve space.
+    @param fd  The file.
+    @param size  The size of the file, in bytes.
+    @return  Whether the space was actually reserved.
+    """
+    if size > 0 and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return True
+        except OSError as e:
+            if e.errno not in (errno.EOPNOTSUPP, errno.EINVAL, errno.ENOSYS):
+                raise
+    if os.fstat(fd).st_size < size:
+        os.ftruncate(fd, size)
+    return False
+
+
+class FileSink:
+    """
+    Writes data that is received in order to a file, starting at a given offset.
+    Sinks of different byte ranges may share a file, but each sink must only be used by one thread.
+    """
+    fd: int
+    fsync: str
+    # The file offset after the last byte passed to write()
+    position: int
+    # The file offset up to which data has been handed to the OS, so that syncing the file makes it durable
+    flushed: int
+
+    def write(self, block: Buffer):
+        """
+        @param block  The data to append.
+        """
+        raise NotImplementedError()
+
+    def flush(self):
+        """
+        Hands any data the sink is holding on to over to the OS, and syncs it if the fsync policy is "always".
+        """
+        raise NotImplementedError()
+
+    def sync(self):
+        """
+        Flushes the sink and waits until the data is on disk.
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """
+        Flushes the sink. The file itself is left open for its owner to close.
+        """
+        self.flush()
+
+
+class BufferedSink(FileSink):
+    """
+    Collects delivered segments in a buffer and writes it out with a single os.pwrite whenever the data reaches the next multiple
+    of the buffer's size in the file, so rather than a small write per segment, writes are large and aligned.
+    """
+    buf: bytearray
+    # Bytes in buf, which belong at flushed in the file
+    fill: int
+    # How full buf gets before it's written out, which is where the data reaches the next multiple of the buffer's size
+    limit: int
+
+    def __init__(self, fd: int, offset: int, buffer_size: int = WRITE_BUFFER, fsync: str = "checkpoint") -> None:
+        """
+        @param fd  The file, opened for writing.
+        @param offset  Where in the file to start writing.
+        @param buffer_size  The size of the write buffer and the alignment of the writes, in bytes.
+        @param fsync  One of FSYNC_POLICIES.
+        """
+        assert buffer_size > 0 and fsync in FSYNC_POLICIES
+        self.fd = fd
+        self.fsync = fsync
+        self.buf = bytearray(buffer_size)
+        self.fill = 0
+        self.position = self.flushed = offset
+        # A resumed sink starts unaligned, so its first write is cut short at the next boundary
+        self.limit = buffer_size - offset % buffer_size
+
+    def write(self, block: Buffer):
+        end = self.fill + len(block)
+        if end < self.limit:
+            # The common case of a segment that fits, which is a single copy
+            self.buf[self.fill:end] = block
+            self.fill = end
+            self.position += len(block)
+            return
+        view = memoryview(block).cast("B")
+        while len(view) > 0:
+            size = min(self.limit - self.fill, len(view))
+            self.buf[self.fill:self.fill+size] = view[:size]
+            self.fill += size
+            self.position += size
+            view = view[size:]
+            if self.fill == self.limit:
+                self.flush()
+
+    def flush(self):
+        view = memoryview(self.buf)[:self.fill]
+        while len(view) > 0:
+            written = os.pwrite(self.fd, view, self.flushed)
+            self.flushed += written
+            view = view[written:]
+        self.fill = 0
+        self.limit = len(self.buf) - self.flushed % len(self.buf)
+        if self.fsync == "always":
+            os.fsync(self.fd)
+
+    def sync(self):
+        self.flush()
+        if self.fsync != "always":
+            os.fsync(self.fd)
+
+
+class MappedSink(FileSink):
+    """
+    Copies delivered segments straight into a memory mapping of a preallocated file, leaving it to the OS to write the pages back,
+    which saves a copy and a system call per write. The data can't go past the end of the mapping.
+    """
+    mapping: mmap.mmap
+    # Bytes between syncs with the "always" policy, and the offset up to which the data has been synced
+    sync_interval: int
+    synced: int
+
+    def __init__(self, mapping: mmap.mmap, fd: int, offset: int, sync_interval: int = WRITE_BUFFER, fsync: str = "checkpoint") -> None:
+        """
+        @param mapping  A shared, writable mapping of the whole file.
+        @param fd  The mapped file.
+        @param offset  Where in the file to start writing.
+        @param sync_interval  How many bytes to write between syncs with the "always" policy, like BufferedSink's buffer size.
+        @param fsync  One of FSYNC_POLICIES.
+        """
+        assert sync_interval > 0 and fsync in FSYNC_POLICIES
+        self.mapping = mapping
+        self.fd = fd
+        self.fsync = fsync
+        self.sync_interval = sync_interval
+        self.position = self.flushed = self.synced = offset
+
+    def write(self, block: Buffer):
+        end = self.position + len(block)
+        if end > len(self.mapping):
+            raise ValueError(f"Data past the end of the {len(self.mapping)} byte file")
+        self.mapping[self.position:end] = block
+        # The mapping is the page cache, so the data is already the OS's to write back
+        self.position = self.flushed = end
+        if self.fsync == "always" and end - self.synced >= self.sync_interval:
+            self.sync()
+
+    def flush(self):
+        if self.fsync == "always":
+            self.sync()
+
+    def sync(self):
+        if self.position == self.synced:
+            return
+        # Only whole pages can be synced
+        start = self.synced - self.synced % mmap.PAGESIZE
+        self.mapping.flush(start, self.position - start)
+        self.synced = self.position
+
+
+class WritePolicy:
+    """How received files are written to disk: the fsync policy, the size of the write buffer, and whether to write through a memory mapping."""
+    fsync: str
+    buffer_size: int
+    # Write files of a known size through a memory mapping rather than a write buffer
+    use_mmap: bool
+
+    def __init__(self, fsync: str = "checkpoint", buffer_size: int = WRITE_BUFFER, use_mmap: bool = False) -> None:
+        """
+        @param fsync  One of FSYNC_POLICIES.
+        @param buffer_size  The size of each write buffer, in bytes.
+        @param use_mmap  Write files of a known size through a memory mapping.
+        """
+        assert fsync in FSYNC_POLICIES and buffer_size > 0
+        self.fsync = fsync
+        self.buffer_size = buffer_size
+        self.use_mmap = use_mmap
+
+    def map(self, fd: int, size: int | None) -> mmap.mmap | None:
+        """
+        Preallocates a file if its size is known, and maps it into memory if the policy writes through a mapping.
+        @param fd  The file, opened for reading and writing.
+        @param size  The size of the file, or None if it isn't known.
+        @return  The mapping, or None if the file is to be written through a buffer.
+        """
+        if size is None:
+            return None
+        preallocate(fd, size)
+        if not self.use_mmap or size == 0:
+            return None
+        return mmap.mmap(fd, size)
+
+    def sink(self, fd: int, offset: int, mapping: mmap.mmap | None = None) -> FileSink:
+        """
+        @param fd  The file.
+        @param offset  Where in the file to start writing.
+        @param mapping  The file's mapping from map(), if any.
+        @return  A sink that writes to the file from the offset.
+        """
+        if mapping is not None:
+            return MappedSink(mapping, fd, offset, self.buffer_size, self.fsync)
+        return BufferedSink(fd, offset, self.buffer_size, self.fsync)
+
+    def sync(self, fd: int, mapping: mmap.mmap | None = None):
+        """
+        Waits until everything that has been flushed to a file is on disk, unless the policy never syncs.
+        @param fd  The file.
+        @param mapping  The file's mapping from map(), if any.
+        """
+        if self.fsync == "never":
+            return
+        if mapping is not None:
+            mapping.flush()
+        else:
+            os.fsync(fd)
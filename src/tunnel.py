@@ -1,34 +1,95 @@
-from UDPDuplex import UDPDuplex
+from UDPDuplex import UDPDuplex, JoinedUDPHandle
 from router import Router
-from time import sleep
+from cfg import BUF_SIZE
+from selectors import DefaultSelector, EVENT_READ
+from socket import socket
+from threading import Event
 
 
 class UnstableTunnel:
-    """A tunnel that uses an unreliable router to transmit packets between two UDP interfaces."""
+    """
+    A tunnel that uses an unreliable router to transmit packets between two UDP interfaces.
+    Each direction goes through its own port on the router, so each direction has its own link queue.
+    A single loop owns both sockets and the router, and sleeps until either a packet arrives or the next packet in flight is due.
+    """
     router: Router
+    # Longest the loop sleeps before checking whether it has been stopped, in seconds
+    idle_timeout: float
+    # Most packets read from one socket before due packets are delivered again, so a flood can't hold up deliveries
+    batch_size: int
+    stop_event: Event
 
-    def __init__(self, inner_router: Router) -> None:
+    def __init__(self, inner_router: Router, idle_timeout: float = 0.5, batch_size: int = 64) -> None:
         """
         Initializes the UnstableTunnel with an inner Router instance.
         @param inner_router  The Router instance to use for simulating an unreliable network.
+        @param idle_timeout  Longest the loop sleeps before checking whether it has been stopped, in seconds.
+        @param batch_size  Most packets read from one socket at a time.
         """
         self.router = inner_router
+        self.idle_timeout = idle_timeout
+        self.batch_size = batch_size
+        self.stop_event = Event()
 
     def start(self, a_interface: UDPDuplex, b_interface: UDPDuplex):
         """
         Starts the tunnel between two UDP interfaces.
-        Note that this function blocks indefinitely.
+        Note that this function blocks until the tunnel is stopped.
         @param a_interface  The first UDPDuplex interface.
         @param b_interface  The second UDPDuplex interface.
         """
-        self.router.auto_start = True
-        with a_interface.create_handle() as a_handle, b_interface.create_handle() as b_handle:
-            self.router.register_rx(2, lambda packet: b_handle.send(packet))
-            self.router.register_rx(1, lambda packet: a_handle.send(packet))
+        a_handle = a_interface.create_handle()
+        b_handle = b_interface.create_handle()
+        with DefaultSelector() as selector:
+            # Packets received on one side are transmitted to the router port of the other side
+            handles = {2: a_handle.sock, 1: b_handle.sock}
+            for port, sock in handles.items():
+                sock.setblocking(False)
+                selector.register(sock, EVENT_READ, port)
+            self.router.register_rx(2, lambda packet: self.forward(b_handle, packet))
+            self.router.register_rx(1, lambda packet: self.forward(a_handle, packet))
 
-            a_handle.recv = lambda packet: self.router.tx(2, packet)
-            b_handle.recv = lambda packet: self.router.tx(1, packet)
+            try:
+                while not self.stop_event.is_set():
+                    deadline = self.router.next_deadline()
+                    timeout = self.idle_timeout
+                    if deadline is not None:
+                        timeout = min(max(deadline - self.router.clock(), 0), timeout)
 
-            # TODO This is really stupid but it does in fact work
-            while True:
-                sleep(1000)
+                    for key, _ in selector.select(timeout):
+                        self.drain(handles[key.data], key.data)
+                    self.router.deliver_due()
+            finally:
+                a_handle.close()
+                b_handle.close()
+
+    def drain(self, sock: socket, port: int):
+        """
+        Transmits the packets waiting on a socket to the router, up to the batch size.
+        @param sock  The socket to read from.
+        @param port  The router port to transmit to.
+        """
+        for _ in range(self.batch_size):
+            try:
+                packet = sock.recv(BUF_SIZE)
+            except (BlockingIOError, ConnectionRefusedError):
+                # Refused connections are ICMP errors for earlier sends, which the tunnel ignores like the network would
+                return
+            self.router.tx(port, packet)
+
+    def forward(self, handle: JoinedUDPHandle, packet: bytes):
+        """
+        Sends a packet out of the tunnel, dropping it if the socket's buffer is full.
+        @param handle  The handle to send from.
+        @param packet  The packet to send.
+        """
+        try:
+            handle.send(packet)
+        except (BlockingIOError, ConnectionRefusedError):
+            pass
+
+    def stop(self):
+        """
+        Stops the tunnel. Can be called from any thread.
+        """
+        self.stop_event.set()
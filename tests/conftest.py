@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The modules in src/ import each other by their flat names, as they do when the demos are run from src/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
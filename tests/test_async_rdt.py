@@ -0,0 +1,92 @@
+from random import Random
+from typing import Any, Callable, Tuple
+from async_rdt import AsyncGoBackNReceiver, AsyncGoBackNSender, DatagramGoBackNClient, RDTDatagramProtocol
+from codec import decode_data_packet, decode_options, encode_data_packet, encode_options
+from congestion import FixedRateControl
+from metrics import Metrics
+from segments import Buffer
+import asyncio
+
+
+class LoopbackTransport:
+    """A datagram transport that hands datagrams to the peer's protocol on the next turn of the event loop."""
+    peer: RDTDatagramProtocol
+    drop: Callable[[bytes], bool]
+    closed: bool
+
+    def __init__(self, peer: RDTDatagramProtocol, drop: Callable[[bytes], bool] = lambda _: False) -> None:
+        self.peer = peer
+        self.drop = drop
+        self.closed = False
+
+    def sendto(self, data: Buffer, addr: Any = None):
+        data = bytes(data)
+        if not self.closed and not self.drop(data):
+            asyncio.get_running_loop().call_soon(self.peer.datagram_received, data, ("localhost", 0))
+
+    def close(self):
+        self.closed = True
+
+
+def connect(drop: Callable[[bytes], bool] = lambda _: False) -> Tuple[DatagramGoBackNClient, RDTDatagramProtocol, DatagramGoBackNClient, RDTDatagramProtocol]:
+    sender_protocol = RDTDatagramProtocol()
+    receiver_protocol = RDTDatagramProtocol()
+    sender_client = DatagramGoBackNClient(LoopbackTransport(receiver_protocol, drop))  # type: ignore
+    receiver_client = DatagramGoBackNClient(LoopbackTransport(sender_protocol))  # type: ignore
+    return sender_client, sender_protocol, receiver_client, receiver_protocol
+
+
+async def transfer(data: bytes, drop: Callable[[bytes], bool] = lambda _: False, **kwargs: Any) -> bytes:
+    sender_client, sender_protocol, receiver_client, receiver_protocol = connect(drop)
+    receiver = AsyncGoBackNReceiver(receiver_client, receiver_protocol, linger=0.1)
+    sender = AsyncGoBackNSender(sender_client, sender_protocol, 8, cc=FixedRateControl(10**9), **kwargs)
+
+    async def receive() -> bytes:
+        return b"".join([bytes(chunk) async for chunk in receiver])
+
+    received, _ = await asyncio.gather(receive(), sender.send_stream(data))
+    return received
+
+
+def test_transfer():
+    data = Random(1).randbytes(10000)
+    assert asyncio.run(transfer(data, mss=100, negotiate=True)) == data
+
+
+def test_lost_segment_resent():
+    data = Random(1).randbytes(2000)
+    dropped: list[int] = []
+
+    def drop(packet: bytes) -> bool:
+        res = decode_data_packet(packet)
+        if res is not None and res[1] == 3 and not dropped:
+            dropped.append(res[1])
+            return True
+        return False
+
+    metrics = Metrics()
+    assert asyncio.run(transfer(data, drop, mss=100, observer=metrics)) == data
+    assert dropped == [3]
+    # Enough duplicate ACKs follow to resend the window right away
+    assert metrics.counters["timeouts"] == 0
+    assert metrics.counters["retransmits"] > 0
+
+
+def test_receiver_refuses_unsupported_options():
+    """The receiver delivers data as it arrives, so it leaves out of its SYN reply whatever would need more than that."""
+    sender_client, sender_protocol, receiver_client, receiver_protocol = connect()
+    replies: list[bytes] = []
+    sender_protocol.on_datagram = lambda pkt: replies.append(bytes(pkt))
+
+    async def handshake():
+        receiver = AsyncGoBackNReceiver(receiver_client, receiver_protocol, codecs=["zlib"], window=8)
+        sender_client.send(encode_data_packet(0, encode_options({"mss": 100, "fec": 4, "compress": "zlib"})))
+        await asyncio.sleep(0.01)
+        return receiver
+
+    receiver = asyncio.run(handshake())
+    assert len(replies) == 1
+    res = decode_data_packet(replies[0])
+    assert res is not None
+    assert decode_options(res[2]) == {"mss": 100}
+    assert receiver.fec is None and receiver.compress is None
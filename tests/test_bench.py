@@ -0,0 +1,31 @@
+from bench import BenchConfig, run_simulated, sweep, write_csv, write_json
+import csv
+import io
+import json
+
+
+def test_sweep():
+    configs = list(sweep(BenchConfig(seed=3), {"window_size": [4, 8], "drop": [0, 0.1]}))
+    assert [(c.window_size, c.drop) for c in configs] == [(4, 0), (4, 0.1), (8, 0), (8, 0.1)]
+    assert all(c.seed == 3 for c in configs)
+
+
+def test_run_simulated():
+    base = BenchConfig(size=20000, mss=500, delay=0.01, drop=0.05, seed=1)
+    rows = [run_simulated(config) for config in sweep(base, {"protocol": ["gbn", "sr"], "cc": ["reno", "fixed", "delay"]})]
+    assert all(row["intact"] for row in rows)
+    assert all(row["transport"] == "sim" and row["goodput_bps"] > 0 and row["retransmits"] > 0 for row in rows)
+    # The completion time is simulated, so runs repeat exactly
+    again = run_simulated(BenchConfig(size=20000, mss=500, delay=0.01, drop=0.05, seed=1))
+    assert again["completion_time"] == rows[0]["completion_time"]
+    assert again["retransmits"] == rows[0]["retransmits"]
+
+
+def test_writers():
+    rows = [{"a": 1, "b": None}, {"a": 2, "b": 0.5}]
+    out = io.StringIO()
+    write_csv(rows, out)
+    assert list(csv.DictReader(io.StringIO(out.getvalue()))) == [{"a": "1", "b": ""}, {"a": "2", "b": "0.5"}]
+    out = io.StringIO()
+    write_json(rows, out)
+    assert json.loads(out.getvalue()) == rows
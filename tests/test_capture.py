@@ -0,0 +1,84 @@
+from random import Random
+from capture import INBOUND, OUTBOUND, Capture, CapturedDatagram, describe_datagram, read_capture
+from codec import encode_ack_packet, encode_data_packet, encode_options, encode_parity_packet
+from congestion import FixedRateControl
+from rdt import GoBackNReceiver, GoBackNSender
+from router import Router
+from segments import Buffer
+from sim import SimulatedNetwork
+import io
+import pytest
+
+
+def test_round_trip():
+    file = io.BytesIO()
+    with Capture(file, capacity=3, flush_interval=60) as capture:
+        a = capture.interface("a")
+        b = capture.interface("b")
+        assert capture.interface("a") == a
+        capture.record(a, 1.5, memoryview(b"odd"), OUTBOUND)
+        capture.record(b, 2.25, b"four", INBOUND, "dropped")
+        capture.record(a, 3, b"", INBOUND)
+        # The ring is full until the background thread writes it out
+        capture.record(b, 4, b"lost", INBOUND)
+    file.seek(0)
+    entries = list(read_capture(file))
+    datagrams = [entry for entry in entries if isinstance(entry, CapturedDatagram)]
+    assert [(d.timestamp, d.interface, d.direction, d.data, d.note) for d in datagrams] == [
+        (1.5, "a", OUTBOUND, b"odd", None),
+        (2.25, "b", INBOUND, b"four", "dropped"),
+        (3, "a", INBOUND, b"", None),
+    ]
+    assert [entry for entry in entries if isinstance(entry, tuple)] == [("a", 0), ("b", 1)]
+
+
+def test_truncated():
+    file = io.BytesIO()
+    with Capture(file) as capture:
+        capture.record(capture.interface("a"), 1, b"data", INBOUND)
+    with pytest.raises(ValueError):
+        list(read_capture(io.BytesIO(file.getvalue()[:-6])))
+
+
+def test_describe_datagram():
+    assert describe_datagram(encode_data_packet(3, b"abc", 7)) == ("DATA", 7, 3, "len=3")
+    assert describe_datagram(encode_data_packet(0, encode_options({"mss": 100}), 7)) == ("SYN", 7, 0, "mss=100")
+    assert describe_datagram(encode_ack_packet(3, 7)) == ("ACK", 7, 3, "")
+    assert describe_datagram(encode_ack_packet(3, 7, 5)) == ("ACK", 7, 3, "window=5")
+    assert describe_datagram(encode_parity_packet(1, 4, 0, b"xy", 7)) == ("PARITY", 7, 1, "covers=4 len=2")
+    corrupt = bytearray(encode_data_packet(3, b"abc", 7))
+    corrupt[-1] ^= 1
+    assert describe_datagram(corrupt)[:3] == ("BAD", 7, 3)
+    assert describe_datagram(b"x") == ("BAD", None, None, "len=1")
+
+
+def test_router_capture():
+    """The router records each packet as it's transmitted with what happened to it, and again as it's delivered."""
+    file = io.BytesIO()
+    router = Router(seed=1)
+    router.drop_chance = 0.1
+    with Capture(file) as capture:
+        router.capture = capture
+        network = SimulatedNetwork(router)
+        sender_client, receiver_client = network.connect(1)
+        sender = GoBackNSender(sender_client, 8, cc=FixedRateControl(10**7), mss=100)
+        receiver = GoBackNReceiver(receiver_client)
+
+        def deliver(block: Buffer) -> bool:
+            return len(block) > 0
+
+        receiver_client.serve(receiver, deliver)
+        sender.push(Random(1).randbytes(5000))
+        sender.push(bytes(0))
+        sender.start()
+    file.seek(0)
+    datagrams = [entry for entry in read_capture(file) if isinstance(entry, CapturedDatagram)]
+    transmitted = [d for d in datagrams if d.direction == INBOUND]
+    delivered = [d for d in datagrams if d.direction == OUTBOUND]
+    dropped = [d for d in transmitted if d.note == "dropped"]
+    assert dropped
+    assert len(transmitted) == len(delivered) + len(dropped)
+    # Port 2 is the receiver's, so it sees the data
+    assert {describe_datagram(d.data)[0] for d in delivered if d.interface == "router port 2"} == {"DATA"}
+    assert {describe_datagram(d.data)[0] for d in delivered if d.interface == "router port 1"} == {"ACK"}
+    assert all(a.timestamp <= b.timestamp for a, b in zip(delivered, delivered[1:]))
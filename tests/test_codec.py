@@ -0,0 +1,69 @@
+from codec import HEADER_SIZE, PacketEncoder, decode_ack_packet, decode_data_packet, decode_options, encode_ack_packet, \
+    encode_data_packet, encode_options, peek_conn_id
+from UDPDuplex import BufferPool
+import pytest
+
+
+def test_data_round_trip():
+    packet = encode_data_packet(7, b"payload", 42)
+    assert len(packet) == HEADER_SIZE + 7
+    res = decode_data_packet(packet)
+    assert res is not None
+    conn_id, seq, data = res
+    assert (conn_id, seq, bytes(data)) == (42, 7, b"payload")
+    assert peek_conn_id(packet) == 42
+
+
+def test_ack_round_trip():
+    assert decode_ack_packet(encode_ack_packet(2**32 - 1, 5)) == (5, 2**32 - 1, None)
+    # An ACK isn't a data packet, nor the other way around
+    assert decode_data_packet(encode_ack_packet(1)) is None
+    assert decode_ack_packet(encode_data_packet(1, b"")) is None
+
+
+@pytest.mark.parametrize("bit", [0, 40, 100, 8 * (HEADER_SIZE + 3) - 1])
+def test_corruption_rejected(bit: int):
+    packet = bytearray(encode_data_packet(3, b"abc", 1))
+    packet[bit // 8] ^= 1 << (bit % 8)
+    assert decode_data_packet(packet) is None
+
+
+def test_truncated_rejected():
+    packet = encode_data_packet(3, b"abc", 1)
+    assert decode_data_packet(packet[:-1]) is None
+    assert decode_data_packet(packet[:HEADER_SIZE - 1]) is None
+    assert decode_ack_packet(encode_ack_packet(3)[:-1]) is None
+
+
+def test_decode_without_copying():
+    packet = bytearray(encode_data_packet(3, b"abc"))
+    res = decode_data_packet(packet)
+    assert res is not None
+    packet[HEADER_SIZE] = ord("x")
+    assert bytes(res[2]) == b"xbc"
+
+
+def test_encoder_reuses_buffer():
+    encoder = PacketEncoder(4, 9)
+    first = encoder.data(1, b"abcd")
+    assert decode_data_packet(first)[:2] == (9, 1)  # type: ignore
+    assert bytes(first) == encode_data_packet(1, b"abcd", 9)
+    second = encoder.ack(1)
+    assert first.obj is second.obj
+    assert decode_ack_packet(second) == (9, 1, None)
+    with pytest.raises(AssertionError):
+        encoder.data(2, b"abcde")
+
+
+def test_options():
+    assert decode_options(encode_options({"mss": 100, "compress": "zlib"})) == {"mss": 100, "compress": "zlib"}
+    assert decode_options(b"not json") is None
+    assert decode_options(b"[1]") is None
+
+
+def test_buffer_pool():
+    pool = BufferPool(2, 16)
+    first, second = pool.next(), pool.next()
+    assert first is not second
+    assert pool.next() is first
+    assert len(first) == 16
@@ -0,0 +1,96 @@
+from random import Random
+from compression import CODECS, COMPRESS_CHUNK, NEW_STREAM, RAW, Decompressor, compress_segments
+from congestion import FixedRateControl
+from metrics import Metrics
+from rdt import GoBackNReceiver, GoBackNSender, SelectiveRepeatReceiver, SelectiveRepeatSender
+from segments import Buffer, iter_segments
+from sim import SimulatedNetwork
+import pytest
+
+TEXT = b"the quick brown fox jumps over the lazy dog " * 2000
+
+
+def decompress(segments: list[Buffer], max_output: int = COMPRESS_CHUNK) -> list[bytes]:
+    out: list[bytes] = []
+
+    def deliver(block: Buffer) -> bool:
+        out.append(bytes(block))
+        return len(block) > 0
+
+    decompressor = Decompressor(deliver, max_output)
+    for segment in segments:
+        decompressor.deliver(segment)
+    return out
+
+
+def test_round_trip():
+    segments = list(compress_segments(iter_segments([TEXT], lambda: 1000), lambda: 100, CODECS["zlib"], 6))
+    assert all(len(s) <= 100 for s in segments)
+    assert sum(map(len, segments)) < len(TEXT) / 10
+    assert segments[0][0] == CODECS["zlib"].id | NEW_STREAM
+    # One stream for all the chunks
+    assert all(s[0] == CODECS["zlib"].id for s in segments[1:])
+    out = decompress(segments, max_output=500)
+    assert b"".join(out) == TEXT
+    assert max(map(len, out)) <= 500
+
+
+def test_incompressible_chunk_sent_raw():
+    noise = Random(1).randbytes(1000)
+    chunks = [TEXT[:1000], noise, TEXT[:1000], b""]
+    segments = list(compress_segments(chunks, lambda: 2000, CODECS["zlib"], 6))
+    assert [s[0] if len(s) else None for s in segments] == \
+        [CODECS["zlib"].id | NEW_STREAM, RAW, CODECS["zlib"].id | NEW_STREAM, None]
+    assert bytes(segments[1][1:]) == noise
+    # The empty chunk is passed through to mark the end of the data
+    assert b"".join(decompress(segments)) == TEXT[:1000] + noise + TEXT[:1000]
+
+
+def test_stream_must_start():
+    segments = list(compress_segments([TEXT[:1000]], lambda: 20, CODECS["zlib"], 6))
+    assert len(segments) > 1
+    with pytest.raises(ValueError):
+        decompress(segments[1:])
+    with pytest.raises(ValueError):
+        decompress([bytes([0x7f | NEW_STREAM, 0])])
+
+
+@pytest.mark.parametrize("protocol", ["gbn", "sr"])
+@pytest.mark.parametrize("codecs", [CODECS, ()])
+def test_negotiated_transfer(protocol: str, codecs):
+    network = SimulatedNetwork(seed=1)
+    sender_client, receiver_client = network.connect(1)
+    metrics = Metrics()
+    if protocol == "sr":
+        sender = SelectiveRepeatSender(sender_client, 8, cc=FixedRateControl(10**7), mss=500, negotiate=True, compress="zlib",
+                                       observer=metrics)
+        receiver = SelectiveRepeatReceiver(receiver_client, 8, codecs=codecs)
+    else:
+        sender = GoBackNSender(sender_client, 8, cc=FixedRateControl(10**7), mss=500, negotiate=True, compress="zlib",
+                               observer=metrics)
+        receiver = GoBackNReceiver(receiver_client, codecs=codecs)
+    received = bytearray()
+
+    def write(block: Buffer) -> bool:
+        received.extend(block)
+        return len(block) > 0
+
+    decompressor = Decompressor(write)
+
+    def deliver(block: Buffer) -> bool:
+        if receiver.compress is not None:
+            return decompressor.deliver(block)
+        return write(block)
+
+    receiver_client.serve(receiver, deliver)
+    sender.push(TEXT)
+    sender.push(bytes(0))
+    sender.start()
+    assert bytes(received) == TEXT
+    if codecs:
+        assert receiver.compress == sender.compress == "zlib"
+        assert metrics.counters["bytes_sent"] < len(TEXT) / 10
+    else:
+        # The receiver can't decompress, so the data is sent as is
+        assert receiver.compress is sender.compress is None
+        assert metrics.counters["bytes_sent"] == len(TEXT)
@@ -0,0 +1,74 @@
+from random import Random
+from codec import HEADER_SIZE
+from congestion import DelayControl, FixedRateControl, RenoControl
+from rdt import GoBackNReceiver, GoBackNSender
+from segments import Buffer
+from sim import SimulatedNetwork
+import math
+import pytest
+
+
+def test_fixed_rate_pacing():
+    cc = FixedRateControl(500)
+    assert cc.pacing_delay(1000, None) == 16
+    assert cc.pacing_delay(1000, 0.1) == 16
+    assert math.isinf(cc.window())
+
+
+def test_reno_slow_start_and_avoidance():
+    cc = RenoControl(initial_cwnd=2)
+    cc.on_ack(2, 0.1)
+    assert cc.cwnd == 4
+    # Duplicate ACKs halve the window
+    cc.on_loss(False)
+    assert cc.ssthresh == 2
+    assert cc.cwnd == 2
+    cc.on_ack(1, 0.1)
+    assert cc.cwnd == 2.5
+    # A timeout starts over from the minimum window
+    cc.on_loss(True)
+    assert cc.cwnd == 1
+
+
+def test_reno_pacing():
+    cc = RenoControl(initial_cwnd=2)
+    assert cc.pacing_delay(1000, None) == 0
+    # A window over one RTT, twice as fast in slow start
+    assert cc.pacing_delay(1000, 1.0) == 0.25
+    cc.on_loss(False)
+    assert cc.pacing_delay(1000, 1.0) == pytest.approx(1 / (2 * 1.2))
+
+
+def test_delay_leaves_slow_start_on_queueing():
+    cc = DelayControl(initial_cwnd=8, alpha=2, beta=4)
+    cc.on_ack(1, 0.1)
+    assert cc.cwnd == 9
+    # Half the window is queued
+    cc.on_ack(1, 0.2)
+    assert cc.ssthresh == 9
+    assert cc.cwnd == 9
+    # Still queued, so the window shrinks
+    cc.on_ack(1, 0.2)
+    assert cc.cwnd == pytest.approx(9 - 1 / 9)
+
+
+def test_sender_paced_at_fixed_rate():
+    network = SimulatedNetwork(seed=1)
+    sender_client, receiver_client = network.connect(1)
+    rate = 80000
+    sender = GoBackNSender(sender_client, 8, cc=FixedRateControl(rate), mss=100)
+    receiver = GoBackNReceiver(receiver_client)
+    received = bytearray()
+
+    def deliver(block: Buffer) -> bool:
+        received.extend(block)
+        return len(block) > 0
+
+    receiver_client.serve(receiver, deliver)
+    data = Random(1).randbytes(1000)
+    sender.push(data)
+    sender.push(bytes(0))
+    sender.start()
+    assert bytes(received) == data
+    # Each of the 10 segments takes its time at the link rate before the next send, and the first send waits as long
+    assert network.time() == pytest.approx(11 * (100 + HEADER_SIZE) * 8 / rate)
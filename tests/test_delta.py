@@ -0,0 +1,201 @@
+from pathlib import Path
+from random import Random
+from async_rdt import AsyncGoBackNSender, DatagramGoBackNClient, RDTDatagramProtocol
+from codec import decode_data_packet, decode_options
+from congestion import FixedRateControl
+from delta import MAX_BLOCK, MAX_SKIP, MIN_BLOCK, DeltaEncoder, DeltaFile, block_size_for, decode_signature_chunk, pack_segments, rebuild_path, roll
+from metrics import Metrics
+from rdt import GoBackNReceiver, GoBackNSender
+from resume import file_id
+from segments import Buffer
+from sim import SimulatedClient, SimulatedNetwork
+import delta
+import io
+import pytest
+import zlib
+
+
+def delta_transfer(sender: GoBackNSender, receiver_client: SimulatedClient, path: Path, data: bytes) -> bool:
+    delta_file = DeltaFile(lambda _: path)
+    receiver = GoBackNReceiver(receiver_client, delta=delta_file.signatures_for)
+
+    def deliver(block: Buffer) -> bool:
+        assert receiver.signatures is not None
+        return delta_file.deliver(block)
+
+    receiver_client.serve(receiver, deliver)
+    sender.push(data)
+    sender.push(bytes(0))
+    sender.start()
+    return delta_file.finish()
+
+
+def test_signature_request_lost(tmp_path: Path):
+    """The first request for signatures is lost, so it's resent once the RTO passes rather than once a receive times out."""
+    old = Random(1).randbytes(20000)
+    new = old[:5000] + b"changed" + old[5000:]
+    path = tmp_path / "file.bin"
+    path.write_bytes(old)
+    network = SimulatedNetwork(seed=1)
+    sender_client, receiver_client = network.connect(10)
+    requests: list[float] = []
+    send = sender_client.send
+
+    def dropping_send(payload: Buffer):
+        res = decode_data_packet(payload)
+        if res is not None and res[1] == 0 and "signatures" in (decode_options(res[2]) or {}):
+            requests.append(network.time())
+            if len(requests) == 1:
+                return
+        send(payload)
+    sender_client.send = dropping_send  # type: ignore
+
+    sender = GoBackNSender(sender_client, 8, cc=FixedRateControl(10**6), mss=1000, negotiate=True,
+                           delta_id=file_id(io.BytesIO(new)))
+    assert delta_transfer(sender, receiver_client, path, new)
+    assert path.read_bytes() == new
+    # The whole signature fits in one request, which is resent after the RTO measured during the handshake
+    assert len(requests) == 2
+    assert requests[1] - requests[0] == sender.rtt.min_rto
+
+
+def edited(old: bytes) -> bytes:
+    """A new version of old with an insertion, a deletion, a changed byte and a block moved to the end."""
+    new = bytearray(old[:3000] + b"inserted" + old[3000:20000] + old[25000:])
+    new[40000] ^= 1
+    return bytes(new[4096:] + new[:4096])
+
+
+def test_rolling_checksum():
+    data = Random(1).randbytes(3000)
+    size = 1024
+    checksum = zlib.adler32(data[:size])
+    for pos in range(len(data) - size):
+        checksum = roll(checksum, data[pos], data[pos + size], size)
+        assert checksum == zlib.adler32(data[pos + 1:pos + 1 + size])
+
+
+def test_block_size():
+    assert block_size_for(0) == MIN_BLOCK
+    # The power of two above the square root
+    assert block_size_for(1 << 30) == 1 << 16
+    assert block_size_for(1 << 50) == MAX_BLOCK
+
+
+def test_encode_and_rebuild(tmp_path: Path):
+    old = Random(1).randbytes(100000)
+    new = edited(old)
+    path = tmp_path / "file.bin"
+    path.write_bytes(old)
+    delta_file = DeltaFile(lambda _: path)
+    signatures = delta_file.signatures_for(file_id(io.BytesIO(new)))
+    assert signatures is not None and signatures.block_size == block_size_for(len(old))
+    # The same signatures as the sender rebuilds from the chunks it's sent
+    first, chunk = decode_signature_chunk(signatures.chunk(2, 3), len(signatures))  # type: ignore
+    assert first == 2 and chunk == [(signatures.weak[i], signatures.strong[i]) for i in range(2, 5)]
+
+    encoder = DeltaEncoder(signatures)
+    # Tiny segments split instructions across them
+    for segment in pack_segments(encoder.encode(new), lambda: 7):
+        assert delta_file.deliver(segment)
+    assert not delta_file.deliver(b"")
+    # Only the blocks around each edit are sent
+    assert encoder.literal_bytes < 6 * signatures.block_size
+    assert encoder.literal_bytes + encoder.copied_bytes == len(new)
+    assert delta_file.finish()
+    assert path.read_bytes() == new
+    assert not rebuild_path(path).exists()
+
+
+def test_long_insertion_stepped_over(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """Most of a long run of new data is stepped over a block at a time rather than rolled through, and what follows it still matches."""
+    old = Random(1).randbytes(100000)
+    inserted = Random(2).randbytes(50333)
+    new = old[:20000] + inserted + old[20000:]
+    path = tmp_path / "file.bin"
+    path.write_bytes(old)
+    delta_file = DeltaFile(lambda _: path)
+    signatures = delta_file.signatures_for(file_id(io.BytesIO(new)))
+    assert signatures is not None
+    rolls = 0
+    rolling = delta.roll
+
+    def counting_roll(checksum: int, out_byte: int, in_byte: int, size: int) -> int:
+        nonlocal rolls
+        rolls += 1
+        return rolling(checksum, out_byte, in_byte, size)
+
+    monkeypatch.setattr(delta, "roll", counting_roll)
+    encoder = DeltaEncoder(signatures)
+    for segment in encoder.encode(new):
+        assert delta_file.deliver(segment)
+    assert not delta_file.deliver(b"")
+    assert rolls < len(inserted) / 5
+    assert encoder.literal_bytes < len(inserted) + (MAX_SKIP + 1) * signatures.block_size
+    assert delta_file.finish()
+    assert path.read_bytes() == new
+
+
+def test_rebuild_mismatch_keeps_old_version(tmp_path: Path):
+    old = Random(1).randbytes(10000)
+    path = tmp_path / "file.bin"
+    path.write_bytes(old)
+    delta_file = DeltaFile(lambda _: path)
+    signatures = delta_file.signatures_for(file_id(io.BytesIO(old + b"more")))
+    assert signatures is not None
+    # Claims to be old + b"more", but has something else
+    for segment in DeltaEncoder(signatures).encode(old + b"else"):
+        delta_file.deliver(segment)
+    assert not delta_file.finish()
+    assert path.read_bytes() == old
+    assert not rebuild_path(path).exists()
+    with pytest.raises(ValueError):
+        DeltaFile(lambda _: path).deliver(b"X")
+
+
+def test_delta_transfer_sends_changes(tmp_path: Path):
+    old = Random(1).randbytes(100000)
+    new = edited(old)
+    path = tmp_path / "file.bin"
+    path.write_bytes(old)
+    network = SimulatedNetwork(seed=1)
+    sender_client, receiver_client = network.connect(1)
+    metrics = Metrics()
+    sender = GoBackNSender(sender_client, 8, cc=FixedRateControl(10**7), mss=1000, negotiate=True,
+                           delta_id=file_id(io.BytesIO(new)), observer=metrics)
+    assert delta_transfer(sender, receiver_client, path, new)
+    assert path.read_bytes() == new
+    assert metrics.counters["bytes_sent"] < len(new) / 5
+
+
+def test_no_old_version(tmp_path: Path):
+    """Without an older version to rebuild from, the sender sends the data as is."""
+    new = Random(1).randbytes(10000)
+    delta_file = DeltaFile(lambda _: tmp_path / "missing.bin")
+    network = SimulatedNetwork(seed=1)
+    sender_client, receiver_client = network.connect(1)
+    metrics = Metrics()
+    sender = GoBackNSender(sender_client, 8, cc=FixedRateControl(10**7), mss=1000, negotiate=True,
+                           delta_id=file_id(io.BytesIO(new)), observer=metrics)
+    receiver = GoBackNReceiver(receiver_client, delta=delta_file.signatures_for)
+    received = bytearray()
+
+    def deliver(block: Buffer) -> bool:
+        assert receiver.signatures is None
+        received.extend(block)
+        return len(block) > 0
+
+    receiver_client.serve(receiver, deliver)
+    sender.push(new)
+    sender.push(bytes(0))
+    sender.start()
+    assert bytes(received) == new
+    assert metrics.counters["bytes_sent"] == len(new)
+    # Identifiers that aren't file IDs aren't turned into paths
+    assert delta_file.signatures_for("../../etc/passwd") is None
+
+
+def test_async_sender_refuses_delta():
+    with pytest.raises(AssertionError):
+        AsyncGoBackNSender(DatagramGoBackNClient(None), RDTDatagramProtocol(), 8,  # type: ignore
+                           negotiate=True, delta_id=file_id(io.BytesIO(b"data")))
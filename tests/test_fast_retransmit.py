@@ -0,0 +1,105 @@
+from random import Random
+from codec import decode_ack_packet, decode_data_packet, encode_data_packet
+from congestion import FixedRateControl
+from metrics import Metrics
+from rdt import GoBackNReceiver, GoBackNSender
+from segments import Buffer
+from sim import SimulatedClient, SimulatedNetwork
+
+
+def drop_once(client: SimulatedClient, seq: int):
+    """Makes a client drop the first data packet of a seq it sends."""
+    send = client.send
+    dropped = False
+
+    def dropping_send(payload: Buffer):
+        nonlocal dropped
+        res = decode_data_packet(payload)
+        if res is not None and res[1] == seq and not dropped:
+            dropped = True
+            return
+        send(payload)
+    client.send = dropping_send  # type: ignore
+
+
+def record_acks(client: SimulatedClient) -> list[tuple[float, int]]:
+    """Records the time and seq of every ACK a client sends."""
+    acks: list[tuple[float, int]] = []
+    send = client.send
+
+    def recording_send(payload: Buffer):
+        ack = decode_ack_packet(payload)
+        if ack is not None:
+            acks.append((client.time(), ack[1]))
+        send(payload)
+    client.send = recording_send  # type: ignore
+    return acks
+
+
+def transfer(sender: GoBackNSender, receiver: GoBackNReceiver, receiver_client: SimulatedClient, data: bytes) -> bytes:
+    received = bytearray()
+
+    def deliver(block: Buffer) -> bool:
+        received.extend(block)
+        return len(block) > 0
+
+    receiver_client.serve(receiver, deliver)
+    sender.push(data)
+    sender.push(bytes(0))
+    sender.start()
+    return bytes(received)
+
+
+def test_fast_retransmit():
+    network = SimulatedNetwork(seed=1)
+    sender_client, receiver_client = network.connect(1)
+    metrics = Metrics()
+    sender = GoBackNSender(sender_client, 8, cc=FixedRateControl(10**6), mss=100, observer=metrics)
+    drop_once(sender_client, 3)
+    data = Random(1).randbytes(2000)
+    assert transfer(sender, GoBackNReceiver(receiver_client), receiver_client, data) == data
+    # The third duplicate resends the window long before the timeout
+    assert metrics.counters["timeouts"] == 0
+    assert metrics.counters["dup_acks"] >= 3
+    assert metrics.counters["retransmits"] > 0
+    assert network.time() < sender.rtt.rto
+
+
+def test_threshold():
+    network = SimulatedNetwork(seed=1)
+    sender_client, _ = network.connect(1)
+    sender = GoBackNSender(sender_client, 8, dup_ack_threshold=3)
+    assert [sender.fast_retransmit_due(dups) for dups in range(1, 5)] == [False, False, True, False]
+    # A window of 2 only has one other segment in flight to be ACKed again
+    sender.seq_max = sender.curr_seq + 1
+    assert sender.fast_retransmit_due(1)
+
+
+def test_cumulative_acks():
+    network = SimulatedNetwork(seed=1)
+    sender_client, receiver_client = network.connect(1)
+    metrics = Metrics()
+    sender = GoBackNSender(sender_client, 16, cc=FixedRateControl(10**6), mss=100, observer=metrics)
+    receiver = GoBackNReceiver(receiver_client, ack_every=4, ack_delay=0.05)
+    acks = record_acks(receiver_client)
+    data = Random(1).randbytes(3000)
+    assert transfer(sender, receiver, receiver_client, data) == data
+    # 30 segments in ACKs of 4, the last two of which are held back until the end of the data is ACKed right away
+    assert [seq for _, seq in acks] == [4, 8, 12, 16, 20, 24, 28, 31]
+    assert metrics.counters["segments_acked"] == 31
+
+
+def test_held_back_ack_sent_on_time():
+    network = SimulatedNetwork(seed=1)
+    sender_client, receiver_client = network.connect(1)
+    receiver = GoBackNReceiver(receiver_client, ack_every=4, ack_delay=0.05)
+    acks = record_acks(receiver_client)
+    receiver_client.serve(receiver, lambda block: len(block) > 0)
+    sender_client.send(encode_data_packet(1, b"a"))
+    sender_client.send(encode_data_packet(2, b"b"))
+    network.run_until(1)
+    assert acks == [(0.05, 2)]
+    # Out of order segments are ACKed right away
+    sender_client.send(encode_data_packet(4, b"d"))
+    network.run_until(2)
+    assert acks == [(0.05, 2), (1, 2)]
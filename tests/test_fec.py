@@ -0,0 +1,119 @@
+from random import Random
+from bench import BenchConfig, run_simulated
+from codec import decode_data_packet, decode_parity_packet, encode_parity_packet
+from congestion import FixedRateControl
+from fec import ParityDecoder, ParityEncoder
+from metrics import Metrics
+from rdt import GoBackNReceiver, GoBackNSender, SelectiveRepeatReceiver, SelectiveRepeatSender
+from segments import Buffer
+from sim import SimulatedClient, SimulatedNetwork
+import pytest
+
+SEGMENTS = [b"abcd", b"ef", b"", b"ghijk", b"lm", b"n"]
+
+
+def drop_once(client: SimulatedClient, seq: int):
+    """Makes a client drop the first data packet of a seq it sends."""
+    send = client.send
+    dropped = False
+
+    def dropping_send(payload: Buffer):
+        nonlocal dropped
+        res = decode_data_packet(payload)
+        if res is not None and res[1] == seq and not dropped:
+            dropped = True
+            return
+        send(payload)
+    client.send = dropping_send  # type: ignore
+
+
+def encode(k: int) -> list[tuple[int, int, int, bytes]]:
+    encoder = ParityEncoder(k, 1)
+    blocks = [encoder.add(seq, segment, seq == len(SEGMENTS)) for seq, segment in enumerate(SEGMENTS, 1)]
+    return [block for block in blocks if block is not None]
+
+
+def test_encoder():
+    blocks = encode(4)
+    # The final segment ends the last block early
+    assert [block[:2] for block in blocks] == [(1, 4), (5, 2)]
+    assert blocks[1][2] == 2 ^ 1
+    assert blocks[1][3] == bytes([ord("l") ^ ord("n"), ord("m")])
+    # Retransmissions aren't encoded again
+    encoder = ParityEncoder(2, 1)
+    assert encoder.add(1, b"a", False) is None
+    assert encoder.add(1, b"a", False) is None
+    assert encoder.add(2, b"b", False) == (1, 2, 0, bytes([ord("a") ^ ord("b")]))
+
+
+@pytest.mark.parametrize("lost", range(1, 5))
+def test_repair_any_segment(lost: int):
+    first, count, size_xor, parity = encode(4)[0]
+    decoder = ParityDecoder(4, 1)
+    decoder.add_parity(first, count, size_xor, parity)
+    # Segments before the lost one are delivered, and those after it are held back out of order
+    for seq in range(1, lost):
+        decoder.delivered(seq, SEGMENTS[seq - 1])
+    held = {seq: SEGMENTS[seq - 1] for seq in range(lost + 1, 5)}
+    assert decoder.repair(lost, lost, held) == (lost, SEGMENTS[lost - 1])
+    # Each parity repairs once
+    assert not decoder.has_parity(lost)
+
+
+def test_repair_needs_all_but_one():
+    decoder = ParityDecoder(4, 1)
+    assert decoder.repair(1, 1, {}) is None
+    decoder.add_parity(*encode(4)[0])
+    assert decoder.repair(1, 1, {3: SEGMENTS[2], 4: SEGMENTS[3]}) is None
+    assert decoder.has_parity(1)
+    # Parity of a block that doesn't start on a block boundary is ignored
+    decoder.add_parity(2, 4, 0, b"")
+    assert 2 not in decoder.parities
+
+
+def test_parity_packet():
+    packet = encode_parity_packet(5, 2, 3, b"xyz", 7)
+    assert decode_parity_packet(packet) is not None
+    conn_id, seq, count, size_xor, parity = decode_parity_packet(packet)  # type: ignore
+    assert (conn_id, seq, count, size_xor, bytes(parity)) == (7, 5, 2, 3, b"xyz")
+    # Parity packets aren't mistaken for data packets
+    assert decode_data_packet(packet) is None
+
+
+@pytest.mark.parametrize("protocol", ["gbn", "sr"])
+def test_lost_segment_rebuilt(protocol: str):
+    network = SimulatedNetwork(seed=1)
+    sender_client, receiver_client = network.connect(1)
+    sender_metrics = Metrics()
+    receiver_metrics = Metrics()
+    if protocol == "sr":
+        sender = SelectiveRepeatSender(sender_client, 8, cc=FixedRateControl(10**6), mss=100, negotiate=True, fec=4,
+                                       observer=sender_metrics)
+        receiver = SelectiveRepeatReceiver(receiver_client, 8, observer=receiver_metrics)
+    else:
+        sender = GoBackNSender(sender_client, 8, cc=FixedRateControl(10**6), mss=100, negotiate=True, fec=4,
+                               observer=sender_metrics)
+        receiver = GoBackNReceiver(receiver_client, observer=receiver_metrics)
+    drop_once(sender_client, 3)
+    received = bytearray()
+
+    def deliver(block: Buffer) -> bool:
+        received.extend(block)
+        return len(block) > 0
+
+    receiver_client.serve(receiver, deliver)
+    data = Random(1).randbytes(1950)
+    sender.push(data)
+    sender.push(bytes(0))
+    sender.start()
+    assert bytes(received) == data
+    assert receiver_metrics.counters["segments_recovered"] == 1
+    assert sender_metrics.counters["retransmits"] == 0
+    # One parity segment per 4 of the 21 segments, the last block ending early
+    assert sender_metrics.counters["parity_sent"] == 6
+
+
+def test_bench_reports_parity():
+    row = run_simulated(BenchConfig(size=20000, mss=500, drop=0.05, fec=4, seed=1))
+    assert row["intact"]
+    assert row["parity_sent"] > 0
@@ -0,0 +1,101 @@
+from random import Random
+from codec import decode_ack_packet, encode_data_packet
+from congestion import FixedRateControl
+from metrics import Metrics
+from rdt import GoBackNReceiver, GoBackNSender, SelectiveRepeatReceiver, SelectiveRepeatSender
+from segments import Buffer
+from sim import SimulatedClient, SimulatedNetwork
+
+
+def drop_acks(client: SimulatedClient, seq: int, count: int | None = None) -> list[int]:
+    """
+    Makes a client drop the ACKs of a seq it sends, and records the seqs of every ACK it sends.
+    @param count  How many of them to drop, or None for all of them.
+    """
+    sent: list[int] = []
+    send = client.send
+
+    def dropping_send(payload: Buffer):
+        nonlocal count
+        ack = decode_ack_packet(payload)
+        if ack is not None:
+            sent.append(ack[1])
+            if ack[1] == seq and (count is None or count > 0):
+                if count is not None:
+                    count -= 1
+                return
+        send(payload)
+    client.send = dropping_send  # type: ignore
+    return sent
+
+
+def test_receiver_acks_retransmitted_end():
+    """The final ACK is lost, so the receiver has to stay around to ACK the retransmitted end of the data."""
+    network = SimulatedNetwork(seed=1)
+    sender_client, receiver_client = network.connect(1)
+    receiver = GoBackNReceiver(receiver_client)
+    acks = drop_acks(receiver_client, 2, 1)
+    sender_client.send(encode_data_packet(1, b"data", 0))
+    sender_client.send(encode_data_packet(2, b"", 0))
+    # The sender's retransmission timeout
+    network.call_at(0.5, lambda: sender_client.send(encode_data_packet(2, b"", 0)))
+
+    received: list[bytes] = []
+
+    def deliver(block: Buffer) -> bool:
+        received.append(bytes(block))
+        return len(block) > 0
+
+    receiver.recv(deliver)
+    assert received == [b"data", b""]
+    assert acks == [1, 2, 2]
+    assert receiver.finished
+    # It went on until a receive timed out after the retransmission
+    assert network.time() >= 1.5
+
+
+def test_sender_gives_up_on_final_ack():
+    """Every ACK of the end of the data is lost, as if the receiver left right after receiving it."""
+    network = SimulatedNetwork(seed=1)
+    sender_client, receiver_client = network.connect(1)
+    metrics = Metrics()
+    sender = GoBackNSender(sender_client, 4, cc=FixedRateControl(10**6), mss=100, observer=metrics)
+    receiver = GoBackNReceiver(receiver_client)
+    data = Random(1).randbytes(1000)
+    received = bytearray()
+
+    def deliver(block: Buffer) -> bool:
+        received.extend(block)
+        return len(block) > 0
+
+    receiver_client.serve(receiver, deliver)
+    drop_acks(receiver_client, 11)
+    sender.push(data)
+    sender.push(bytes(0))
+    sender.start()
+    assert bytes(received) == data
+    assert sender.curr_seq == 11
+    assert metrics.counters["timeouts"] == GoBackNSender.final_retries
+
+
+def test_selective_repeat_sender_gives_up_on_final_ack():
+    network = SimulatedNetwork(seed=1)
+    sender_client, receiver_client = network.connect(1)
+    metrics = Metrics()
+    sender = SelectiveRepeatSender(sender_client, 4, cc=FixedRateControl(10**6), mss=100, observer=metrics)
+    receiver = SelectiveRepeatReceiver(receiver_client, 4)
+    data = Random(1).randbytes(1000)
+    received = bytearray()
+
+    def deliver(block: Buffer) -> bool:
+        received.extend(block)
+        return len(block) > 0
+
+    receiver_client.serve(receiver, deliver)
+    drop_acks(receiver_client, 11)
+    sender.push(data)
+    sender.push(bytes(0))
+    sender.start()
+    assert bytes(received) == data
+    assert sender.curr_seq == 11
+    assert metrics.counters["timeouts"] == SelectiveRepeatSender.final_retries
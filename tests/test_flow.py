@@ -0,0 +1,143 @@
+from random import Random
+from threading import Event, Thread
+from codec import decode_ack_packet, decode_data_packet, encode_ack_packet, encode_data_packet
+from congestion import FixedRateControl
+from flow import DeliveryBuffer
+from metrics import Metrics
+from rdt import GoBackNReceiver, GoBackNSender
+from segments import Buffer
+from sim import SimulatedNetwork
+import pytest
+import time
+
+
+def wait_for(condition, timeout: float = 5):
+    """Waits in real time for another thread to make a condition true."""
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.001)
+
+
+def test_delivery_buffer():
+    buffer = DeliveryBuffer(2)
+    assert buffer.space() == 2
+    segment = bytearray(b"a")
+    assert buffer.put(segment)
+    # Queued segments are copies
+    segment[0] = ord("x")
+    assert buffer.put(b"")
+    assert buffer.space() == 0
+    delivered: list[bytes] = []
+    drained: list[int] = []
+
+    def deliver(block: Buffer) -> bool:
+        delivered.append(bytes(block))
+        return len(block) > 0
+
+    thread = Thread(target=buffer.drain, args=(deliver, lambda: drained.append(buffer.space())))
+    thread.start()
+    thread.join(5)
+    assert delivered == [b"a", b""]
+    # The space of each segment is freed once it has been delivered
+    assert drained == [1]
+    # The deliverer stopped at the empty segment, so nothing more is queued
+    assert buffer.stopped and not buffer.put(b"c")
+
+
+def test_ack_window():
+    assert decode_ack_packet(encode_ack_packet(5, 1, 7)) == (1, 5, 7)
+    assert decode_ack_packet(encode_ack_packet(5, 1, 0)) == (1, 5, 0)
+
+
+def test_peer_window():
+    network = SimulatedNetwork(seed=1)
+    sender_client, _ = network.connect(1)
+    sender = GoBackNSender(sender_client, 8, mss=1)
+    sender.push(b"abcdef")
+    assert not sender.update_peer_window(0, None)
+    assert sender.update_peer_window(0, 2)
+    # An older ACK doesn't take back room that was already advertised
+    assert not sender.update_peer_window(1, 0)
+    assert sender.peer_window_end == 2
+    assert sender.window_end() == 2
+    assert not sender.window_closed()
+    sender.curr_seq = 3
+    assert sender.window_closed()
+
+
+def test_zero_window_probes():
+    """A receiver with a full buffer answers every segment past its window with an ACK of window 0, until its deliverer catches up."""
+    network = SimulatedNetwork(seed=1)
+    sender_client, receiver_client = network.connect(1)
+    metrics = Metrics()
+    sender = GoBackNSender(sender_client, 8, cc=FixedRateControl(10**7), mss=100, observer=metrics)
+    received = bytearray()
+    edge = 3
+    past_edge: list[float] = []
+
+    def on_packet(pkt: Buffer):
+        res = decode_data_packet(pkt)
+        assert res is not None
+        _, seq, data = res
+        next_seq = len(received) // 100 + 1
+        if seq == next_seq and seq <= edge:
+            received.extend(data)
+            next_seq += 1
+        elif seq > edge:
+            past_edge.append(network.time())
+        receiver_client.send(encode_ack_packet(next_seq - 1, 0, max(edge - (next_seq - 1), 0)))
+
+    def reopen():
+        nonlocal edge
+        edge = 100
+
+    receiver_client.listen(on_packet)
+    network.call_at(10, reopen)
+    data = Random(1).randbytes(1000)
+    sender.push(data)
+    sender.push(bytes(0))
+    sender.start()
+    assert bytes(received) == data
+    # Only probes went past the window, backing off between them, and the last probe found it reopened
+    assert len(past_edge) > 2
+    gaps = [b - a for a, b in zip(past_edge, past_edge[1:])]
+    assert all(b == pytest.approx(2 * a) for a, b in zip(gaps, gaps[1:]))
+    assert metrics.counters["window_probes"] == len(past_edge) + 1
+    assert metrics.counters["timeouts"] == 0
+
+
+def test_slow_deliverer():
+    """The scripted sender sends more than the receiver's buffer holds while its deliverer is stuck."""
+    network = SimulatedNetwork(seed=1)
+    sender_client, receiver_client = network.connect(1)
+    metrics = Metrics()
+    receiver = GoBackNReceiver(receiver_client, window=2, observer=metrics)
+    release = Event()
+    received: list[bytes] = []
+
+    def deliver(block: Buffer) -> bool:
+        release.wait(5)
+        received.append(bytes(block))
+        return len(block) > 0
+
+    def send(seq: int):
+        # Room frees up in real time, as the deliverer's thread drains the buffer
+        wait_for(lambda: receiver.flow is not None and receiver.flow.space() == 2)
+        sender_client.send(encode_data_packet(seq, bytes([seq]) if seq < 5 else b""))
+
+    for seq in (1, 2, 3, 4):
+        sender_client.send(encode_data_packet(seq, bytes([seq])))
+    network.call_at(1, release.set)
+    for when, seq in [(2, 3), (3, 4), (4, 5)]:
+        network.call_at(when, lambda seq=seq: send(seq))
+    # The deliverer's thread takes real time to see the end of the data, which the virtual clock would otherwise run past
+    network.call_at(5, lambda: wait_for(lambda: receiver.flow is not None and receiver.flow.stopped))
+    receiver.recv(deliver)
+    assert received == [b"\x01", b"\x02", b"\x03", b"\x04", b""]
+    assert metrics.counters["window_drops"] == 2
+    acks = [decode_ack_packet(pkt) for pkt in sender_client.inbox]
+    assert [(seq, window) for _, seq, window in acks[:4]] == [(1, 1), (2, 0), (2, 0), (2, 0)]  # type: ignore
+    # The sender is told the window reopened once half of the buffer is free
+    assert acks[4] == (0, 2, 1)
+    assert receiver.finished
@@ -0,0 +1,111 @@
+from random import Random
+from codec import decode_data_packet
+from rdt import GoBackNReceiver, GoBackNSender, MAX_MSS
+from congestion import FixedRateControl
+from sim import SimulatedNetwork
+import pytest
+
+
+def transfer(sender: GoBackNSender, receiver: GoBackNReceiver, receiver_client, data: bytes) -> bytes:
+    received = bytearray()
+
+    def deliver(block: bytes) -> bool:
+        if len(block) == 0:
+            return False
+        received.extend(block)
+        return True
+
+    receiver_client.serve(receiver, deliver)
+    sender.push(data)
+    sender.push(bytes(0))
+    sender.start()
+    return bytes(received)
+
+
+def test_syn_longer_than_mss():
+    """The SYN carries a resume identifier that is longer than a segment."""
+    network = SimulatedNetwork(seed=1)
+    sender_client, receiver_client = network.connect(1)
+    resume_id = "x" * 100
+    asked: list[str] = []
+
+    def resume(file_id: str) -> int:
+        asked.append(file_id)
+        return 0
+
+    sender = GoBackNSender(sender_client, 8, cc=FixedRateControl(10**6), mss=40, negotiate=True, resume_id=resume_id)
+    receiver = GoBackNReceiver(receiver_client, resume=resume)
+    data = Random(1).randbytes(1000)
+    assert transfer(sender, receiver, receiver_client, data) == data
+    assert asked == [resume_id]
+    assert sender.mss == 40
+
+
+def test_options_too_long():
+    network = SimulatedNetwork(seed=1)
+    sender_client, _ = network.connect(1)
+    sender = GoBackNSender(sender_client, 8, mss=40, negotiate=True, resume_id="x" * MAX_MSS)
+    with pytest.raises(ValueError, match="handshake options"):
+        sender.create_syn_packet()
+
+
+def test_syn_lost():
+    """The first SYN is lost, so it's resent once the RTO passes rather than once a receive times out."""
+    network = SimulatedNetwork(seed=1)
+    sender_client, receiver_client = network.connect(10)
+    syns: list[float] = []
+    send = sender_client.send
+
+    def dropping_send(payload):
+        res = decode_data_packet(payload)
+        if res is not None and res[1] == 0:
+            syns.append(network.time())
+            if len(syns) == 1:
+                return
+        send(payload)
+    sender_client.send = dropping_send  # type: ignore
+
+    sender = GoBackNSender(sender_client, 8, cc=FixedRateControl(10**6), mss=1000, negotiate=True)
+    receiver = GoBackNReceiver(receiver_client, max_mss=100)
+    data = Random(1).randbytes(1000)
+    assert transfer(sender, receiver, receiver_client, data) == data
+    # The initial RTO
+    assert syns == [0, 1]
+    assert sender.mss == 100
+
+
+def test_receiver_lowers_mss():
+    network = SimulatedNetwork(seed=1)
+    sender_client, receiver_client = network.connect(1)
+    sender = GoBackNSender(sender_client, 8, cc=FixedRateControl(10**6), mss=MAX_MSS, negotiate=True)
+    receiver = GoBackNReceiver(receiver_client, max_mss=300)
+    sizes: list[int] = []
+
+    def deliver(block) -> bool:
+        sizes.append(len(block))
+        return len(block) > 0
+
+    receiver_client.serve(receiver, deliver)
+    sender.push(Random(1).randbytes(1000))
+    sender.push(bytes(0))
+    sender.start()
+    assert sender.mss == 300
+    # Queued data is cut with the negotiated MSS
+    assert sizes == [300, 300, 300, 100, 0]
+
+
+def test_sender_keeps_smaller_mss():
+    network = SimulatedNetwork(seed=1)
+    sender_client, receiver_client = network.connect(1)
+    sender = GoBackNSender(sender_client, 8, cc=FixedRateControl(10**6), mss=200, negotiate=True)
+    receiver = GoBackNReceiver(receiver_client)
+    data = Random(1).randbytes(1000)
+    assert transfer(sender, receiver, receiver_client, data) == data
+    assert sender.mss == 200
+
+
+def test_mss_limit():
+    network = SimulatedNetwork(seed=1)
+    sender_client, _ = network.connect(1)
+    with pytest.raises(AssertionError):
+        GoBackNSender(sender_client, 8, mss=MAX_MSS + 1)
@@ -0,0 +1,80 @@
+from random import Random
+from congestion import RenoControl
+from link import RED, GilbertElliott, Link
+from metrics import Metrics
+from rdt import GoBackNReceiver, GoBackNSender
+from router import Router
+from segments import Buffer
+from sim import SimulatedNetwork
+import pytest
+
+
+def test_serialization_delay():
+    link = Link(bandwidth=8000)
+    rng = Random(1)
+    # 100 bytes take 0.1s at 8000 bps, queued behind each other
+    assert [link.enqueue(0, 100, rng) for _ in range(3)] == pytest.approx([0.1, 0.2, 0.3])
+    assert link.enqueue(0.25, 100, rng) == pytest.approx(0.4)
+    # An idle link starts sending right away
+    assert link.enqueue(1, 50, rng) == pytest.approx(1.05)
+    assert Link().enqueue(1, 100, rng) == 1
+
+
+def test_tail_drop():
+    link = Link(bandwidth=8000, queue_limit=2)
+    rng = Random(1)
+    assert link.enqueue(0, 100, rng) is not None
+    assert link.enqueue(0, 100, rng) is not None
+    assert link.enqueue(0, 100, rng) is None
+    # Room again once the first packet has been sent
+    assert link.enqueue(0.1, 100, rng) == pytest.approx(0.3)
+
+
+def test_red():
+    red = RED(min_th=2, max_th=4, weight=1)
+    rng = Random(1)
+    assert not any(red.drop(1, rng) for _ in range(100))
+    assert all(red.drop(4, rng) for _ in range(100))
+    # Half way between the thresholds drops come with p = max_p / 2, spread out to at most 1 / p packets apart,
+    # so about one every (1 / p + 1) / 2 packets
+    drops = sum(red.drop(3, rng) for _ in range(1000))
+    assert drops == pytest.approx(1000 / 10.5, rel=0.2)
+
+
+def test_burst_loss():
+    model = GilbertElliott(p_enter_bad=0.05, p_leave_bad=0.5)
+    rng = Random(1)
+    losses = [model.lose(rng) for _ in range(100000)]
+    assert sum(losses) / len(losses) == pytest.approx(0.05 / 0.55, rel=0.1)
+    bursts = "".join("x" if lost else "." for lost in losses).split(".")
+    bursts = [burst for burst in bursts if burst]
+    # Losses come in runs lasting 1 / p_leave_bad packets on average
+    assert sum(map(len, bursts)) / len(bursts) == pytest.approx(2, rel=0.1)
+
+
+def test_transfer_over_bottleneck():
+    router = Router(seed=1)
+    router.bandwidth = 800000
+    router.queue_limit = 4
+    router.min_delay = router.max_delay = 0.01
+    network = SimulatedNetwork(router)
+    sender_client, receiver_client = network.connect(1)
+    metrics = Metrics()
+    sender = GoBackNSender(sender_client, 32, cc=RenoControl(), mss=1000, observer=metrics)
+    receiver = GoBackNReceiver(receiver_client)
+    received = bytearray()
+
+    def deliver(block: Buffer) -> bool:
+        received.extend(block)
+        return len(block) > 0
+
+    receiver_client.serve(receiver, deliver)
+    data = Random(1).randbytes(100000)
+    sender.push(data)
+    sender.push(bytes(0))
+    sender.start()
+    assert bytes(received) == data
+    # The window outgrows the queue, which tail drops the excess
+    assert metrics.counters["retransmits"] > 0
+    # It can't go faster than the link
+    assert network.time() > len(data) * 8 / router.bandwidth
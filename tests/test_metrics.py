@@ -0,0 +1,75 @@
+from random import Random
+from congestion import FixedRateControl
+from metrics import Histogram, JSONLinesWriter, Metrics, format_summary
+from rdt import GoBackNReceiver, GoBackNSender
+from segments import Buffer
+from sim import SimulatedNetwork
+import io
+import json
+
+
+def test_histogram():
+    hist = Histogram()
+    assert hist.quantile(0.5) is None
+    assert hist.snapshot() == {"count": 0}
+    for value in range(1, 101):
+        hist.record(value)
+    snapshot = hist.snapshot()
+    assert snapshot["count"] == 100
+    assert snapshot["mean"] == 50.5
+    assert (snapshot["min"], snapshot["max"]) == (1, 100)
+    # Buckets are about 19% wide, and quantiles are their upper bounds
+    assert 50 <= snapshot["p50"] <= 50 * 1.19
+    assert 90 <= snapshot["p90"] <= 100
+    assert snapshot["p99"] <= 100
+
+
+def test_transfer_counters():
+    network = SimulatedNetwork(seed=1)
+    sender_client, receiver_client = network.connect(1)
+    sender_metrics = Metrics()
+    receiver_metrics = Metrics()
+    sender = GoBackNSender(sender_client, 4, cc=FixedRateControl(10**6), mss=100, observer=sender_metrics)
+    receiver = GoBackNReceiver(receiver_client, observer=receiver_metrics)
+
+    def deliver(block: Buffer) -> bool:
+        return len(block) > 0
+
+    receiver_client.serve(receiver, deliver)
+    data = Random(1).randbytes(1000)
+    sender.push(data)
+    sender.push(bytes(0))
+    sender.start()
+    sent = sender_metrics.counters
+    assert sent["segments_sent"] == 11
+    assert sent["bytes_sent"] == len(data)
+    assert sent["segments_acked"] == 11
+    assert sent["bytes_acked"] == len(data)
+    assert sent["retransmits"] == sent["timeouts"] == sent["dup_acks"] == 0
+    assert sender_metrics.rtt.count == 11
+    received = receiver_metrics.counters
+    assert received["segments_received"] == received["segments_delivered"] == 11
+    assert received["bytes_delivered"] == len(data)
+    assert received["out_of_order"] == 0
+
+
+def test_exports():
+    metrics = Metrics()
+    metrics.segment_sent(1, 100, False)
+    metrics.segment_sent(1, 100, True)
+    metrics.ack_received(1, 1, 100)
+    metrics.rtt_sample(0.05)
+    metrics.tick()
+    out = io.StringIO()
+    writer = JSONLinesWriter(out)
+    writer(metrics.snapshot())
+    writer(metrics.snapshot())
+    lines = out.getvalue().splitlines()
+    assert len(lines) == 2
+    snapshot = json.loads(lines[0])
+    assert snapshot["segments_sent"] == 2
+    assert snapshot["retransmits"] == 1
+    assert snapshot["rtt"]["count"] == 1
+    summary = format_summary(snapshot)
+    assert "sent=2 retx=1" in summary
+    assert "rtt_p50=" in summary
@@ -0,0 +1,93 @@
+from random import Random
+from threading import Event, Lock, Thread
+from codec import encode_ack_packet, encode_data_packet
+from congestion import FixedRateControl
+from mux import ConnectionClient, ConnectionListener
+from rdt import GoBackNReceiver, GoBackNSender, UDPDuplexGoBackNClient
+from segments import Buffer
+from UDPDuplex import UDPDuplex
+import time
+
+ADDR = ("127.0.0.1", 9)
+
+
+def wait_closed(listener: ConnectionListener, timeout: float = 5):
+    """Waits for every handler of the listener to return."""
+    deadline = time.time() + timeout
+    while listener.connections:
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_route():
+    opened: list[int] = []
+    release = Event()
+
+    def handler(client: ConnectionClient):
+        opened.append(client.conn_id)
+        release.wait(5)
+
+    listener = ConnectionListener("127.0.0.1", 0, handler, time_wait=30)
+    try:
+        # Only data packets open connections
+        listener.route(encode_ack_packet(1, 7), ADDR)
+        corrupt = bytearray(encode_data_packet(1, b"abc", 7))
+        corrupt[-1] ^= 1
+        listener.route(bytes(corrupt), ADDR)
+        assert listener.connections == {}
+        listener.route(encode_data_packet(1, b"abc", 7), ADDR)
+        listener.route(encode_ack_packet(1, 7), ("127.0.0.1", 10))
+        listener.route(encode_data_packet(1, b"abc", 8), ADDR)
+        client = listener.connections[7]
+        # Replies go to wherever the peer last sent from
+        assert client.addr == ("127.0.0.1", 10)
+        assert client.inbox.qsize() == 2
+        assert listener.connections[8].inbox.qsize() == 1
+        release.set()
+        wait_closed(listener)
+        assert sorted(opened) == [7, 8]
+        # Stray retransmissions of a finished connection are ignored
+        listener.route(encode_data_packet(1, b"abc", 7), ADDR)
+        assert listener.connections == {}
+        assert sorted(listener.closed) == [7, 8]
+    finally:
+        release.set()
+        listener.close()
+
+
+def test_concurrent_connections():
+    received: dict[int, bytearray] = dict()
+    lock = Lock()
+
+    def handler(client: ConnectionClient):
+        buf = bytearray()
+
+        def deliver(block: Buffer) -> bool:
+            buf.extend(block)
+            return len(block) > 0
+
+        GoBackNReceiver(client, conn_id=client.conn_id, idle_timeout=5).recv(deliver)
+        with lock:
+            received[client.conn_id] = buf
+
+    datas = {conn_id: Random(conn_id).randbytes(20000) for conn_id in (1, 2)}
+    with ConnectionListener("127.0.0.1", 0, handler, timeout=0.5) as listener:
+        port = listener.sock.getsockname()[1]
+
+        def send(conn_id: int):
+            client = UDPDuplexGoBackNClient(UDPDuplex("127.0.0.1", 0, "127.0.0.1", port), 0.5)
+            try:
+                sender = GoBackNSender(client, 16, cc=FixedRateControl(10**8), mss=1000, conn_id=conn_id)
+                sender.push(datas[conn_id])
+                sender.push(bytes(0))
+                sender.start()
+            finally:
+                client.handle.close()
+
+        threads = [Thread(target=send, args=(conn_id,)) for conn_id in datas]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wait_closed(listener)
+    assert received == datas
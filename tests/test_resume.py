@@ -0,0 +1,225 @@
+from pathlib import Path
+from random import Random
+from codec import encode_data_packet, encode_options
+from congestion import FixedRateControl
+from metrics import Metrics
+from rdt import GoBackNReceiver, GoBackNSender
+from resume import ResumableFile, StripedFile, StripedFiles, file_id, parse_stripe_id, split_ranges, stripe_id
+from segments import Buffer
+from sim import SimulatedNetwork
+import io
+
+
+def test_striped_file_over_longer_file(tmp_path: Path):
+    """A striped transfer without a checkpoint replaces an existing file that is longer than the new one."""
+    data = Random(1).randbytes(300000)
+    path = tmp_path / "out.bin"
+    path.write_bytes(Random(2).randbytes(400000))
+
+    striped = StripedFile(path, file_id(io.BytesIO(data)))
+    ranges = split_ranges(len(data), 2)
+    for offset, length in ranges:
+        assert striped.resume(offset, length) == 0
+    results = []
+    for offset, length in ranges:
+        striped.write(offset, data[offset:offset + length])
+        results.append(striped.finish_range(offset))
+    assert results == [False, True]
+    assert path.read_bytes() == data
+
+
+def test_receiver_gives_up_on_quiet_sender(tmp_path: Path):
+    """The sender goes away partway through, so the receiver gives up and checkpoints what it received for a resumed transfer."""
+    data = Random(1).randbytes(300)
+    whole_id = file_id(io.BytesIO(data))
+    path = tmp_path / "out.bin"
+    network = SimulatedNetwork(seed=1)
+    sender_client, receiver_client = network.connect(1)
+    out_file = ResumableFile(lambda _: path, interval=1000)
+    receiver = GoBackNReceiver(receiver_client, resume=out_file.resume, idle_timeout=5)
+    sender_client.send(encode_data_packet(0, encode_options({"mss": 100, "resume": whole_id}), 0))
+    for seq in (1, 2):
+        sender_client.send(encode_data_packet(seq, data[(seq - 1) * 100:seq * 100], 0))
+
+    def deliver(block: Buffer) -> bool:
+        out_file.write(block)
+        return True
+
+    receiver.recv(deliver)
+    assert not receiver.finished
+    assert network.time() >= 5
+    out_file.checkpoint()
+    out_file.close()
+
+    resumed = ResumableFile(lambda _: path)
+    assert resumed.resume(whole_id) == 200
+    resumed.write(data[200:])
+    assert resumed.finish()
+    assert path.read_bytes() == data
+
+
+def test_short_file_keeps_checkpoint(tmp_path: Path):
+    """The sender ended the data early, so the file isn't complete and can still be resumed."""
+    data = Random(1).randbytes(300)
+    whole_id = file_id(io.BytesIO(data))
+    path = tmp_path / "out.bin"
+    out_file = ResumableFile(lambda _: path)
+    assert out_file.resume(whole_id) == 0
+    out_file.write(data[:200])
+    assert not out_file.finish()
+
+    resumed = ResumableFile(lambda _: path)
+    assert resumed.resume(whole_id) == 200
+    resumed.write(data[200:])
+    assert resumed.finish()
+    assert path.read_bytes() == data
+    assert not path.with_name("out.bin.checkpoint").exists()
+
+
+def test_corrupt_file_not_finished(tmp_path: Path):
+    data = Random(1).randbytes(300)
+    whole_id = file_id(io.BytesIO(data))
+    path = tmp_path / "out.bin"
+    out_file = ResumableFile(lambda _: path, interval=0)
+    out_file.resume(whole_id)
+    out_file.write(data[:100])
+    out_file.write(bytes(200))
+    assert not out_file.finish()
+    assert path.with_name("out.bin.checkpoint").exists()
+
+
+def resumed_transfer(path: Path, data: bytes, metrics: Metrics) -> bool:
+    """Sends data to a ResumableFile at path over a simulated network, and returns whether the file was finished intact."""
+    network = SimulatedNetwork(seed=1)
+    sender_client, receiver_client = network.connect(1)
+    whole_id = file_id(io.BytesIO(data))
+    out_file = ResumableFile(lambda _: path)
+    sender = GoBackNSender(sender_client, 8, cc=FixedRateControl(10**7), mss=1000, negotiate=True, resume_id=whole_id,
+                           observer=metrics)
+    receiver = GoBackNReceiver(receiver_client, resume=out_file.resume)
+    finished: list[bool] = []
+
+    def deliver(block: Buffer) -> bool:
+        if len(block) == 0:
+            finished.append(out_file.finish())
+            return False
+        out_file.write(block)
+        return True
+
+    receiver_client.serve(receiver, deliver)
+    sender.push(data)
+    sender.push(bytes(0))
+    sender.start()
+    return finished == [True]
+
+
+def test_sender_skips_received_data(tmp_path: Path):
+    data = Random(1).randbytes(20000)
+    path = tmp_path / "out.bin"
+    interrupted = ResumableFile(lambda _: path)
+    assert interrupted.resume(file_id(io.BytesIO(data))) == 0
+    interrupted.write(data[:12345])
+    interrupted.checkpoint()
+    interrupted.close()
+
+    metrics = Metrics()
+    assert resumed_transfer(path, data, metrics)
+    assert path.read_bytes() == data
+    assert metrics.counters["bytes_sent"] == len(data) - 12345
+
+
+def test_checkpoint_of_other_file_ignored(tmp_path: Path):
+    path = tmp_path / "out.bin"
+    other = ResumableFile(lambda _: path)
+    other.resume(file_id(io.BytesIO(bytes(20000))))
+    other.write(bytes(12345))
+    other.checkpoint()
+    other.close()
+
+    data = Random(1).randbytes(20000)
+    metrics = Metrics()
+    assert resumed_transfer(path, data, metrics)
+    assert path.read_bytes() == data
+    assert metrics.counters["bytes_sent"] == len(data)
+    # Identifiers that aren't file IDs aren't turned into paths
+    assert ResumableFile(lambda _: path).resume("../../etc/passwd") == 0
+
+
+def test_split_ranges():
+    assert split_ranges(10, 3) == [(0, 3), (3, 3), (6, 4)]
+    assert split_ranges(2, 4) == [(0, 1), (1, 1)]
+    assert split_ranges(0, 4) == [(0, 0)]
+    whole_id = file_id(io.BytesIO(b"abc"))
+    assert parse_stripe_id(stripe_id(whole_id, 1, 2)) == (whole_id, 1, 2)
+    assert parse_stripe_id(whole_id) is None
+
+
+def striped_transfer(path: Path, data: bytes, streams: int) -> list[bool]:
+    """
+    Sends data to path as byte ranges over connections of their own, one after the other on simulated networks,
+    and returns whether each connection's ResumableFile reported the file as finished.
+    """
+    whole_id = file_id(io.BytesIO(data))
+    striped = StripedFiles(lambda _: path)
+    finished: list[bool] = []
+    for offset, length in split_ranges(len(data), streams):
+        network = SimulatedNetwork(seed=offset)
+        sender_client, receiver_client = network.connect(1)
+        out_file = ResumableFile(lambda _: path, striped=striped)
+        sender = GoBackNSender(sender_client, 8, cc=FixedRateControl(10**7), mss=1000, negotiate=True,
+                               resume_id=stripe_id(whole_id, offset, length))
+        receiver = GoBackNReceiver(receiver_client, resume=out_file.resume)
+
+        def deliver(block: Buffer) -> bool:
+            if len(block) == 0:
+                finished.append(out_file.finish())
+                return False
+            out_file.write(block)
+            return True
+
+        receiver_client.serve(receiver, deliver)
+        sender.push(data[offset:offset + length])
+        sender.push(bytes(0))
+        sender.start()
+        out_file.close()
+    return finished
+
+
+def test_striped_transfer(tmp_path: Path):
+    data = Random(1).randbytes(30000)
+    path = tmp_path / "out.bin"
+    assert striped_transfer(path, data, 3) == [False, False, True]
+    assert path.read_bytes() == data
+    assert not path.with_name("out.bin.checkpoint").exists()
+
+
+def test_striped_file_resumes_ranges(tmp_path: Path):
+    data = Random(1).randbytes(30000)
+    whole_id = file_id(io.BytesIO(data))
+    path = tmp_path / "out.bin"
+    interrupted = StripedFile(path, whole_id)
+    ranges = split_ranges(len(data), 2)
+    for offset, length in ranges:
+        interrupted.resume(offset, length)
+        interrupted.write(offset, data[offset:offset + 1000])
+        interrupted.checkpoint(offset)
+
+    resumed = StripedFile(path, whole_id)
+    for offset, length in ranges:
+        assert resumed.resume(offset, length) == 1000
+    results = []
+    for offset, length in ranges:
+        resumed.write(offset, data[offset + 1000:offset + length])
+        results.append(resumed.finish_range(offset))
+    assert results == [False, True]
+    assert path.read_bytes() == data
+
+
+def test_corrupt_striped_file_not_finished(tmp_path: Path):
+    data = Random(1).randbytes(300)
+    path = tmp_path / "out.bin"
+    striped = StripedFile(path, file_id(io.BytesIO(data)), interval=0)
+    striped.resume(0, 300)
+    striped.write(0, bytes(300))
+    assert not striped.finish_range(0)
+    assert path.with_name("out.bin.checkpoint").exists()
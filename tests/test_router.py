@@ -0,0 +1,96 @@
+from random import Random
+from router import Router, geometric
+import pytest
+
+
+class Clock:
+    """A clock that only moves when it's told to."""
+    now: float
+
+    def __init__(self) -> None:
+        self.now = 0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def run(router: Router, clock: Clock, packets: list[bytes]) -> list[bytes]:
+    """Transmits the packets on port 1 at the same time and returns what's delivered, in order."""
+    delivered: list[bytes] = []
+    router.register_rx(1, delivered.append)
+    for packet in packets:
+        router.tx(1, packet)
+    while (deadline := router.next_deadline()) is not None:
+        clock.now = deadline
+        router.deliver_due()
+    return delivered
+
+
+def test_geometric():
+    rng = Random(1)
+    assert geometric(rng, 0) == 0
+    draws = [geometric(rng, 0.75) for _ in range(10000)]
+    # p / (1 - p) successes on average
+    assert sum(draws) / len(draws) == pytest.approx(3, rel=0.1)
+    assert min(draws) == 0
+
+
+def test_corrupt_packet():
+    router = Router(seed=1)
+    packet = b"\x00" * 100
+    assert router.corrupt_packet(packet) is packet
+    router.bit_error_rate = 1
+    assert router.corrupt_packet(packet) == b"\xff" * 100
+    router.bit_error_rate = 0.01
+    flips = [len(router.error_bits(800)) for _ in range(1000)]
+    assert sum(flips) / len(flips) == pytest.approx(8, rel=0.1)
+    assert router.error_bits(0) == []
+
+
+def test_seeded_runs_repeat():
+    packets = [bytes([i]) * 50 for i in range(200)]
+
+    def impaired(seed: int) -> list[bytes]:
+        clock = Clock()
+        router = Router(seed=seed, clock=clock)
+        router.drop_chance = 0.2
+        router.corrupt_chance = 0.2
+        router.duplicate_chance = 0.1
+        router.reorder_chance = 0.2
+        router.reorder_delay = 0.002
+        return run(router, clock, packets)
+
+    first = impaired(1)
+    assert first == impaired(1)
+    assert first != impaired(2)
+    assert first != packets
+
+
+def test_duplicate_and_reorder():
+    clock = Clock()
+    router = Router(seed=1, clock=clock)
+    router.duplicate_chance = 1
+    assert run(router, clock, [b"a", b"b"]) == [b"a", b"a", b"b", b"b"]
+    clock = Clock()
+    router = Router(seed=1, clock=clock)
+    router.reorder_chance = 1
+    router.reorder_delay = 0.1
+    delivered = run(router, clock, [bytes([i]) for i in range(10)])
+    assert sorted(delivered) == [bytes([i]) for i in range(10)]
+    assert delivered != sorted(delivered)
+
+
+def test_delivered_when_due():
+    clock = Clock()
+    router = Router(seed=1, clock=clock)
+    router.min_delay = router.max_delay = 0.1
+    delivered: list[bytes] = []
+    router.register_rx(1, delivered.append)
+    router.tx(1, b"a")
+    clock.now = 0.05
+    router.tx(1, b"b")
+    assert router.next_deadline() == pytest.approx(0.1)
+    assert router.deliver_due() == 0
+    clock.now = 0.1
+    assert router.deliver_due() == 1
+    assert delivered == [b"a"]
@@ -0,0 +1,89 @@
+from random import Random
+from codec import decode_data_packet
+from congestion import FixedRateControl
+from metrics import Metrics
+from rdt import GoBackNReceiver, GoBackNSender, RTTEstimator
+from router import Router
+from segments import Buffer
+from sim import SimulatedNetwork
+import pytest
+
+
+def test_first_sample():
+    rtt = RTTEstimator()
+    assert rtt.rto == 1
+    rtt.sample(1.0)
+    assert rtt.srtt == 1.0
+    assert rtt.rttvar == 0.5
+    assert rtt.rto == 3.0
+
+
+def test_smoothed_samples():
+    rtt = RTTEstimator()
+    rtt.sample(1.0)
+    rtt.sample(2.0)
+    assert rtt.rttvar == pytest.approx(0.625)
+    assert rtt.srtt == pytest.approx(1.125)
+    assert rtt.rto == pytest.approx(3.625)
+
+
+def test_rto_bounds():
+    rtt = RTTEstimator(min_rto=0.2, max_rto=60)
+    rtt.sample(0.001)
+    assert rtt.rto == 0.2
+    rtt = RTTEstimator(min_rto=0.2, max_rto=60)
+    rtt.sample(100)
+    assert rtt.rto == 60
+
+
+def test_backoff():
+    rtt = RTTEstimator(initial_rto=1, max_rto=5)
+    rtt.backoff()
+    rtt.backoff()
+    assert rtt.rto == 4
+    assert rtt.backoffs == 2
+    rtt.backoff()
+    assert rtt.rto == 5
+    # A fresh sample ends the backoff
+    rtt.sample(0.5)
+    assert rtt.backoffs == 0
+    assert rtt.rto == 1.5
+
+
+def test_timeout_goes_back():
+    """The end of the data is lost, so no duplicate ACKs follow and it's resent once the retransmission timer expires."""
+    router = Router(1)
+    router.min_delay = router.max_delay = 0.05
+    network = SimulatedNetwork(router)
+    sender_client, receiver_client = network.connect(1)
+    send = sender_client.send
+    dropped: list[int] = []
+
+    def dropping_send(payload: Buffer):
+        res = decode_data_packet(payload)
+        if res is not None and res[1] == 11 and not dropped:
+            dropped.append(res[1])
+            return
+        send(payload)
+    sender_client.send = dropping_send  # type: ignore
+
+    metrics = Metrics()
+    sender = GoBackNSender(sender_client, 8, cc=FixedRateControl(10**6), mss=100, observer=metrics)
+    receiver = GoBackNReceiver(receiver_client)
+    data = Random(1).randbytes(1000)
+    received = bytearray()
+
+    def deliver(block: Buffer) -> bool:
+        received.extend(block)
+        return len(block) > 0
+
+    receiver_client.serve(receiver, deliver)
+    sender.push(data)
+    sender.push(bytes(0))
+    sender.start()
+    assert bytes(received) == data
+    assert metrics.counters["timeouts"] == 1
+    assert metrics.counters["retransmits"] == 1
+    # Karn's rule: the resent segment gives no sample
+    assert metrics.rtt.count == 10
+    assert sender.rtt.last_sample == pytest.approx(0.1)
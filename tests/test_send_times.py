@@ -0,0 +1,68 @@
+from random import Random
+from congestion import FixedRateControl
+from metrics import Metrics
+from rdt import GoBackNReceiver, GoBackNSender, SendTimes
+from router import Router
+from segments import Buffer
+from sim import SimulatedNetwork
+
+
+def test_samples_segments_sent_once():
+    times = SendTimes(4, 10)
+    assert not times.sent(10, 1.0)
+    assert not times.sent(11, 2.0)
+    assert times.highest_sent == 11
+    assert times.rtt(10, 1.5) == 0.5
+    assert times.rtt(11, 3.0) == 1.0
+
+
+def test_no_samples_up_to_retransmissions():
+    """Karn's rule: an ACK of a segment that was resent is ambiguous."""
+    times = SendTimes(4, 10)
+    for seq in range(10, 13):
+        times.sent(seq, 1.0)
+    # Going back resends from the base
+    assert times.sent(10, 2.0)
+    assert times.sent(11, 2.0)
+    assert times.rtt(10, 3.0) is None
+    assert times.rtt(11, 3.0) is None
+    # Never resent, so its first send time still holds
+    assert times.rtt(12, 3.0) == 2.0
+    assert not times.sent(13, 4.0)
+    assert times.rtt(13, 4.5) == 0.5
+
+
+def test_ring_reuses_slots():
+    times = SendTimes(3, 1)
+    for seq in range(1, 10):
+        times.sent(seq, float(seq))
+        assert times.rtt(seq, seq + 0.25) == 0.25
+
+
+def test_large_window_transfer():
+    """A window of thousands of segments, with losses, so timeouts and go-backs happen with the whole window in flight."""
+    router = Router(seed=1)
+    router.drop_chance = 0.001
+    router.min_delay = router.max_delay = 0.05
+    network = SimulatedNetwork(router)
+    sender_client, receiver_client = network.connect(1)
+    metrics = Metrics()
+    sender = GoBackNSender(sender_client, 2048, cc=FixedRateControl(10**9), mss=100, observer=metrics)
+    receiver = GoBackNReceiver(receiver_client)
+    received = bytearray()
+
+    def deliver(block: Buffer) -> bool:
+        received.extend(block)
+        return len(block) > 0
+
+    receiver_client.serve(receiver, deliver)
+    data = Random(1).randbytes(300000)
+    sender.push(data)
+    sender.push(bytes(0))
+    sender.start()
+    assert bytes(received) == data
+    assert metrics.counters["retransmits"] > 0
+    # Every byte is counted once, however many times the window went back
+    assert metrics.counters["bytes_acked"] == len(data)
+    assert metrics.counters["segments_acked"] == 3001
+    assert metrics.rtt.count > 0
@@ -0,0 +1,116 @@
+from random import Random
+from rdt import GoBackNReceiver, GoBackNSender, SelectiveRepeatReceiver, SelectiveRepeatSender, SeqSpace
+from congestion import FixedRateControl
+from router import Router
+from sim import SimulatedNetwork
+import pytest
+
+WRAP = 2**32
+
+
+def test_wrap():
+    space = SeqSpace()
+    assert space.wrap(WRAP - 1) == WRAP - 1
+    assert space.wrap(WRAP) == 0
+    assert space.wrap(WRAP + 5) == 5
+
+
+def test_diff_across_wrap():
+    space = SeqSpace()
+    assert space.diff(2, WRAP - 3) == 5
+    assert space.diff(WRAP - 3, 2) == -5
+    assert space.diff(0, WRAP - 1) == 1
+    assert space.diff(7, 7) == 0
+    # Half the space apart is as far back as a distance goes
+    assert space.diff(WRAP // 2, 0) == -WRAP // 2
+
+
+def test_unwrap_across_wrap():
+    space = SeqSpace()
+    # Just past the wrap, relative to a window base just before it
+    assert space.unwrap(2, WRAP - 3) == WRAP + 2
+    # Just before the wrap, relative to a window base past it
+    assert space.unwrap(WRAP - 1, WRAP + 1) == WRAP - 1
+    # Unbounded references a few wraps on
+    assert space.unwrap(3, 5 * WRAP - 2) == 5 * WRAP + 3
+    for seq in range(WRAP - 8, WRAP + 8):
+        assert space.unwrap(space.wrap(seq), WRAP) == seq
+
+
+def test_unwrap_small_space():
+    space = SeqSpace(4)
+    assert space.max_window() == 7
+    for ref in range(0, 40):
+        for seq in range(ref - 7, ref + 8):
+            assert space.unwrap(space.wrap(seq), ref) == seq
+
+
+@pytest.mark.parametrize("protocol", ["gbn", "sr"])
+def test_transfer_across_wrap(protocol: str):
+    """Sends segments numbered from just before 2**32 through a lossy simulated network."""
+    first_seq = WRAP - 5
+    mss = 16
+    data = Random(1).randbytes(40 * mss)
+    router = Router(1)
+    router.drop_chance = 0.1
+    router.min_delay = 0.01
+    router.max_delay = 0.02
+    network = SimulatedNetwork(router)
+    sender_client, receiver_client = network.connect(1)
+    if protocol == "sr":
+        sender = SelectiveRepeatSender(sender_client, 8, cc=FixedRateControl(10**6), mss=mss, first_seq=first_seq)
+        receiver = SelectiveRepeatReceiver(receiver_client, 8, first_seq=first_seq)
+    else:
+        sender = GoBackNSender(sender_client, 8, cc=FixedRateControl(10**6), mss=mss, first_seq=first_seq)
+        receiver = GoBackNReceiver(receiver_client, first_seq=first_seq)
+
+    received = bytearray()
+
+    def deliver(block: bytes) -> bool:
+        if len(block) == 0:
+            return False
+        received.extend(block)
+        return True
+
+    receiver_client.serve(receiver, deliver)
+    sender.push(data)
+    sender.push(bytes(0))
+    sender.start()
+    assert bytes(received) == data
+    # 40 segments and the end of the data, all past the wrap but the first 5
+    assert sender.curr_seq == first_seq + 41
+    assert receiver.curr_seq == first_seq + 41
+
+
+@pytest.mark.parametrize("protocol", ["gbn", "sr"])
+def test_transfer_small_space(protocol: str):
+    """A 4 bit sequence space wraps around many times over a lossy network."""
+    data = Random(2).randbytes(100 * 8)
+    router = Router(2)
+    router.drop_chance = 0.1
+    router.min_delay = 0.01
+    router.max_delay = 0.02
+    network = SimulatedNetwork(router)
+    sender_client, receiver_client = network.connect(1)
+    if protocol == "sr":
+        # Selective Repeat needs the windows of both ends to fit in half the space
+        sender = SelectiveRepeatSender(sender_client, 4, cc=FixedRateControl(10**6), mss=8, seq_bits=4)
+        receiver = SelectiveRepeatReceiver(receiver_client, 4, seq_bits=4)
+    else:
+        sender = GoBackNSender(sender_client, 7, cc=FixedRateControl(10**6), mss=8, seq_bits=4)
+        receiver = GoBackNReceiver(receiver_client, seq_bits=4)
+
+    received = bytearray()
+
+    def deliver(block: bytes) -> bool:
+        if len(block) == 0:
+            return False
+        received.extend(block)
+        return True
+
+    receiver_client.serve(receiver, deliver)
+    sender.push(data)
+    sender.push(bytes(0))
+    sender.start()
+    assert bytes(received) == data
+    assert sender.curr_seq == 102
@@ -0,0 +1,74 @@
+from random import Random
+from congestion import RenoControl
+from metrics import Metrics
+from rdt import GoBackNReceiver, GoBackNSender
+from router import Router
+from segments import Buffer
+from sim import SimulatedNetwork
+import time
+
+
+def lossy_transfer(seed: int) -> tuple[float, dict[str, int]]:
+    """Sends 50 kB over a lossy, slow network and returns how long it took in virtual time, and the sender's counters."""
+    router = Router(seed=seed)
+    router.drop_chance = 0.1
+    router.min_delay = 0.5
+    router.max_delay = 1
+    network = SimulatedNetwork(router)
+    sender_client, receiver_client = network.connect(10)
+    metrics = Metrics()
+    sender = GoBackNSender(sender_client, 16, cc=RenoControl(), mss=500, observer=metrics)
+    receiver = GoBackNReceiver(receiver_client)
+    received = bytearray()
+
+    def deliver(block: Buffer) -> bool:
+        received.extend(block)
+        return len(block) > 0
+
+    receiver_client.serve(receiver, deliver)
+    data = Random(seed).randbytes(50000)
+    sender.push(data)
+    sender.push(bytes(0))
+    sender.start()
+    assert bytes(received) == data
+    return network.time(), dict(metrics.counters)
+
+
+def test_runs_repeat():
+    started = time.perf_counter()
+    first = lossy_transfer(1)
+    # Minutes of virtual time pass in a fraction of a second
+    assert first[0] > 60
+    assert time.perf_counter() - started < first[0] / 10
+    assert first[1]["retransmits"] > 0
+    assert lossy_transfer(1) == first
+    assert lossy_transfer(2) != first
+
+
+def test_timers():
+    network = SimulatedNetwork(seed=1)
+    ran: list[tuple[str, float]] = []
+    for name, when in [("b", 2), ("a", 1), ("c", 2)]:
+        network.call_at(when, lambda name=name: ran.append((name, network.time())))
+    assert not network.run_until(1.5)
+    assert ran == [("a", 1)]
+    assert network.time() == 1.5
+    # Timers due at the same time run in the order they were set
+    assert network.run_until(10, lambda: len(ran) == 3)
+    assert ran == [("a", 1), ("b", 2), ("c", 2)]
+    assert network.time() == 2
+    # With nothing left to happen, waiting forever ends right away
+    assert not network.run_until(float("inf"))
+    assert network.time() == 2
+
+
+def test_recv():
+    network = SimulatedNetwork(seed=1)
+    network.router.min_delay = network.router.max_delay = 0.25
+    a, b = network.connect(1)
+    assert b.recv() is None
+    assert network.time() == 1
+    a.send(b"hello")
+    assert b.recv(0.1) is None
+    assert bytes(b.recv()) == b"hello"  # type: ignore
+    assert network.time() == 1.25
@@ -0,0 +1,78 @@
+from pathlib import Path
+from random import Random
+from resume import ResumableFile, file_id
+from sink import BufferedSink, MappedSink, WritePolicy, preallocate
+import io
+import os
+import pytest
+
+
+@pytest.fixture
+def fd(tmp_path: Path):
+    fd = os.open(tmp_path / "out.bin", os.O_RDWR | os.O_CREAT, 0o644)
+    yield fd
+    os.close(fd)
+
+
+def test_buffered_writes_aligned(fd: int, monkeypatch: pytest.MonkeyPatch):
+    writes: list[tuple[int, int]] = []
+    pwrite = os.pwrite
+
+    def recording_pwrite(fd: int, data: memoryview, offset: int) -> int:
+        writes.append((offset, len(data)))
+        return pwrite(fd, data, offset)
+
+    # A resumed sink starts partway into a block, so its first write only fills up the block
+    os.pwrite(fd, b"01234", 0)
+    monkeypatch.setattr(os, "pwrite", recording_pwrite)
+    sink = BufferedSink(fd, 5, buffer_size=8)
+    for block in [b"ab", b"cdefghijklmnop", b"q", b"rstu"]:
+        sink.write(block)
+    assert writes == [(5, 3), (8, 8), (16, 8)]
+    assert sink.position == 26 and sink.flushed == 24
+    sink.close()
+    assert writes[-1] == (24, 2)
+    assert os.pread(fd, 100, 0) == b"01234abcdefghijklmnopqrstu"
+
+
+def test_mapped(fd: int):
+    policy = WritePolicy(use_mmap=True)
+    mapping = policy.map(fd, 10)
+    assert mapping is not None
+    sink = policy.sink(fd, 2, mapping)
+    assert isinstance(sink, MappedSink)
+    sink.write(b"abc")
+    assert sink.flushed == 5
+    with pytest.raises(ValueError):
+        sink.write(b"too much")
+    sink.sync()
+    policy.sync(fd, mapping)
+    mapping.close()
+    assert os.pread(fd, 100, 0) == b"\0\0abc" + bytes(5)
+
+
+def test_policy(fd: int):
+    policy = WritePolicy()
+    # Files of unknown size aren't preallocated or mapped
+    assert policy.map(fd, None) is None
+    assert os.fstat(fd).st_size == 0
+    assert policy.map(fd, 1000) is None
+    assert os.fstat(fd).st_size == 1000
+    assert isinstance(policy.sink(fd, 0), BufferedSink)
+    # Preallocating never shrinks a file
+    preallocate(fd, 10)
+    assert os.fstat(fd).st_size == 1000
+    with pytest.raises(AssertionError):
+        WritePolicy(fsync="sometimes")
+
+
+@pytest.mark.parametrize("policy", [WritePolicy(buffer_size=1000), WritePolicy(use_mmap=True), WritePolicy(fsync="always", buffer_size=1000)])
+def test_file_written_through_policy(tmp_path: Path, policy: WritePolicy):
+    data = Random(1).randbytes(10000)
+    path = tmp_path / "out.bin"
+    out_file = ResumableFile(lambda _: path, policy=policy)
+    out_file.resume(file_id(io.BytesIO(data)))
+    for i in range(0, len(data), 333):
+        out_file.write(data[i:i + 333])
+    assert out_file.finish()
+    assert path.read_bytes() == data
@@ -0,0 +1,56 @@
+from socket import socket, AF_INET, SOCK_DGRAM as SOCK_UDP
+from threading import Thread
+from router import Router
+from tunnel import UnstableTunnel
+from UDPDuplex import UDPDuplex
+import time
+
+HOST = "127.0.0.1"
+
+
+def bound_socket() -> socket:
+    sock = socket(AF_INET, SOCK_UDP)
+    sock.bind((HOST, 0))
+    sock.settimeout(2)
+    return sock
+
+
+def free_port() -> int:
+    with bound_socket() as sock:
+        return sock.getsockname()[1]
+
+
+def wait_bound(port: int):
+    """Waits for something else to bind the port."""
+    for _ in range(200):
+        try:
+            with socket(AF_INET, SOCK_UDP) as sock:
+                sock.bind((HOST, port))
+        except OSError:
+            return
+        time.sleep(0.01)
+    assert False, f"Nothing bound port {port}"
+
+
+def test_forwards_both_ways():
+    router = Router(seed=1)
+    router.min_delay = router.max_delay = 0.01
+    tunnel = UnstableTunnel(router, idle_timeout=0.05)
+    with bound_socket() as a, bound_socket() as b:
+        a_port, b_port = free_port(), free_port()
+        thread = Thread(target=tunnel.start, args=(UDPDuplex(HOST, a_port, HOST, a.getsockname()[1]),
+                                                   UDPDuplex(HOST, b_port, HOST, b.getsockname()[1])))
+        thread.start()
+        try:
+            wait_bound(a_port)
+            wait_bound(b_port)
+            # Packets sent to one side of the tunnel come out of the other
+            for i in range(10):
+                a.sendto(bytes([i]), (HOST, a_port))
+            assert sorted(b.recv(16) for _ in range(10)) == [bytes([i]) for i in range(10)]
+            b.sendto(b"reply", (HOST, b_port))
+            assert a.recv(16) == b"reply"
+        finally:
+            tunnel.stop()
+            thread.join()
+    assert not thread.is_alive()